@@ -0,0 +1,296 @@
+"""Read-only JSON API, mounted at /api/v1.
+
+Routes select only the columns they return (never whole ORM objects)
+and hand the row tuples straight to orjson (when it is installed), with
+the column names sent once rather than repeated as keys on every row:
+
+    {"columns": ["id", "text", ...], "rows": [[1, "hi", ...], ...]}
+
+Lists are cursor-paginated like the HTML pages (`?after=`/`?before=`,
+`?per_page=`) and come back as
+
+    {"data": <rows>, "next": <cursor or null>, "prev": <cursor or null>}
+
+Single users and messages are plain objects under "data". Message lists
+side-load their authors' rows under "users" rather than repeating them on
+every message. `/users?ids=1,2,3` and `/messages?ids=...` fetch
+up to MAX_PAGE_SIZE rows by id in one call.
+
+Requests use the same login session as the site; anonymous requests get
+a 401.
+"""
+
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, current_app, g, request
+from werkzeug.exceptions import HTTPException
+
+from models import db, User, Message, Follows, LikedMessage
+import pagination
+import timeline
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+USER_COLUMNS = [
+    User.id,
+    User.username,
+    User.image_url,
+    User.header_image_url,
+    User.bio,
+    User.location,
+    User.messages_count,
+    User.following_count,
+    User.followers_count,
+    User.likes_count,
+]
+
+AUTHOR_COLUMNS = [User.id, User.username, User.image_url]
+
+MESSAGE_COLUMNS = [Message.id, Message.text, Message.timestamp,
+                   Message.user_id]
+
+
+def fields(columns):
+    return [column.key for column in columns]
+
+
+def rows_of(rows, columns):
+    """Rows of `columns`, as the column names and a list of tuples."""
+
+    # orjson encodes plain tuples natively, but not SQLAlchemy's rows
+    return {'columns': fields(columns), 'rows': [tuple(row) for row in rows]}
+
+
+def record(row, columns):
+    """One row of `columns` as a JSON object."""
+
+    return dict(zip(fields(columns), row))
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(value)
+
+
+def json_response(payload, status=200):
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, separators=(',', ':'), default=_default)
+
+    return Response(body, status=status, mimetype='application/json')
+
+
+def page_response(page, columns, **extra):
+    return json_response({
+        'data': rows_of(page, columns),
+        'next': page.next_cursor,
+        'prev': page.prev_cursor,
+        **extra,
+    })
+
+
+def authors_of(messages):
+    """The side-loaded authors of `messages` (one query)."""
+
+    author_ids = {msg.user_id for msg in messages}
+    if not author_ids:
+        return rows_of([], AUTHOR_COLUMNS)
+
+    authors = (db.session
+               .query(*AUTHOR_COLUMNS)
+               .filter(User.id.in_(author_ids))
+               .order_by(User.id))
+
+    return rows_of(authors, AUTHOR_COLUMNS)
+
+
+def messages_response(page):
+    """A page of messages, with their authors side-loaded."""
+
+    return page_response(page, MESSAGE_COLUMNS, users=authors_of(page))
+
+
+def ids_arg():
+    """The ids listed in `?ids=1,2,3` (400 if malformed or too many)."""
+
+    try:
+        ids = [int(part) for part in request.args.get('ids', '').split(',')
+               if part.strip()]
+    except ValueError:
+        abort(400)
+
+    if not ids or len(ids) > current_app.config['MAX_PAGE_SIZE']:
+        abort(400)
+
+    return ids
+
+
+def user_exists(user_id):
+    exists = (db.session
+              .query(User.id)
+              .filter(User.id == user_id, User.deleted_at.is_(None))
+              .first())
+
+    if exists is None:
+        abort(404)
+
+
+@api.before_request
+def require_login():
+    if not g.user:
+        abort(401)
+
+
+@api.errorhandler(HTTPException)
+def http_error(error):
+    return json_response({'error': error.name}, status=error.code)
+
+
+##############################################################################
+# Users
+
+@api.route('/users')
+def users_batch():
+    """Users by id, in the order asked for (missing ids are left out)."""
+
+    ids = ids_arg()
+    by_id = {row.id: row for row in
+             db.session
+               .query(*USER_COLUMNS)
+               .filter(User.id.in_(ids), User.deleted_at.is_(None))}
+
+    return json_response({
+        'data': rows_of([by_id[i] for i in ids if i in by_id], USER_COLUMNS),
+    })
+
+
+@api.route('/users/<int:user_id>')
+def user_profile(user_id):
+    row = (db.session
+           .query(*USER_COLUMNS)
+           .filter(User.id == user_id, User.deleted_at.is_(None))
+           .first())
+
+    if row is None:
+        abort(404)
+
+    return json_response({'data': record(row, USER_COLUMNS)})
+
+
+@api.route('/users/<int:user_id>/messages')
+def user_messages(user_id):
+    user_exists(user_id)
+
+    messages = pagination.paginate(
+        db.session
+          .query(*MESSAGE_COLUMNS)
+          .filter(Message.user_id == user_id),
+        [Message.timestamp, Message.id],
+        key=timeline.message_key)
+
+    return messages_response(messages)
+
+
+@api.route('/users/<int:user_id>/likes')
+def user_likes(user_id):
+    user_exists(user_id)
+
+    messages = pagination.paginate(
+        db.session
+          .query(*MESSAGE_COLUMNS)
+          .join(LikedMessage, LikedMessage.message_id_liked == Message.id)
+          .join(User, User.id == Message.user_id)
+          .filter(LikedMessage.user_id_like == user_id,
+                  User.deleted_at.is_(None)),
+        [LikedMessage.message_id_liked],
+        key=lambda msg: (msg.id,))
+
+    return messages_response(messages)
+
+
+@api.route('/users/<int:user_id>/following')
+def user_following(user_id):
+    user_exists(user_id)
+
+    following = pagination.paginate(
+        db.session
+          .query(*USER_COLUMNS)
+          .join(Follows, Follows.user_being_followed_id == User.id)
+          .filter(Follows.user_following_id == user_id,
+                  User.deleted_at.is_(None)),
+        [Follows.user_being_followed_id],
+        key=lambda user: (user.id,),
+        descending=False)
+
+    return page_response(following, USER_COLUMNS)
+
+
+@api.route('/users/<int:user_id>/followers')
+def user_followers(user_id):
+    user_exists(user_id)
+
+    followers = pagination.paginate(
+        db.session
+          .query(*USER_COLUMNS)
+          .join(Follows, Follows.user_following_id == User.id)
+          .filter(Follows.user_being_followed_id == user_id,
+                  User.deleted_at.is_(None)),
+        [Follows.user_following_id],
+        key=lambda user: (user.id,),
+        descending=False)
+
+    return page_response(followers, USER_COLUMNS)
+
+
+##############################################################################
+# Messages
+
+@api.route('/timeline')
+def home_timeline():
+    """The logged-in user's home timeline."""
+
+    return messages_response(timeline.home_page(g.user.id, MESSAGE_COLUMNS))
+
+
+@api.route('/messages')
+def messages_batch():
+    """Messages by id, in the order asked for (missing ids are left out)."""
+
+    ids = ids_arg()
+    by_id = {row.id: row for row in
+             db.session
+               .query(*MESSAGE_COLUMNS)
+               .join(User, User.id == Message.user_id)
+               .filter(Message.id.in_(ids), User.deleted_at.is_(None))}
+
+    messages = [by_id[i] for i in ids if i in by_id]
+
+    return json_response({
+        'data': rows_of(messages, MESSAGE_COLUMNS),
+        'users': authors_of(messages),
+    })
+
+
+@api.route('/messages/<int:message_id>')
+def message_detail(message_id):
+    row = (db.session
+           .query(*MESSAGE_COLUMNS)
+           .join(User, User.id == Message.user_id)
+           .filter(Message.id == message_id, User.deleted_at.is_(None))
+           .first())
+
+    if row is None:
+        abort(404)
+
+    return json_response({
+        'data': record(row, MESSAGE_COLUMNS),
+        'users': authors_of([row]),
+    })
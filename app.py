@@ -1,11 +1,37 @@
 import os
-
-from flask import Flask, render_template, request, flash, redirect, session, g
+from datetime import datetime
+
+import click
+from flask import (Flask, render_template, request, flash, redirect, session,
+                   g, jsonify, abort, Response, stream_with_context,
+                   get_flashed_messages, before_render_template,
+                   template_rendered)
+from flask_wtf.csrf import generate_csrf
 from flask_debugtoolbar import DebugToolbarExtension
+from flask_migrate import Migrate
 from sqlalchemy.exc import IntegrityError
 
-from forms import UserAddForm, LoginForm, MessageForm, EditUserForm, TokenForm
-from models import db, connect_db, User, Message, LikedMessage
+from forms import (UserAddForm, LoginForm, MessageForm, EditUserForm,
+                   TokenForm, FollowListForm)
+from models import db, connect_db, User, Message, Follows, LikedMessage
+from pagination import Page, paginate, page_url, stream
+from passwords import hasher
+from cache import cached, response_cache
+from conditional import conditional_get
+from fragments import fragment_cache
+from api import api
+from metrics import metrics
+from sqlstats import query_budget, sql_stats
+import cache
+import conditional
+import counters
+import follows
+import identity
+import indexes
+import likes
+import purge
+import search
+import timeline
 
 CURR_USER_KEY = "curr_user"  # value: user.id
 
@@ -16,15 +42,130 @@ app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = (
     os.environ.get('DATABASE_URL', 'postgres:///warbler'))
 
+# Read replicas (comma separated DATABASE_REPLICA_URLS): GET requests read
+# from one, unless the user POSTed in the last REPLICA_STICKY_SECONDS
+# (see replicas.py)
+app.config['SQLALCHEMY_BINDS'] = {
+    f'replica{i}': url for i, url in enumerate(
+        filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')))
+}
+app.config['SQLALCHEMY_REPLICAS'] = list(app.config['SQLALCHEMY_BINDS'])
+app.config['REPLICA_STICKY_SECONDS'] = int(
+    os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+# Connection pool of each database, per worker process. Only the DB_POOL_*
+# settings that are set are passed on, so SQLite (whose pool has no size)
+# keeps working
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    option: parse(os.environ[name]) for name, option, parse in [
+        ('DB_POOL_SIZE', 'pool_size', int),
+        ('DB_MAX_OVERFLOW', 'max_overflow', int),
+        ('DB_POOL_PRE_PING', 'pool_pre_ping',
+         lambda value: value.lower() == 'true'),
+        # Seconds before a connection is replaced
+        ('DB_POOL_RECYCLE', 'pool_recycle', int),
+    ] if name in os.environ
+}
+
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ECHO'] = False
 app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
 
+# Users with this many followers are fanned out on read instead of write
+app.config['TIMELINE_FANOUT_LIMIT'] = int(
+    os.environ.get('TIMELINE_FANOUT_LIMIT', 10000))
+# How many of newly followed users' messages to copy into a timeline, in
+# all however many users are followed at once (seed.py's rebuild copies
+# this many per author). After a bulk follow, older pages of the home
+# timeline stop at this window: the followed users' older messages are
+# never copied in.
+app.config['TIMELINE_BACKFILL_LIMIT'] = int(
+    os.environ.get('TIMELINE_BACKFILL_LIMIT', 800))
+
+# Keep a snapshot of the logged-in user in the session, so pages that only
+# need their id/username/images don't load the row (see identity.py)
+app.config['USER_SNAPSHOT_IN_SESSION'] = (
+    os.environ.get('USER_SNAPSHOT_IN_SESSION', 'true').lower() == 'true')
+
+# Rows per page on list pages; ?per_page= may ask for up to MAX_PAGE_SIZE
+app.config['PAGE_SIZE'] = int(os.environ.get('PAGE_SIZE', 20))
+app.config['MAX_PAGE_SIZE'] = int(os.environ.get('MAX_PAGE_SIZE', 100))
+
+# bcrypt cost; existing hashes are upgraded when their owner next logs in
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+# Workers hashing passwords per web worker: 'thread's or 'process'es
+app.config['BCRYPT_POOL_SIZE'] = int(os.environ.get('BCRYPT_POOL_SIZE', 2))
+app.config['BCRYPT_POOL_KIND'] = os.environ.get('BCRYPT_POOL_KIND', 'thread')
+
+# Cache rendered pages (see cache.py). Several workers need a shared
+# RESPONSE_CACHE_STORE, e.g. sqlite:////tmp/warbler.db; gunicorn.conf.py
+# sets one when gunicorn runs more than one worker
+app.config['RESPONSE_CACHE'] = (
+    os.environ.get('RESPONSE_CACHE', 'true').lower() == 'true')
+app.config['RESPONSE_CACHE_SIZE'] = int(
+    os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+app.config['RESPONSE_CACHE_TTL'] = int(
+    os.environ.get('RESPONSE_CACHE_TTL', 300))
+app.config['RESPONSE_CACHE_STORE'] = os.environ.get('RESPONSE_CACHE_STORE', '')
+
+# Render the long list pages (users, followers, following, likes) while
+# their rows are still being read, for pages of up to STREAM_MAX_PAGE_SIZE
+app.config['STREAM_LIST_PAGES'] = (
+    os.environ.get('STREAM_LIST_PAGES', 'true').lower() == 'true')
+app.config['STREAM_MAX_PAGE_SIZE'] = int(
+    os.environ.get('STREAM_MAX_PAGE_SIZE', 5000))
+
+# Commit likes arriving within LIKE_GROUP_COMMIT_MS of each other in one
+# transaction (see likes.py)
+app.config['LIKE_GROUP_COMMIT'] = (
+    os.environ.get('LIKE_GROUP_COMMIT', 'false').lower() == 'true')
+app.config['LIKE_GROUP_COMMIT_MS'] = int(
+    os.environ.get('LIKE_GROUP_COMMIT_MS', 5))
+app.config['LIKE_GROUP_COMMIT_MAX'] = int(
+    os.environ.get('LIKE_GROUP_COMMIT_MAX', 100))
+
+# Most users one request to /users/follow or /users/stop-following may list
+app.config['BULK_FOLLOW_MAX'] = int(os.environ.get('BULK_FOLLOW_MAX', 5000))
+
+# Rendered message/user cards kept per worker (see fragments.py)
+app.config['FRAGMENT_CACHE_SIZE'] = int(
+    os.environ.get('FRAGMENT_CACHE_SIZE', 10000))
+
+# Deleted accounts are purged this many rows per transaction, on a
+# background thread unless ACCOUNT_PURGE_IN_BACKGROUND is off (see purge.py)
+app.config['ACCOUNT_PURGE_BATCH'] = int(
+    os.environ.get('ACCOUNT_PURGE_BATCH', 1000))
+app.config['ACCOUNT_PURGE_IN_BACKGROUND'] = (
+    os.environ.get('ACCOUNT_PURGE_IN_BACKGROUND', 'true').lower() == 'true')
+
+# Count and time each request's SQL, for the Server-Timing header and the
+# warbler.sql log (see sqlstats.py). SQL_STRICT makes a request fail once it
+# runs more than SQL_QUERY_BUDGET statements or one of them more than
+# SQL_REPEAT_LIMIT times
+app.config['SQL_STATS'] = (
+    os.environ.get('SQL_STATS', 'true').lower() == 'true')
+app.config['SQL_STRICT'] = (
+    os.environ.get('SQL_STRICT', 'false').lower() == 'true')
+app.config['SQL_QUERY_BUDGET'] = int(os.environ.get('SQL_QUERY_BUDGET', 30))
+app.config['SQL_REPEAT_LIMIT'] = int(os.environ.get('SQL_REPEAT_LIMIT', 5))
+
+# Serve Prometheus metrics at /metrics (see metrics.py)
+app.config['METRICS'] = os.environ.get('METRICS', 'true').lower() == 'true'
+
 # "it's a secret" - set for development
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
 toolbar = DebugToolbarExtension(app)
 
+app.add_template_global(page_url)
+app.register_blueprint(api)
+
+hasher.init_app(app)
+response_cache.init_app(app)
+fragment_cache.init_app(app)
+sql_stats.init_app(app)
 connect_db(app)
+migrate = Migrate(app, db)
+metrics.init_app(app, db)
 
 
 ##############################################################################
@@ -33,16 +174,18 @@ connect_db(app)
 
 @app.before_request
 def add_user_to_g():
-    # import pdb; pdb.set_trace()
+    """If we're logged in, add curr user to Flask global.
 
-    print('session', session)
-    """If we're logged in, add curr user to Flask global."""
-    # global data within a part context
-    # g is global dictionary that stores user instance info: {user: user_instance}
+    This is usually a lightweight stand-in built from the session, which
+    only loads the user's row if the request needs more than the basics.
+    """
 
-    # below will run before every single request
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        g.user = identity.current_user(session[CURR_USER_KEY])
+
+        # The account was deleted since this session logged in
+        if g.user is None:
+            do_logout()
 
     else:
         g.user = None
@@ -52,6 +195,7 @@ def do_login(user):
     """Log in user."""
 
     session[CURR_USER_KEY] = user.id
+    identity.remember(user)
 
 
 def do_logout():
@@ -60,6 +204,8 @@ def do_logout():
     if CURR_USER_KEY in session:
         del session[CURR_USER_KEY]
 
+    identity.forget()
+
 
 @app.route('/signup', methods=["GET", "POST"])
 def signup():
@@ -76,6 +222,11 @@ def signup():
     form = UserAddForm()
 
     if form.validate_on_submit():
+        # Cheap indexed check first, so a taken name costs no bcrypt hash
+        if not User.is_available(form.username.data, form.email.data):
+            flash("Username already taken", 'danger')
+            return render_template('users/signup.html', form=form)
+
         try:
             user = User.signup(
                 username=form.username.data,
@@ -109,6 +260,7 @@ def login():
                                  form.password.data)
 
         if user:
+            db.session.commit()  # in case the password hash was upgraded
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -133,25 +285,115 @@ def logout():
 # General user routes:
 
 @app.route('/users')
+@query_budget(repeats=None)
 def list_users():
     """Page with listing of users.
 
     Can take a 'q' param in querystring to search by that username.
     """
 
-    search = request.args.get('q')
+    term = request.args.get('q')
+    followed_ids, note_followed = collect(followed_ids_for)
 
-    if not search:
-        users = User.query.all()
+    if not term:
+        users = list_page(User.active(), [User.id],
+                          key=lambda user: (user.id,), descending=False,
+                          on_batch=note_followed)
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
-    
+        users = search.search_users(term)
+        note_followed(users)
+
     form=TokenForm()
-    
-    return render_template('users/index.html', users=users, form=form)
+
+    return render_list('users/index.html', users=users,
+                       followed_ids=followed_ids, form=form)
+
+
+@app.route('/users/autocomplete')
+def users_autocomplete():
+    """JSON list of the best username matches for the 'q' param."""
+
+    term = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 20))
+
+    if not term:
+        return jsonify(users=[])
+
+    users = [dict(id=user_id, username=username, image_url=image_url)
+             for user_id, username, image_url
+             in search.autocomplete(term, limit)]
+
+    return jsonify(users=users)
+
+
+def list_page(query, columns, key, descending=True, on_batch=None):
+    """The page of a long list route the request asks for.
+
+    Streamed (see pagination.stream) when STREAM_LIST_PAGES is on;
+    `on_batch` is called with each batch of rows before it is rendered.
+    """
+
+    if app.config['STREAM_LIST_PAGES']:
+        return stream(query, columns, key, descending,
+                      max_size=app.config['STREAM_MAX_PAGE_SIZE'],
+                      on_batch=on_batch)
+
+    page = paginate(query, columns, key, descending)
+    if on_batch and page.items:
+        on_batch(page.items)
+
+    return page
+
+
+def render_list(template_name, **context):
+    """Render a list page, streaming it if STREAM_LIST_PAGES is on.
+
+    The session cookie goes out before the body, so anything the template
+    would store in the session (the CSRF token, consumed flash messages)
+    is done up front.
+    """
+
+    if not app.config['STREAM_LIST_PAGES']:
+        return render_template(template_name, **context)
+
+    generate_csrf()
+    get_flashed_messages()
+
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    chunks = template.stream(context)
+    chunks.enable_buffering(20)
+
+    # Signal around the whole stream, as render_template does around a
+    # render, so listeners (template timing in metrics.py) see it too
+    before_render_template.send(app, template=template, context=context)
+
+    def generate():
+        yield from chunks
+        template_rendered.send(app, template=template, context=context)
+
+    return Response(stream_with_context(generate()), mimetype='text/html')
+
+
+def collect(lookup):
+    """A set, and a callback adding `lookup(rows)` to it for each batch."""
+
+    found = set()
+    return found, lambda rows: found.update(lookup(rows))
+
+
+def followed_ids_for(users):
+    """Ids of the listed `users` that the current user follows."""
+
+    if not g.user:
+        return set()
+
+    return g.user.followed_ids([user.id for user in users])
 
 
 @app.route('/users/<int:user_id>')
+@conditional_get(conditional.user_page)
+@cached()
 def users_show(user_id):
     """Show user profile."""
 
@@ -159,13 +401,21 @@ def users_show(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
     
-    user = User.query.get_or_404(user_id)
+    user = User.active().filter_by(id=user_id).first_or_404()
     form = TokenForm()
+    cache.tag(f'user:{user.id}', f'follows:{user.id}', f'likes:{user.id}',
+              f'messages:{user.id}')
+
+    messages = paginate(Message.query.filter_by(user_id=user.id),
+                        [Message.timestamp, Message.id],
+                        key=lambda msg: (msg.timestamp, msg.id))
 
-    return render_template('users/show.html', user=user, form=form)
+    return render_template('users/show.html', user=user, messages=messages,
+                           form=form)
 
 
 @app.route('/users/<int:user_id>/following')
+@query_budget(repeats=None)
 def show_following(user_id):
     """Show list of people this user is following."""
 
@@ -174,11 +424,26 @@ def show_following(user_id):
         return redirect("/")
     
     form = TokenForm()
-    user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user, form=form)
+    user = User.active().filter_by(id=user_id).first_or_404()
+    followed_ids, note_followed = collect(followed_ids_for)
+
+    following = list_page(
+        User.query
+            .join(Follows, Follows.user_being_followed_id == User.id)
+            .filter(Follows.user_following_id == user.id,
+                    User.deleted_at.is_(None)),
+        [Follows.user_being_followed_id],
+        key=lambda followed: (followed.id,),
+        descending=False,
+        on_batch=note_followed)
+
+    return render_list('users/following.html', user=user,
+                       users=following, followed_ids=followed_ids,
+                       form=form)
 
 
 @app.route('/users/<int:user_id>/followers')
+@query_budget(repeats=None)
 def users_followers(user_id):
     """Show list of followers of this user."""
 
@@ -187,11 +452,26 @@ def users_followers(user_id):
         return redirect("/")
 
     form = TokenForm()
-    user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user, form=form)
+    user = User.active().filter_by(id=user_id).first_or_404()
+    followed_ids, note_followed = collect(followed_ids_for)
+
+    followers = list_page(
+        User.query
+            .join(Follows, Follows.user_following_id == User.id)
+            .filter(Follows.user_being_followed_id == user.id,
+                    User.deleted_at.is_(None)),
+        [Follows.user_following_id],
+        key=lambda follower: (follower.id,),
+        descending=False,
+        on_batch=note_followed)
+
+    return render_list('users/followers.html', user=user,
+                       users=followers, followed_ids=followed_ids,
+                       form=form)
 
 
 @app.route("/users/<int:user_id>/likes")
+@query_budget(repeats=None)
 def user_likes(user_id):
     """Show user's liked messages."""
 
@@ -201,10 +481,23 @@ def user_likes(user_id):
 
     form = TokenForm()
     
-    user = User.query.get_or_404(user_id)
-    messages = user.message_likes
+    user = User.active().filter_by(id=user_id).first_or_404()
+    liked_ids, note_liked = collect(
+        lambda messages: g.user.liked_message_ids(
+            [msg.id for msg in messages]))
 
-    return render_template('users/likes.html', messages=messages, form=form)
+    messages = list_page(
+        Message.query
+            .join(LikedMessage, LikedMessage.message_id_liked == Message.id)
+            .join(User, User.id == Message.user_id)
+            .filter(LikedMessage.user_id_like == user.id,
+                    User.deleted_at.is_(None)),
+        [LikedMessage.message_id_liked],
+        key=lambda msg: (msg.id,),
+        on_batch=note_liked)
+
+    return render_list('users/likes.html', messages=messages,
+                       liked_ids=liked_ids, form=form)
 
 
 
@@ -216,9 +509,13 @@ def add_follow(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
+    followed = follows.follow(g.user.id, follow_id)
+
+    if not followed and not user_exists(follow_id):
+        abort(404)
+
     db.session.commit()
+    cache.invalidate(*follows.cache_tags(g.user.id, followed))
 
     return redirect(f"/users/{g.user.id}/following")
 
@@ -231,13 +528,64 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
+    unfollowed = follows.unfollow(g.user.id, follow_id)
     db.session.commit()
+    cache.invalidate(*follows.cache_tags(g.user.id, unfollowed))
+
+    return redirect(f"/users/{g.user.id}/following")
+
+
+@app.route('/users/follow', methods=['POST'])
+def add_follows():
+    """Follow a list of users (ids separated by commas or whitespace).
+
+    For importing a follow list; up to BULK_FOLLOW_MAX users at a time.
+    """
+
+    return change_follows(follows.follow, "Followed")
+
+
+@app.route('/users/stop-following', methods=['POST'])
+def stop_following_many():
+    """Stop following a list of users."""
+
+    return change_follows(follows.unfollow, "Stopped following")
+
+
+def change_follows(change, done):
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    form = FollowListForm()
+
+    if not form.validate_on_submit():
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    user_ids = form.user_ids()
+
+    if user_ids is None:
+        flash("User ids must be numbers.", "danger")
+    elif len(user_ids) > app.config['BULK_FOLLOW_MAX']:
+        flash(f"At most {app.config['BULK_FOLLOW_MAX']} users at a time.",
+              "danger")
+    else:
+        changed = change(g.user.id, user_ids)
+        db.session.commit()
+        cache.invalidate(*follows.cache_tags(g.user.id, changed))
+        flash(f"{done} {len(changed)} users.", "success")
 
     return redirect(f"/users/{g.user.id}/following")
 
 
+def user_exists(user_id):
+    return (db.session
+            .query(User.id)
+            .filter(User.id == user_id)
+            .first()) is not None
+
+
 @app.route('/users/profile', methods=["GET", "POST"])
 def profile():
     """Update profile for current user."""
@@ -252,21 +600,26 @@ def profile():
 
     form = EditUserForm(obj=user)
 
-    user = User.authenticate(user.username, form.password.data)
+    # Only check the password (a bcrypt hash) when the form is submitted
+    if form.validate_on_submit():
+        if User.authenticate(user.username, form.password.data):
+            user.username = form.username.data
+            user.email = form.email.data
+            user.image_url = form.image_url.data
+            user.header_image_url = form.header_image_url.data
+            user.bio = form.bio.data
+            user.version = User.version + 1
+            user.updated_at = datetime.utcnow()
 
-    if user and form.validate_on_submit():
-        user.username = form.username.data
-        user.email = form.email.data
-        user.image_url = form.image_url.data
-        user.header_image_url = form.header_image_url.data
-        user.bio = form.bio.data
+            db.session.commit()
+            cache.invalidate(f'user:{user.id}')
+            search.reindex_user(user)
+            identity.remember(user)
+            return redirect(f'/users/{g.user.id}')
 
-        db.session.commit()
-        return redirect(f'/users/{g.user.id}')
+        flash("Invalid credentials.", 'danger')
 
-    else:
-        return render_template('users/edit.html', form=form)
-    
+    return render_template('users/edit.html', form=form)
 
 
 @app.route('/users/delete', methods=["POST"])
@@ -280,12 +633,11 @@ def delete_user():
     form = TokenForm()
 
     if form.validate_on_submit():
+        user_id = g.user.id
         do_logout()
+        purge.delete(user_id)
 
-        db.session.delete(g.user)
-        db.session.commit()
-
-    return redirect("/signup", form=form)
+    return redirect("/signup")
 
 
 ##############################################################################
@@ -305,20 +657,55 @@ def messages_add():
     form = MessageForm()
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
+        msg = Message(text=form.text.data, user_id=g.user.id)
+        db.session.add(msg)
+        db.session.flush()
+
+        counters.adjust(g.user.id, messages=1)
+        timeline.fan_out_message(msg)
+        search.index_message(msg)
         db.session.commit()
+        cache.invalidate(f'messages:{g.user.id}')
 
         return redirect(f"/users/{g.user.id}")
 
     return render_template('messages/new.html', form=form)
 
 
+@app.route('/messages/search')
+def messages_search():
+    """Search messages by text.
+
+    Takes a 'q' param with the text to look for, and an 'order' param of
+    'recent' (the default) or 'relevant'.
+    """
+
+    text = request.args.get('q', '')
+    order = request.args.get('order')
+    if order not in ('recent', 'relevant'):
+        order = 'recent'
+
+    if text.strip():
+        messages = search.search_messages(text, order)
+    else:
+        messages = Page([])
+
+    return render_template('messages/search.html', messages=messages,
+                           q=text, order=order)
+
+
 @app.route('/messages/<int:message_id>', methods=["GET"])
+@conditional_get(conditional.message_page)
+@cached()
 def messages_show(message_id):
     """Show a message."""
 
-    msg = Message.query.get(message_id)
+    msg = Message.query.get_or_404(message_id)
+    if msg.user.deleted_at:
+        abort(404)
+
+    cache.tag(f'message:{msg.id}', f'user:{msg.user_id}')
+
     return render_template('messages/show.html', message=msg)
 
 
@@ -330,9 +717,18 @@ def messages_destroy(message_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    msg = Message.query.get(message_id)
+    msg = Message.query.get_or_404(message_id)
+    liker_ids = [user_id for (user_id,) in
+                 db.session
+                   .query(LikedMessage.user_id_like)
+                   .filter(LikedMessage.message_id_liked == msg.id)]
+
+    counters.forget_message(msg)
+    search.unindex_message(msg)
     db.session.delete(msg)
     db.session.commit()
+    cache.invalidate(f'message:{msg.id}', f'messages:{msg.user_id}',
+                     *(f'likes:{user_id}' for user_id in liker_ids))
 
     return redirect(f"/users/{g.user.id}")
 
@@ -342,11 +738,13 @@ def messages_destroy(message_id):
 
 
 @app.route('/')
+@conditional_get(conditional.home_page)
+@cached(max_age=300, anonymous_only=True)
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: a page of the most recent messages of followed_users
     """
     
     # user = User.query.get(g.user)
@@ -356,16 +754,11 @@ def homepage():
     form = TokenForm()
 
     if g.user:
-        following_id = [user.id for user in g.user.following]
-
-        messages = (Message
-                    .query
-                    .filter(Message.user_id.in_(following_id))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
+        messages = timeline.home_page(g.user.id)
+        liked_ids = g.user.liked_message_ids([msg.id for msg in messages])
 
-        return render_template('home.html', messages=messages, form=form)
+        return render_template('home.html', messages=messages,
+                               liked_ids=liked_ids, form=form)
     
     return render_template('home-anon.html')
 
@@ -378,42 +771,96 @@ def like_or_unlike_message(msg_id):
     
     Redirects to homepage'''
 
+    return change_like('toggle', msg_id)
+
+
+@app.route('/messages/<int:message_id>/like', methods=['POST'])
+def like_message(message_id):
+    """Like a message (liking it again changes nothing)."""
+
+    return change_like('like', message_id)
+
+
+@app.route('/messages/<int:message_id>/unlike', methods=['POST'])
+def unlike_message(message_id):
+    """Unlike a message (unliking it again changes nothing)."""
+
+    return change_like('unlike', message_id)
+
+
+def change_like(action, message_id):
+    """Like, unlike or toggle a like for the current user (see likes.py)."""
+
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
-    
+
     form = TokenForm()
-    
-    if form.validate_on_submit():
-        message = Message.query.get(msg_id)
-        user = g.user
-        #user.likes is an array of the all the message this user likes
-        if message in user.message_likes:
-            user.message_likes.remove(message) #remove message id from their user's liked message id [])
-            db.session.commit()
-        else:
-            user.message_likes.append(message) #add liked messages to user's liked message list
-            db.session.commit()
 
-        return redirect("/")   
+    if not form.validate_on_submit():
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
 
-    else: 
-        return render_template('home.html', form=form)
+    try:
+        likes.write(action, g.user.id, message_id)
+    except IntegrityError:
+        # The message doesn't exist (any more).
+        db.session.rollback()
+        abort(404)
 
+    cache.invalidate(f'likes:{g.user.id}')
 
+    return redirect("/")
 
 
 ##############################################################################
-# Turn off all caching in Flask
-#   (useful for dev; in production, this kind of stuff is typically
-#   handled elsewhere)
+# Caching headers
 #
-# https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
+# Routes served through the response cache set their own Cache-Control
+# (see cache.cached); everything else is not to be stored.
 
 @app.after_request
 def add_header(response):
-    """Add non-caching headers on every request."""
+    """Add non-caching headers to responses that didn't set their own."""
 
     # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
-    response.cache_control.no_store = True
+    if 'Cache-Control' not in response.headers:
+        response.cache_control.no_store = True
     return response
+
+
+##############################################################################
+# Maintenance commands (run with `flask <command>`)
+
+@app.cli.command('recount')
+def recount_command():
+    """Recompute every user's message/follow/like counters."""
+
+    counters.recount_all()
+    db.session.commit()
+
+
+@app.cli.command('purge-accounts')
+def purge_accounts_command():
+    """Purge deleted accounts whose purge never finished."""
+
+    purge.purge_pending()
+
+
+@app.cli.command('reindex-messages')
+def reindex_messages_command():
+    """Rebuild the message search postings (not needed on Postgres)."""
+
+    search.reindex_messages()
+    db.session.commit()
+
+
+@app.cli.command('index-report')
+@click.option('--bind', help="Report on this bind (a replica) instead.")
+@click.option('--min-rows', default=indexes.MIN_ROWS,
+              help="Skip sequentially scanned tables smaller than this.")
+def index_report_command(bind, min_rows):
+    """Report missing and unused indexes, from the database's statistics."""
+
+    for line in indexes.report(db.get_engine(app, bind), min_rows):
+        click.echo(line)
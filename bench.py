@@ -0,0 +1,421 @@
+"""Route benchmarks.
+
+    python bench.py --users 1000 --messages 20000 --follows 50000 \\
+        --likes 20000 --output bench.json
+    python bench.py --no-seed --baseline bench.json
+
+Seeds a benchmark database (DATABASE_URL, by default warbler-bench) with
+generator/create_csvs.py and seed.py, then sends --requests requests to
+each scenario below, first through the Flask test client in this process
+and then over HTTP to a real gunicorn server (--workers processes,
+--concurrency connections). Viewers, profiles and messages are picked
+at random (but the same for a given --seed).
+
+The JSON report has, per scenario, throughput, p50/p90/p99/max latency,
+errors and (test client only, where every statement can be seen) SQL
+statements per request, along with the peak RSS of this process and of
+the server. With --baseline, the run is compared against an earlier
+report and the exit status is 1 if any scenario got more than
+--tolerance slower at p50 or p99, or runs more statements per request.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+
+os.environ.setdefault('DATABASE_URL', 'postgresql:///warbler-bench')
+
+from flask import session
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message
+from query_counter import QueryCounter
+import identity
+import seed
+
+# name: (method, path, form data), filled in from the random picks
+SCENARIOS = {
+    'homepage': lambda pick: ('GET', "/", None),
+    'users_show': lambda pick: ('GET', f"/users/{pick.user()}", None),
+    'list_users': lambda pick: ('GET', "/users", None),
+    'user_likes': lambda pick: ('GET', f"/users/{pick.user()}/likes", None),
+    'show_following': lambda pick: (
+        'GET', f"/users/{pick.user()}/following", None),
+    'like_or_unlike_message': lambda pick: (
+        'POST', f"/users/{pick.message()}/like", {}),
+    'add_follow': lambda pick: ('POST', f"/users/follow/{pick.user()}", {}),
+    'messages_add': lambda pick: (
+        'POST', "/messages/new", {'text': f"benchmark warble {pick.n()}"}),
+}
+
+GUNICORN_PORT = 8765
+
+
+class Picker:
+    """Seeded random choice of viewers, users and messages."""
+
+    def __init__(self, seed, max_user_id, max_message_id):
+        self.random = random.Random(seed)
+        self.max_user_id = max_user_id
+        self.max_message_id = max_message_id
+        self.count = 0
+
+    def user(self):
+        return self.random.randint(1, self.max_user_id)
+
+    def message(self):
+        return self.random.randint(1, self.max_message_id)
+
+    def n(self):
+        self.count += 1
+        return self.count
+
+
+def ensure_database():
+    """Create the benchmark database if it doesn't exist (Postgres)."""
+
+    url = db.engine.url
+    if url.get_backend_name() != 'postgresql':
+        return
+
+    admin_url = make_url(str(url))
+    admin_url.database = 'postgres'
+    admin = create_engine(admin_url, isolation_level='AUTOCOMMIT')
+    exists = admin.execute("SELECT 1 FROM pg_database WHERE datname = %s",
+                           (url.database,)).scalar()
+    if not exists:
+        admin.execute(f'CREATE DATABASE "{url.database}"')
+    admin.dispose()
+
+
+def seed_database(options):
+    """Generate a dataset of the requested size and load it."""
+
+    with tempfile.TemporaryDirectory() as data:
+        subprocess.run([
+            sys.executable, os.path.join('generator', 'create_csvs.py'),
+            '--users', str(options.users),
+            '--messages', str(options.messages),
+            '--follows', str(options.follows),
+            '--likes', str(options.likes),
+            '--seed', str(options.seed),
+            '--out', data,
+        ], check=True)
+
+        with app.app_context():
+            seed.load(data)
+
+
+def session_cookie(user_id):
+    """A session cookie logged in as `user_id`, and a CSRF token for it.
+
+    Built the way the app would sign them, so no password is needed.
+    """
+
+    with app.test_request_context():
+        session[CURR_USER_KEY] = user_id
+        identity.remember(User.query.get(user_id))
+        token = generate_csrf()
+        serializer = app.session_interface.get_signing_serializer(app)
+        cookie = serializer.dumps(dict(session))
+
+    return cookie, token
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, errors, statements=None):
+    """Stats for one scenario; `latencies` in seconds."""
+
+    milliseconds = [latency * 1000 for latency in latencies]
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(statistics.median(milliseconds), 2),
+        'p90_ms': round(percentile(milliseconds, 0.9), 2),
+        'p99_ms': round(percentile(milliseconds, 0.99), 2),
+        'max_ms': round(max(milliseconds), 2),
+    }
+
+    if statements is not None:
+        summary['queries_per_request'] = round(
+            sum(statements) / len(statements), 2)
+
+    return summary
+
+
+def expected(method, status):
+    return status == (200 if method == 'GET' else 302)
+
+
+def run_client(options, picker, viewers):
+    """Send every scenario's requests through the Flask test client."""
+
+    results = {}
+
+    for name, scenario in SCENARIOS.items():
+        latencies, statements = [], []
+        errors = 0
+        client = app.test_client()
+
+        for i in range(options.warmup + options.requests):
+            method, path, data = scenario(picker)
+            cookie, token = viewers[picker.random.randrange(len(viewers))]
+            client.set_cookie('localhost', 'session', cookie)
+            if data is not None:
+                data = {**data, 'csrf_token': token}
+
+            with QueryCounter(db.engine) as counter:
+                start = time.perf_counter()
+                resp = client.open(path, method=method, data=data)
+                resp.get_data()
+                latency = time.perf_counter() - start
+
+            if i < options.warmup:
+                continue
+
+            latencies.append(latency)
+            statements.append(counter.count)
+            errors += not expected(method, resp.status_code)
+
+        results[name] = summarize(latencies, sum(latencies), errors,
+                                  statements)
+        print(f"client   {name:24} {results[name]}")
+
+    return results
+
+
+def start_gunicorn(options):
+    server = subprocess.Popen(
+        ['gunicorn', 'app:app', '--bind', f"127.0.0.1:{GUNICORN_PORT}",
+         '--workers', str(options.workers), '--log-level', 'warning'],
+        env=dict(os.environ))
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', GUNICORN_PORT)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+
+    server.terminate()
+    raise SystemExit("gunicorn didn't start")
+
+
+def server_peak_rss(server):
+    """Peak RSS (KB) of the gunicorn master and workers, from /proc."""
+
+    def peak(pid):
+        try:
+            with open(f"/proc/{pid}/status") as status:
+                for line in status:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1])
+        except OSError:
+            return None
+
+    try:
+        with open(f"/proc/{server.pid}/task/{server.pid}/children") as kids:
+            pids = [server.pid] + [int(pid) for pid in kids.read().split()]
+    except OSError:
+        return None
+
+    return {str(pid): peak(pid) for pid in pids}
+
+
+def run_gunicorn(options, picker, viewers):
+    """Send every scenario's requests to a gunicorn server over HTTP."""
+
+    server = start_gunicorn(options)
+    results = {}
+
+    try:
+        for name, scenario in SCENARIOS.items():
+            requests = []
+            for _ in range(options.warmup + options.requests):
+                cookie, token = viewers[picker.random.randrange(len(viewers))]
+                requests.append((scenario(picker), cookie, token))
+
+            connections = threading.local()
+
+            def send(request):
+                (method, path, data), cookie, token = request
+                if not hasattr(connections, 'conn'):
+                    connections.conn = http.client.HTTPConnection(
+                        '127.0.0.1', GUNICORN_PORT)
+                conn = connections.conn
+                headers = {'Cookie': f"session={cookie}"}
+                body = None
+                if data is not None:
+                    body = urlencode({**data, 'csrf_token': token})
+                    headers['Content-Type'] = (
+                        'application/x-www-form-urlencoded')
+
+                start = time.perf_counter()
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                return time.perf_counter() - start, resp.status
+
+            with ThreadPoolExecutor(options.concurrency) as pool:
+                list(pool.map(send, requests[:options.warmup]))
+
+                start = time.perf_counter()
+                timings = list(pool.map(send, requests[options.warmup:]))
+                elapsed = time.perf_counter() - start
+
+            latencies = [latency for latency, _ in timings]
+            errors = sum(not expected(request[0][0], status)
+                         for request, (_, status)
+                         in zip(requests[options.warmup:], timings))
+
+            results[name] = summarize(latencies, elapsed, errors)
+            print(f"gunicorn {name:24} {results[name]}")
+
+        return results, server_peak_rss(server)
+
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def compare(report, baseline, tolerance):
+    """Regressions of `report` against `baseline`, as readable lines."""
+
+    regressions = []
+
+    for mode, scenarios in baseline.get('results', {}).items():
+        for name, before in scenarios.items():
+            after = report.get('results', {}).get(mode, {}).get(name)
+            if after is None:
+                continue
+
+            for stat in ('p50_ms', 'p99_ms'):
+                if after[stat] > before[stat] * (1 + tolerance):
+                    regressions.append(
+                        f"{mode} {name}: {stat} {before[stat]} -> "
+                        f"{after[stat]}")
+
+            queries = 'queries_per_request'
+            if queries in before and after.get(queries, 0) > before[queries]:
+                regressions.append(
+                    f"{mode} {name}: {queries} {before[queries]} -> "
+                    f"{after[queries]}")
+
+    return regressions
+
+
+def run(options):
+    """Run the benchmarks and return the report."""
+
+    with app.app_context():
+        ensure_database()
+
+    if not options.no_seed:
+        seed_database(options)
+
+    with app.app_context():
+        max_user_id = db.session.query(db.func.max(User.id)).scalar()
+        max_message_id = db.session.query(db.func.max(Message.id)).scalar()
+        db.session.remove()
+
+    if not max_user_id or not max_message_id:
+        raise SystemExit("The benchmark database is empty; drop --no-seed")
+
+    picker = Picker(options.seed, max_user_id, max_message_id)
+    viewers = [session_cookie(picker.user()) for _ in range(options.viewers)]
+
+    report = {
+        'started_at': datetime.utcnow().isoformat(),
+        'options': vars(options),
+        'results': {},
+    }
+
+    if options.mode in ('client', 'both'):
+        report['results']['client'] = run_client(options, picker, viewers)
+        report['client_peak_rss_kb'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss
+
+    if options.mode in ('gunicorn', 'both'):
+        report['results']['gunicorn'], report['server_peak_rss_kb'] = (
+            run_gunicorn(options, picker, viewers))
+
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--follows', type=int, default=20000)
+    parser.add_argument('--likes', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-seed', action='store_true',
+                        help="reuse the data already in the database")
+    parser.add_argument('--requests', type=int, default=200,
+                        help="measured requests per scenario")
+    parser.add_argument('--warmup', type=int, default=20,
+                        help="unmeasured requests per scenario first")
+    parser.add_argument('--viewers', type=int, default=20,
+                        help="how many users the requests are spread over")
+    parser.add_argument('--mode', choices=['client', 'gunicorn', 'both'],
+                        default='both')
+    parser.add_argument('--workers', type=int, default=2,
+                        help="gunicorn worker processes")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help="simultaneous connections to gunicorn")
+    parser.add_argument('--output', help="write the JSON report here")
+    parser.add_argument('--baseline', help="JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown against the baseline")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    report = run(options)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as baseline:
+            regressions = compare(report, json.load(baseline),
+                                  options.tolerance)
+
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,320 @@
+"""Server-side cache of rendered pages.
+
+Views decorated with `@cached` are stored under a key made of the URL
+(path and query string) and the viewer: anonymous, or a logged-in user
+id together with a digest of their session's CSRF token (so a page never
+carries another session's form token).
+
+Entries live in two tiers:
+
+- a bounded in-process LRU (RESPONSE_CACHE_SIZE entries per worker),
+- a shared store all workers can see, named by RESPONSE_CACHE_STORE.
+  `sqlite:///path/to/file.db` uses a local SQLite file; left empty, the
+  store is a process-local stand-in that holds tag versions only.
+
+Each entry records the version of every tag it depends on (such as
+`user:3` or `message:12`). `invalidate` bumps tag versions after a write
+commits, and an entry whose tags have moved on is treated as a miss.
+Versions are kept in the shared store, so with more than one worker
+RESPONSE_CACHE_STORE must name one; otherwise other workers would serve
+stale pages for up to RESPONSE_CACHE_TTL seconds. gunicorn.conf.py
+defaults it to a SQLite file when gunicorn runs several workers.
+
+Pages are never served from or stored in the cache while flashed
+messages are pending, and a render that changes the session (setting a
+new CSRF token, consuming flashes) is not stored.
+"""
+
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+
+# Tag every entry depends on; bumped by changes too broad to track.
+GLOBAL_TAG = 'global'
+
+
+class LRU:
+    """A bounded, thread-safe mapping that drops its least recent entries."""
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class MemoryStore:
+    """Process-local stand-in for a shared store.
+
+    Keeps tag versions only; entries live in the LRU tier alone.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tags = {}
+
+    def get(self, key):
+        return None
+
+    def set(self, key, entry, expires):
+        pass
+
+    def versions(self, tags):
+        with self.lock:
+            return {tag: self.tags.get(tag, 0) for tag in tags}
+
+    def bump(self, tags):
+        with self.lock:
+            for tag in tags:
+                self.tags[tag] = self.tags.get(tag, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.tags.clear()
+
+
+class SQLiteStore:
+    """Shared store in a local SQLite file, for workers on one host."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+        with self.connection as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_entries "
+                         "(key TEXT PRIMARY KEY, entry BLOB, expires REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_tags "
+                         "(tag TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    @property
+    def connection(self):
+        """This thread's connection to the store."""
+
+        if getattr(self.local, 'conn', None) is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+
+        return self.local.conn
+
+    def get(self, key):
+        row = self.connection.execute(
+            "SELECT entry FROM cache_entries WHERE key = ? AND expires > ?",
+            (key, time.time())).fetchone()
+
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, entry, expires):
+        with self.connection as conn:
+            conn.execute("INSERT OR REPLACE INTO cache_entries "
+                         "VALUES (?, ?, ?)",
+                         (key, pickle.dumps(entry), expires))
+            conn.execute("DELETE FROM cache_entries WHERE expires <= ?",
+                         (time.time(),))
+
+    def versions(self, tags):
+        tags = list(tags)
+        placeholders = ', '.join('?' * len(tags))
+        found = dict(self.connection.execute(
+            f"SELECT tag, version FROM cache_tags "
+            f"WHERE tag IN ({placeholders})", tags))
+
+        return {tag: found.get(tag, 0) for tag in tags}
+
+    def bump(self, tags):
+        with self.connection as conn:
+            conn.executemany(
+                "INSERT INTO cache_tags VALUES (?, 1) ON CONFLICT (tag) "
+                "DO UPDATE SET version = version + 1",
+                [(tag,) for tag in tags])
+
+    def clear(self):
+        with self.connection as conn:
+            conn.execute("DELETE FROM cache_entries")
+            conn.execute("DELETE FROM cache_tags")
+
+
+def make_store(url):
+    """The shared store named by a RESPONSE_CACHE_STORE setting."""
+
+    if not url:
+        return MemoryStore()
+
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+
+    raise ValueError(f"Unknown RESPONSE_CACHE_STORE: {url}")
+
+
+class ResponseCache:
+    """The two cache tiers, plus tag versions for invalidation."""
+
+    def __init__(self, size=1024, ttl=300, store=None):
+        self.ttl = ttl
+        self.store = store or MemoryStore()
+        self.entries = LRU(size)
+
+    def init_app(self, app):
+        self.entries.size = app.config.setdefault('RESPONSE_CACHE_SIZE', 1024)
+        self.ttl = app.config.setdefault('RESPONSE_CACHE_TTL', 300)
+        self.store = make_store(app.config.setdefault('RESPONSE_CACHE_STORE',
+                                                      ''))
+        app.config.setdefault('RESPONSE_CACHE', True)
+
+    def get(self, key):
+        """The entry stored under `key`, if it is fresh and still valid."""
+
+        entry = self.entries.get(key)
+
+        if entry is None or entry['expires'] <= time.time():
+            entry = self.store.get(key)
+            if entry is None:
+                return None
+            self.entries.set(key, entry)
+
+        if self.store.versions(entry['tags']) != entry['tags']:
+            return None
+
+        return entry
+
+    def set(self, key, response, tags):
+        """Store a rendered response, depending on `tags`."""
+
+        entry = {
+            'status': response.status_code,
+            'content_type': response.content_type,
+            'body': response.get_data(),
+            'tags': self.store.versions(tags),
+            'expires': time.time() + self.ttl,
+        }
+
+        self.entries.set(key, entry)
+        self.store.set(key, entry, entry['expires'])
+
+    def invalidate(self, *tags):
+        """Mark every entry depending on any of `tags` as stale."""
+
+        self.store.bump(tags)
+
+    def clear(self):
+        self.entries.clear()
+        self.store.clear()
+
+
+response_cache = ResponseCache()
+
+
+def invalidate(*tags):
+    """Mark cached pages depending on any of `tags` as stale.
+
+    Call after the change has been committed.
+    """
+
+    response_cache.invalidate(*tags)
+
+
+def tag(*tags):
+    """Add tags the page being rendered depends on."""
+
+    g.setdefault('cache_tags', set()).update(tags)
+
+
+def viewer_tags(user_id):
+    """Tags of the logged-in user's own state shown on every page."""
+
+    return [f'user:{user_id}', f'follows:{user_id}', f'likes:{user_id}']
+
+
+def viewer_key():
+    """Which class of viewer the page is being rendered for."""
+
+    if not g.user:
+        return 'anon'
+
+    token = session.get('csrf_token', '')
+    digest = hashlib.sha1(token.encode('utf-8')).hexdigest()[:16]
+
+    return f'user:{g.user.id}:{digest}'
+
+
+def cacheable():
+    return (current_app.config['RESPONSE_CACHE']
+            and request.method == 'GET'
+            and '_flashes' not in session)
+
+
+def cached(max_age=60, anonymous_only=False):
+    """Serve a view from the response cache when possible.
+
+    Anonymous responses may also be kept by browsers and proxies for
+    `max_age` seconds; logged-in responses are private and revalidated.
+    With `anonymous_only`, pages for logged-in users are never cached.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not cacheable() or (anonymous_only and g.user):
+                return view(*args, **kwargs)
+
+            key = f"{request.full_path}|{viewer_key()}"
+            entry = response_cache.get(key)
+
+            if entry is not None:
+                response = make_response(entry['body'], entry['status'])
+                response.content_type = entry['content_type']
+                response.headers['X-Cache'] = 'HIT'
+            else:
+                response = make_response(view(*args, **kwargs))
+
+                if response.status_code == 200 and not session.modified:
+                    tags = g.get('cache_tags', set()) | {GLOBAL_TAG}
+                    if g.user:
+                        tags.update(viewer_tags(g.user.id))
+
+                    response_cache.set(key, response, tags)
+
+                response.headers['X-Cache'] = 'MISS'
+
+            if response.status_code != 200:
+                pass
+            elif g.user or session.modified:
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+            else:
+                response.cache_control.public = True
+                response.cache_control.max_age = max_age
+
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,174 @@
+"""Conditional GETs for profile, message and timeline pages.
+
+Each page gets a validator function that reads the values its content
+depends on (in a query or two): row versions, the follow/like versions and
+`updated_at` kept by counters.py, and the newest message id. These are
+hashed into an ETag, and the newest `updated_at` (or message timestamp)
+becomes Last-Modified. If the request's If-None-Match / If-Modified-Since
+still match, `conditional_get` answers 304 without running the view at all.
+
+Pages for logged-in users embed CSRF tokens, which expire after an hour,
+so their ETags also change every CSRF_ROTATION seconds.
+"""
+
+import hashlib
+import time
+from functools import wraps
+
+from flask import g, make_response, request
+from werkzeug.http import is_resource_modified
+
+from models import db, User, Message, Follows, TimelineEntry
+import cache
+
+CSRF_ROTATION = 30 * 60
+
+
+def make_etag(values):
+    viewer = [cache.viewer_key()]
+    if g.user:
+        viewer.append(int(time.time() // CSRF_ROTATION))
+
+    text = repr(list(values) + viewer)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def conditional_get(validators):
+    """Answer conditional GETs for a view before running it.
+
+    `validators` takes the view's arguments and returns (values,
+    last_modified), or None to skip straight to the view (e.g. when the
+    row doesn't exist, so the view can 404).
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            found = validators(*args, **kwargs)
+            if found is None:
+                return view(*args, **kwargs)
+
+            values, last_modified = found
+            etag = make_etag(values)
+            last_modified = last_modified.replace(microsecond=0)
+
+            if is_resource_modified(request.environ, etag=etag,
+                                    last_modified=last_modified):
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            else:
+                response = make_response('', 304)
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+
+            if 'Cache-Control' not in response.headers:
+                # Let browsers keep the page, but check back every time.
+                if g.user:
+                    response.cache_control.private = True
+                response.cache_control.no_cache = True
+
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def viewer_columns():
+    return [User.id, User.version, User.follows_version, User.likes_version,
+            User.updated_at]
+
+
+def viewer_row():
+    """The logged-in user's validators (or None when anonymous)."""
+
+    if not g.user:
+        return None
+
+    return (db.session
+            .query(*viewer_columns())
+            .filter(User.id == g.user.id)
+            .first())
+
+
+def newest(*timestamps):
+    return max(stamp for stamp in timestamps if stamp is not None)
+
+
+def user_page(user_id):
+    """Validators for a user's profile page (None for anonymous)."""
+
+    if not g.user:
+        return None
+
+    newest_message_id = (db.session
+                         .query(db.func.max(Message.id))
+                         .filter(Message.user_id == User.id)
+                         .correlate(User)
+                         .label('newest_message_id'))
+
+    rows = {row.id: row for row in
+            db.session
+              .query(*viewer_columns(), User.messages_count,
+                     newest_message_id)
+              .filter(User.id.in_({user_id, g.user.id}))}
+
+    if user_id not in rows or g.user.id not in rows:
+        return None
+
+    user, viewer = rows[user_id], rows[g.user.id]
+
+    return [user, viewer], newest(user.updated_at, viewer.updated_at)
+
+
+def message_page(message_id):
+    """Validators for a single message's page."""
+
+    row = (db.session
+           .query(Message.id, Message.timestamp,
+                  User.id, User.version, User.updated_at)
+           .join(User, User.id == Message.user_id)
+           .filter(Message.id == message_id)
+           .first())
+
+    if row is None:
+        return None
+
+    viewer = viewer_row()
+
+    return ([row, viewer],
+            newest(row.timestamp, row.updated_at,
+                   viewer and viewer.updated_at))
+
+
+def home_page():
+    """Validators for the logged-in home page (None for anonymous)."""
+
+    if not g.user:
+        return None
+
+    followed = db.aliased(User)
+    followed_updated = (db.session
+                        .query(db.func.max(followed.updated_at))
+                        .join(Follows,
+                              Follows.user_being_followed_id == followed.id)
+                        .filter(Follows.user_following_id == g.user.id)
+                        .label('followed_updated_at'))
+
+    newest_entry = (db.session
+                    .query(db.func.max(TimelineEntry.message_id))
+                    .filter(TimelineEntry.user_id == g.user.id)
+                    .label('newest_entry_id'))
+
+    row = (db.session
+           .query(*viewer_columns(), User.messages_count,
+                  followed_updated, newest_entry)
+           .filter(User.id == g.user.id)
+           .first())
+
+    if row is None:
+        return None
+
+    return [row], newest(row.updated_at, row.followed_updated_at)
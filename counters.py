@@ -0,0 +1,109 @@
+"""Denormalized per-user counters.
+
+The message, following, follower and like counts shown on profiles are
+stored on the users row. Routes adjust them with single UPDATE statements
+in the same transaction as the write that changes them; `recount_all`
+recomputes them from scratch to repair any drift.
+
+The same statements bump the user's follows/likes versions and
+`updated_at`, which conditional GETs are validated against.
+"""
+
+from datetime import datetime
+
+from models import db, User, Message, Follows, LikedMessage
+
+COLUMNS = {
+    'messages': User.messages_count,
+    'following': User.following_count,
+    'followers': User.followers_count,
+    'likes': User.likes_count,
+}
+
+VERSIONS = {
+    'following': User.follows_version,
+    'followers': User.follows_version,
+    'likes': User.likes_version,
+}
+
+
+def touched(*names):
+    """Column updates marking the given counters' versions as changed."""
+
+    values = {VERSIONS[name]: VERSIONS[name] + 1
+              for name in names if name in VERSIONS}
+    values[User.updated_at] = datetime.utcnow()
+
+    return values
+
+
+def adjust(user_ids, **deltas):
+    """Add to the counters of one or more users.
+
+    For example `adjust(user.id, followers=1)` or
+    `adjust([a.id, b.id], likes=-1)`.
+    """
+
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+
+    values = {COLUMNS[name]: COLUMNS[name] + delta
+              for name, delta in deltas.items()}
+    values.update(touched(*deltas))
+
+    (User
+        .query
+        .filter(User.id.in_(user_ids))
+        .update(values, synchronize_session=False))
+
+
+def forget_message(message):
+    """Adjust counters for a message that is about to be deleted."""
+
+    forget_messages(message.user_id, [message.id])
+
+
+def forget_messages(user_id, message_ids):
+    """Adjust counters for messages of `user_id` about to be deleted."""
+
+    adjust(user_id, messages=-len(message_ids))
+
+    likes_lost = (db.select([db.func.count()])
+                  .where(LikedMessage.message_id_liked.in_(message_ids))
+                  .where(LikedMessage.user_id_like == User.id)
+                  .as_scalar())
+
+    likers = (db.session
+              .query(LikedMessage.user_id_like)
+              .filter(LikedMessage.message_id_liked.in_(message_ids)))
+
+    (User
+        .query
+        .filter(User.id.in_(likers))
+        .update({User.likes_count: User.likes_count - likes_lost,
+                 **touched('likes')},
+                synchronize_session=False))
+
+
+def recount_all():
+    """Recompute every user's counters in bulk."""
+
+    def count(column, where):
+        return (db.select([db.func.count()])
+                .select_from(column.table)
+                .where(where)
+                .as_scalar())
+
+    User.query.update({
+        User.messages_count:
+            count(Message.id, Message.user_id == User.id),
+        User.following_count:
+            count(Follows.user_following_id,
+                  Follows.user_following_id == User.id),
+        User.followers_count:
+            count(Follows.user_being_followed_id,
+                  Follows.user_being_followed_id == User.id),
+        User.likes_count:
+            count(LikedMessage.user_id_like,
+                  LikedMessage.user_id_like == User.id),
+    }, synchronize_session=False)
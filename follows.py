@@ -0,0 +1,65 @@
+"""Following and unfollowing.
+
+`follow(follower_id, user_ids)` and `unfollow(follower_id, user_ids)`
+write the follows rows directly (see Follows.follow and unfollow) rather
+than going through `user.following`, which would load everyone the user
+follows first. Both take one id or many and cost a handful of statements
+however many users are involved, so a whole imported follow list is one
+call. Existing follows are skipped when following and missing ones when
+unfollowing.
+
+Counters, timelines and fan-out flags are updated for the follows that
+actually changed, in the caller's transaction; the caller commits and
+invalidates cached pages (see `cache_tags`).
+"""
+
+from models import Follows
+import counters
+import timeline
+
+
+def as_ids(user_ids):
+    if isinstance(user_ids, int):
+        return [user_ids]
+
+    return sorted(set(user_ids))
+
+
+def follow(follower_id, user_ids):
+    """Follow one or more users. Returns the set of ids newly followed."""
+
+    followed = Follows.follow(follower_id, as_ids(user_ids))
+
+    if followed:
+        # Sorted, so concurrent bulk follows lock users rows in one order.
+        followed_ids = sorted(followed)
+        counters.adjust(follower_id, following=len(followed_ids))
+        counters.adjust(followed_ids, followers=1)
+        timeline.backfill(follower_id, followed_ids)
+        timeline.update_fanout_mode(followed_ids)
+
+    return followed
+
+
+def unfollow(follower_id, user_ids):
+    """Stop following one or more users. Returns the set of ids unfollowed."""
+
+    unfollowed = Follows.unfollow(follower_id, as_ids(user_ids))
+
+    if unfollowed:
+        unfollowed_ids = sorted(unfollowed)
+        counters.adjust(follower_id, following=-len(unfollowed_ids))
+        counters.adjust(unfollowed_ids, followers=-1)
+        timeline.prune(follower_id, unfollowed_ids)
+
+    return unfollowed
+
+
+def cache_tags(follower_id, user_ids):
+    """Cache tags of the pages showing the follows that changed."""
+
+    if not user_ids:
+        return []
+
+    return [f'follows:{follower_id}'] + [f'follows:{user_id}'
+                                         for user_id in sorted(user_ids)]
@@ -35,6 +35,21 @@ class EditUserForm(FlaskForm):
     bio = StringField('Bio')
     password = PasswordField('Password', validators=[Length(min=6)])
 
+class FollowListForm(FlaskForm):
+    """Form for following/unfollowing a list of users at once."""
+
+    ids = TextAreaField('User ids', validators=[DataRequired()])
+
+    def user_ids(self):
+        """The ids listed, separated by commas or whitespace (None if bad)."""
+
+        try:
+            return {int(part) for part in
+                    self.ids.data.replace(',', ' ').split()}
+        except ValueError:
+            return None
+
+
 class TokenForm(FlaskForm):
     '''Empty form used to get a CSRF token'''
     # hidden field for goto -when instance of form is made, set value of GOTO then
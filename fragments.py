@@ -0,0 +1,48 @@
+"""Cache of rendered template fragments.
+
+List pages render the same message and user cards over and over. The
+parts of a card that only depend on the object itself are wrapped in
+
+    {% call cached_fragment('message-card', msg.id, msg.user.version) %}
+      ...
+    {% endcall %}
+
+and rendered once per key into a bounded in-process LRU
+(FRAGMENT_CACHE_SIZE entries). Keys carry the version of every row the
+fragment shows, so an edit simply makes a new key and the old fragment
+ages out. Anything that depends on the viewer (like stars, follow
+buttons, CSRF tokens) stays outside the call block.
+"""
+
+from markupsafe import Markup
+
+from cache import LRU
+
+
+class FragmentCache:
+    """Rendered fragments, keyed by object id and version."""
+
+    def __init__(self, size=10000):
+        self.fragments = LRU(size)
+
+    def init_app(self, app):
+        self.fragments.size = app.config.setdefault('FRAGMENT_CACHE_SIZE',
+                                                    10000)
+        app.add_template_global(self.cached_fragment)
+
+    def cached_fragment(self, *key, caller):
+        """Render the call block's body once per `key`."""
+
+        html = self.fragments.get(key)
+
+        if html is None:
+            html = Markup(caller())
+            self.fragments.set(key, html)
+
+        return html
+
+    def clear(self):
+        self.fragments.clear()
+
+
+fragment_cache = FragmentCache()
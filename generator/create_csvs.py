@@ -2,76 +2,323 @@
 
 Students won't need to run this for the exercise; they will just use the CSV
 files that this generates. You should only need to run this if you wanted to
-tweak the CSV formats or generate fewer/more rows.
+tweak the CSV formats or generate fewer/more rows, for example a benchmark
+dataset:
+
+    python generator/create_csvs.py --users 1000000 --messages 10000000 \\
+        --follows 50000000 --likes 20000000 --out /tmp/bench
+    python seed.py --data /tmp/bench
+
+Follower counts and posting activity follow power laws (a few users are
+followed by, and post, far more than the rest) and messages come in
+bursts. Rows are sampled with NumPy a chunk at a time and written
+straight to CSV by a pool of processes, so memory use doesn't grow with
+the dataset. Nothing is fetched over the network, and the same --seed
+(and --chunk-size) always gives the same files.
+
+Follows and likes are generated per follower/liker, so pairs are never
+repeated. Repeats are drawn again, by popularity and then uniformly, so
+the totals come out within a fraction of a percent of what was asked
+for; any shortfall is reported.
 """
 
+import argparse
 import csv
-from random import choice, randint, sample
-from itertools import permutations
-import requests
-from faker import Faker
-from helpers import get_random_datetime
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from multiprocessing import Pool
+
+import numpy as np
+
+from helpers import (PASSWORD, IMAGE_URLS, HEADER_IMAGE_URLS, WORDS, PLACES,
+                     PLACE_SUFFIXES, zipf, scramble, sentences, timestamps)
 
 MAX_WARBLER_LENGTH = 140
 
 USERS_CSV_HEADERS = ['email', 'username', 'image_url', 'password', 'bio', 'header_image_url', 'location']
 MESSAGES_CSV_HEADERS = ['text', 'timestamp', 'user_id']
 FOLLOWS_CSV_HEADERS = ['user_being_followed_id', 'user_following_id']
+LIKES_CSV_HEADERS = ['user_id_like', 'message_id_liked']
 
 NUM_USERS = 300
 NUM_MESSAGES = 1000
 NUM_FOLLWERS = 5000
+NUM_LIKES = 0
+
+# Power law exponents: how steeply popularity (being followed, liked) and
+# activity (posting, following, liking) fall off from the top users
+POPULARITY_EXPONENT = 1.0
+ACTIVITY_SHAPE = 1.5
+
+# Share of messages posted in bursts, and the average length of a burst
+BURST_SHARE = 0.6
+BURST_SECONDS = 2 * 60 * 60
+
+CHUNK_SIZE = 100000
+
+# Rounds of redrawing follows/likes that repeat one already drawn: first
+# by popularity, then uniformly (for users who've drawn most of the
+# popular ones)
+REDRAWS = 8
+UNIFORM_REDRAWS = 8
+
+
+def rng_for(options, table, chunk):
+    return np.random.default_rng([options.seed, TABLES.index(table), chunk])
+
+
+def activity(rng, ids, total, n, most):
+    """How many follows/likes each of `ids` (1..n) makes, `total` between
+    all n users and at most `most` each.
+
+    Pareto-distributed, so a few users are far more active than the rest.
+    The chunk makes exactly its share of `total`: what users over `most`
+    would have made goes to the others, while there is room.
+    """
+
+    share = (round(total * int(ids[-1]) / n)
+             - round(total * (int(ids[0]) - 1) / n))
+    weights = 1 + rng.pareto(ACTIVITY_SHAPE, len(ids))
+    degrees = np.zeros(len(ids), dtype=np.int64)
+
+    while share > 0:
+        room = weights * (degrees < most)
+        if not room.any():
+            break
+
+        degrees += rng.multinomial(share, room / room.sum())
+        share = int(np.maximum(degrees - most, 0).sum())
+        degrees = np.minimum(degrees, most)
+
+    return degrees
+
+
+def users_chunk(rng, options, start, stop):
+    ids = np.arange(start, stop)
+    count = len(ids)
+    first, second = rng.integers(0, len(WORDS), (2, count))
+
+    usernames = [f"{WORDS[a]}_{WORDS[b]}{i}"
+                 for a, b, i in zip(first, second, ids)]
+    bios = sentences(rng, count, 3, 10, MAX_WARBLER_LENGTH)
+    images = rng.integers(0, len(IMAGE_URLS), count)
+    headers = rng.integers(0, len(HEADER_IMAGE_URLS), count)
+    places = rng.integers(0, len(PLACES), count)
+    suffixes = rng.integers(0, len(PLACE_SUFFIXES), count)
+
+    for i in range(count):
+        yield (f"{usernames[i]}@example.com", usernames[i],
+               IMAGE_URLS[images[i]], PASSWORD, bios[i],
+               HEADER_IMAGE_URLS[headers[i]],
+               PLACES[places[i]] + PLACE_SUFFIXES[suffixes[i]])
+
+
+def bursts(options):
+    """The start times and lengths of the bursts messages cluster in."""
+
+    rng = np.random.default_rng([options.seed, len(TABLES)])
+    count = max(1, options.messages // 200)
+    starts = rng.uniform(options.start, options.end, count)
+    lengths = rng.exponential(BURST_SECONDS, count)
+
+    return starts, lengths
+
+
+def messages_chunk(rng, options, start, stop):
+    count = stop - start
+    n = options.users
+
+    authors = scramble(zipf(rng, n, POPULARITY_EXPONENT, count), n,
+                       options.seed)
+
+    starts, lengths = bursts(options)
+    burst = rng.integers(0, len(starts), count)
+    in_burst = rng.random(count) < BURST_SHARE
+    seconds = np.where(
+        in_burst,
+        starts[burst] + rng.exponential(1, count) * lengths[burst],
+        rng.uniform(options.start, options.end, count))
+    seconds = np.clip(seconds, options.start, options.end)
+
+    texts = sentences(rng, count, 4, 25, MAX_WARBLER_LENGTH)
+
+    return zip(texts, timestamps(seconds), authors.tolist())
+
+
+def pairs(rng, options, start, stop, total, targets, skip_self=False):
+    """Distinct (actor, target) pairs for actors start..stop-1.
+
+    Targets are ids in 1..`targets`, drawn by popularity. Repeats (and,
+    with `skip_self`, actors drawing themselves) are drawn again, a few
+    rounds by popularity and then a few uniformly.
+    """
+
+    actors = np.arange(start, stop)
+    most = targets - 1 if skip_self else targets
+    degrees = activity(rng, actors, total, options.users, most)
+    base = targets + 1
+
+    keys = np.empty(0, dtype=np.int64)
+    needed = degrees
+
+    for round in range(REDRAWS + UNIFORM_REDRAWS):
+        if not needed.any():
+            break
+
+        count = int(needed.sum())
+        if round < REDRAWS:
+            chosen = scramble(zipf(rng, targets, POPULARITY_EXPONENT, count),
+                              targets, options.seed)
+        else:
+            chosen = rng.integers(1, targets + 1, count)
+        drawn = np.repeat(actors, needed) * base + chosen
+        if skip_self:
+            drawn = drawn[drawn // base != drawn % base]
+
+        keys = np.union1d(keys, drawn)
+        have = np.bincount(keys // base - start, minlength=len(actors))
+        needed = degrees - have
+
+    return keys // base, keys % base
+
+
+def follows_chunk(rng, options, start, stop):
+    followers, followed = pairs(rng, options, start, stop, options.follows,
+                                options.users, skip_self=True)
+
+    return zip(followed.tolist(), followers.tolist())
+
+
+def likes_chunk(rng, options, start, stop):
+    likers, messages = pairs(rng, options, start, stop, options.likes,
+                             options.messages)
+
+    return zip(likers.tolist(), messages.tolist())
+
+
+TABLES = ['users', 'messages', 'follows', 'likes']
+
+HEADERS = {
+    'users': USERS_CSV_HEADERS,
+    'messages': MESSAGES_CSV_HEADERS,
+    'follows': FOLLOWS_CSV_HEADERS,
+    'likes': LIKES_CSV_HEADERS,
+}
+
+CHUNKS = {
+    'users': users_chunk,
+    'messages': messages_chunk,
+    'follows': follows_chunk,
+    'likes': likes_chunk,
+}
+
+
+def tasks(options):
+    """(table, chunk number, first, last + 1) for every chunk to write.
+
+    Users and messages are split by row; follows and likes by the users
+    making them, about CHUNK_SIZE rows' worth at a time.
+    """
+
+    size = options.chunk_size
+    sizes = {
+        'users': (options.users, size),
+        'messages': (options.messages, size),
+        'follows': (options.users,
+                    max(1, size * options.users // max(options.follows, 1))),
+        'likes': (options.users,
+                  max(1, size * options.users // max(options.likes, 1))),
+    }
+
+    for table in TABLES:
+        if table == 'likes' and not options.likes:
+            continue
+
+        count, step = sizes[table]
+        first_id = 0 if table == 'messages' else 1
+
+        for chunk, start in enumerate(range(first_id, count + first_id, step)):
+            yield table, chunk, start, min(start + step, count + first_id)
+
+
+def write_chunk(args):
+    options, (table, chunk, start, stop) = args
+    path = os.path.join(options.out, f".{table}.{chunk:06}.part")
+
+    with open(path, 'w', newline='') as part:
+        rows = list(CHUNKS[table](rng_for(options, table, chunk), options,
+                                  start, stop))
+        csv.writer(part).writerows(rows)
+
+    return table, path, len(rows)
+
 
-fake = Faker()
+def generate(options):
+    """Write users.csv, messages.csv, follows.csv (and likes.csv)."""
 
-# Generate random profile image URLs to use for users
+    os.makedirs(options.out, exist_ok=True)
+    parts = {table: [] for table in TABLES}
+    counts = dict.fromkeys(TABLES, 0)
+    began = time.perf_counter()
 
-image_urls = [
-    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
-    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
-    for i in range(count)
-]
+    with Pool(options.workers) as pool:
+        work = [(options, task) for task in tasks(options)]
+        for table, path, count in pool.imap(write_chunk, work):
+            parts[table].append(path)
+            counts[table] += count
 
-# Generate random header image URLs to use for users
+    for table in TABLES:
+        if not parts[table]:
+            continue
 
-header_image_urls = [
-    requests.get(f"http://www.splashbase.co/api/v1/images/{i}").json()['url']
-    for i in range(1, 46)
-]
+        path = os.path.join(options.out, f"{table}.csv")
+        with open(path, 'w', newline='') as out:
+            csv.writer(out).writerow(HEADERS[table])
+            for part_path in parts[table]:
+                with open(part_path, newline='') as part:
+                    shutil.copyfileobj(part, out)
+                os.remove(part_path)
 
-with open('generator/users.csv', 'w') as users_csv:
-    users_writer = csv.DictWriter(users_csv, fieldnames=USERS_CSV_HEADERS)
-    users_writer.writeheader()
+        asked = getattr(options, table)
+        short = asked - counts[table]
+        if table in ('follows', 'likes') and short > 0:
+            print(f"{path}: {counts[table]} rows ({short} "
+                  f"({short / asked:.2%}) short of --{table})")
+        else:
+            print(f"{path}: {counts[table]} rows")
 
-    for i in range(NUM_USERS):
-        users_writer.writerow(dict(
-            email=fake.email(),
-            username=fake.user_name(),
-            image_url=choice(image_urls),
-            password='$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe',
-            bio=fake.sentence(),
-            header_image_url=choice(header_image_urls),
-            location=fake.city()
-        ))
+    elapsed = time.perf_counter() - began
+    total = sum(counts.values())
+    print(f"Wrote {total} rows in {elapsed:.1f}s "
+          f"({total / max(elapsed, 1e-6):,.0f} rows/s)")
 
-with open('generator/messages.csv', 'w') as messages_csv:
-    messages_writer = csv.DictWriter(messages_csv, fieldnames=MESSAGES_CSV_HEADERS)
-    messages_writer.writeheader()
 
-    for i in range(NUM_MESSAGES):
-        messages_writer.writerow(dict(
-            text=fake.paragraph()[:MAX_WARBLER_LENGTH],
-            timestamp=get_random_datetime(),
-            user_id=randint(1, NUM_USERS)
-        ))
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=NUM_USERS)
+    parser.add_argument('--messages', type=int, default=NUM_MESSAGES)
+    parser.add_argument('--follows', type=int, default=NUM_FOLLWERS)
+    parser.add_argument('--likes', type=int, default=NUM_LIKES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--years', type=float, default=2,
+                        help="messages span this many years up to --until")
+    parser.add_argument('--until', default='2020-08-01',
+                        help="date of the newest possible message")
+    parser.add_argument('--out', default=os.path.dirname(
+        os.path.abspath(__file__)), help="directory to write the CSVs to")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help="rows per chunk (part of what --seed fixes)")
 
-# Generate follows.csv from random pairings of users
+    options = parser.parse_args(argv)
+    options.end = (datetime.fromisoformat(options.until)
+                   .replace(tzinfo=timezone.utc).timestamp())
+    options.start = options.end - options.years * 365.25 * 24 * 60 * 60
 
-with open('generator/follows.csv', 'w') as follows_csv:
-    all_pairs = list(permutations(range(1, NUM_USERS + 1), 2))
+    return options
 
-    users_writer = csv.DictWriter(follows_csv, fieldnames=FOLLOWS_CSV_HEADERS)
-    users_writer.writeheader()
 
-    for followed_user, follower in sample(all_pairs, NUM_FOLLWERS):
-        users_writer.writerow(dict(user_being_followed_id=followed_user, user_following_id=follower))
+if __name__ == '__main__':
+    generate(parse_args())
@@ -1,14 +1,223 @@
-"""Support functions for CSV generation."""
+"""Support functions for CSV generation.
 
-from datetime import datetime
-from random import uniform
+Everything here is fixed data or pure NumPy, so generating needs no
+network access and the same seed always gives the same CSVs.
+"""
 
+import numpy as np
 
-def get_random_datetime(year_gap=2):
-    """Get a random datetime within the last few years."""
+PASSWORD = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
 
-    now = datetime.now()
-    then = now.replace(year=now.year - year_gap)
-    random_timestamp = uniform(then.timestamp(), now.timestamp())
+IMAGE_URLS = [
+    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
+    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
+    for i in range(count)
+]
 
-    return datetime.fromtimestamp(random_timestamp)
+# The splashbase images the old generator looked up over HTTP each run
+HEADER_IMAGE_URL = "https://splashbase.s3.amazonaws.com/unsplash/regular/{}"
+HEADER_IMAGES = [
+    'tumblr_mnh0n9pHJW1st5lhmo1_1280.jpg',
+    'tumblr_mnh0uemhCk1st5lhmo1_1280.jpg',
+    'tumblr_mnh121HEWa1st5lhmo1_1280.jpg',
+    'tumblr_mnh17lfd9R1st5lhmo1_1280.jpg',
+    'tumblr_mnh1d7s3UD1st5lhmo1_1280.jpg',
+    'tumblr_mnh1jdFvHR1st5lhmo1_1280.jpg',
+    'tumblr_mnh1uhYnog1st5lhmo1_1280.jpg',
+    'tumblr_mnh25vNOvI1st5lhmo1_1280.jpg',
+    'tumblr_mnh29fxz111st5lhmo1_1280.jpg',
+    'tumblr_mnh2m1hnS81st5lhmo1_1280.jpg',
+    'tumblr_mo1h6tGOZf1st5lhmo1_1280.jpg',
+    'tumblr_mo2wz2LTCs1st5lhmo1_1280.jpg',
+    'tumblr_mo2x3aAnRH1st5lhmo1_1280.jpg',
+    'tumblr_mo2x80NkDu1st5lhmo1_1280.jpg',
+    'tumblr_mo2x9xqeef1st5lhmo1_1280.jpg',
+    'tumblr_mo2xbk8JUK1st5lhmo1_1280.jpg',
+    'tumblr_mo2xdqmle51st5lhmo1_1280.jpg',
+    'tumblr_mo2xfarCvW1st5lhmo1_1280.jpg',
+    'tumblr_mo2xgqdEFn1st5lhmo1_1280.jpg',
+    'tumblr_mo2xijE2nr1st5lhmo1_1280.jpg',
+    'tumblr_mopq4kHmAg1st5lhmo1_1280.jpg',
+    'tumblr_mopq69jlcS1st5lhmo1_1280.jpg',
+    'tumblr_mopq8fyQwI1st5lhmo1_1280.jpg',
+    'tumblr_mopqamedKu1st5lhmo1_1280.jpg',
+    'tumblr_mopqc3ZZcz1st5lhmo1_1280.jpg',
+    'tumblr_mopqdfx05t1st5lhmo1_1280.jpg',
+    'tumblr_mopqfpSTPN1st5lhmo1_1280.jpg',
+    'tumblr_mopqhxFulr1st5lhmo1_1280.jpg',
+    'tumblr_mopqj9QUeq1st5lhmo1_1280.jpg',
+    'tumblr_mopqkkwK2M1st5lhmo1_1280.jpg',
+    'tumblr_mp6rzyNlAN1st5lhmo1_1280.jpg',
+    'tumblr_mp6s1hAudo1st5lhmo1_1280.jpg',
+    'tumblr_mp6s32zb6l1st5lhmo1_1280.jpg',
+    'tumblr_mp6s4dzqHA1st5lhmo1_1280.jpg',
+    'tumblr_mp6s661UgK1st5lhmo1_1280.jpg',
+    'tumblr_mp6s7lR1lS1st5lhmo1_1280.jpg',
+    'tumblr_mp6s995bvI1st5lhmo1_1280.jpg',
+    'tumblr_mp6sasSvPZ1st5lhmo1_1280.jpg',
+    'tumblr_mp6scv2xrZ1st5lhmo1_1280.jpg',
+    'tumblr_mpp6f50W261st5lhmo1_1280.jpg',
+    'tumblr_mpp6gwrYvm1st5lhmo1_1280.jpg',
+    'tumblr_mpp6l06zXi1st5lhmo1_1280.jpg',
+    'tumblr_mpp6poZxE51st5lhmo1_1280.jpg',
+    'tumblr_mpp6tjdFhf1st5lhmo1_1280.jpg',
+    'tumblr_mpp6w0dxAm1st5lhmo1_1280.jpg',
+]
+
+HEADER_IMAGE_URLS = [HEADER_IMAGE_URL.format(name) for name in HEADER_IMAGES]
+
+WORDS = """
+    ability able about above accept according account across act action
+    activity actually add address adult affect after again against age
+    agency agent ago agree air all allow almost alone along already also
+    although always among amount analysis and animal another answer any
+    anyone anything appear apply approach area argue arm around arrive art
+    article artist as ask assume attack attention audience author available
+    avoid away baby back bad bag ball bank bar base be beat beautiful
+    because become bed before begin behavior behind believe benefit best
+    better between beyond big bill billion bit black blood blue board body
+    book born both box boy break bring brother budget build building
+    business but buy by call camera campaign can cancer candidate capital
+    car card care career carry case catch cause cell center central century
+    certain chair challenge chance change character charge check child
+    choice choose church citizen city civil claim class clear close coach
+    cold collection college color come commercial common community company
+    compare computer concern condition conference consider consumer contain
+    continue control cost could country couple course court cover create
+    crime cultural culture cup current customer cut dark data daughter day
+    dead deal death debate decade decide decision deep defense degree
+    democratic describe design despite detail determine develop difference
+    different difficult dinner direction director discover discuss disease
+    do doctor dog door down draw dream drive drop drug during each early
+    east easy eat economic economy edge education effect effort eight
+    either election else employee end energy enjoy enough enter entire
+    environment especially establish even evening event ever every evidence
+    exactly example executive exist expect experience expert explain eye
+    face fact factor fail fall family far fast father fear federal feel
+    field fight figure fill film final finally financial find fine finger
+    finish fire firm first fish five floor fly focus follow food foot for
+    force foreign forget form former forward four free friend from front
+    full fund future game garden gas general generation get girl give glass
+    go goal good government great green ground group grow growth guess gun
+    guy hair half hand hang happen happy hard have he head health hear
+    heart heat heavy help her here herself high him himself his history hit
+    hold home hope hospital hot hotel hour house how however huge human
+    hundred husband idea identify image imagine impact important improve
+    include including increase indeed indicate individual industry
+    information inside instead institution interest interesting
+    international interview into investment involve issue item its itself
+    job join just keep key kid kill kind kitchen know knowledge land
+    language large last late later laugh law lawyer lay lead leader learn
+    least leave left leg legal less let letter level lie life light like
+    likely line list listen little live local long look lose loss lot love
+    low machine magazine main maintain major majority make man manage
+    management manager many market marriage material matter may maybe me
+    mean measure media medical meet meeting member memory mention message
+    method middle might military million mind minute miss mission model
+    modern moment money month more morning most mother mouth move movement
+    movie much music must myself name nation national natural nature near
+    nearly necessary need network never new news newspaper next nice night
+    none nor north not note nothing notice now number occur off offer
+    office officer official often oil old once one only onto open operation
+    opportunity option order organization other others our out outside over
+    own owner page pain painting paper parent part participant particular
+    partner party pass past patient pattern pay peace people per perform
+    performance perhaps period person personal phone physical pick picture
+    piece place plan plant play player point police policy political
+    politics poor popular population position positive possible power
+    practice prepare present president pressure pretty prevent price
+    private probably problem process produce product production
+    professional professor program project property protect prove provide
+    public pull purpose push put quality question quickly quite race radio
+    raise range rate rather reach read ready real reality realize really
+    reason receive recent recently recognize record red reduce reflect
+    region relate relationship religious remain remember remove report
+    represent republican require research resource respond response rest
+    result return reveal rich right rise risk road rock role room rule run
+    safe same save say scene school science scientist score sea season seat
+    second section security see seek seem sell send senior sense series
+    serious serve service set seven several shake share she shoot short
+    shot should shoulder show side sign significant similar simple simply
+    since sing single sister sit site situation six size skill skin small
+    smile so social society soldier some somebody someone something
+    sometimes son song soon sort sound source south southern space speak
+    special specific speech spend sport spring staff stage stand standard
+    star start state statement station stay step still stock stop store
+    story strategy street strong structure student study stuff style
+    subject success successful such suddenly suffer suggest summer support
+    sure surface system table take talk task tax teach teacher team
+    technology television tell ten tend term test than thank that the their
+    them themselves then theory there these they thing think third this
+    those though thought thousand threat three through throughout throw
+    thus time to today together tonight too top total tough toward town
+    trade traditional training travel treat treatment tree trial trip
+    trouble true truth try turn two type under understand unit until up
+    upon us use usually value various very victim view violence visit voice
+    vote wait walk wall want war watch water way we weapon wear week weight
+    well west western what whatever when where whether which while white
+    who whole whom whose why wide wife will win wind window wish with
+    within without woman wonder word work worker world worry would write
+    writer wrong yard yeah year yes yet you young your yourself
+""".split()
+
+PLACES = """
+    Ash Bay Bridge Brook Cedar Cliff Cove Dale East Elm Fair Field Ford
+    Glen Green Hill Lake Land Maple Mill Moor North Oak Park Pine Port
+    River Rock Rose South Spring Stone Sun Vale West Wood
+""".split()
+
+PLACE_SUFFIXES = ['', 'ton', 'ville', 'burgh', 'ford', 'field', 'mouth',
+                  'side', 'view', 'haven']
+
+
+def zipf(rng, n, exponent, size):
+    """Sample `size` ranks in 1..n with P(rank) roughly rank ** -exponent.
+
+    Inverts the continuous power law, so it takes no memory per rank and
+    suits millions of users.
+    """
+
+    u = rng.random(size)
+
+    if exponent == 1:
+        ranks = np.power(n + 1.0, u)
+    else:
+        a = 1.0 - exponent
+        ranks = np.power(u * (np.power(n + 1.0, a) - 1.0) + 1.0, 1.0 / a)
+
+    return np.clip(ranks.astype(np.int64), 1, n)
+
+
+def scramble(ranks, n, seed):
+    """Map ranks 1..n onto ids 1..n in a fixed, seed-dependent order.
+
+    So the most popular (or most active) users aren't simply the lowest
+    ids. Multiplying by a number coprime to n is a permutation mod n.
+    """
+
+    rng = np.random.default_rng([seed, n])
+    step = int(rng.integers(1, max(n, 2)))
+    while np.gcd(step, n) != 1:
+        step += 1
+    offset = int(rng.integers(0, n))
+
+    return (((ranks - 1) * step + offset) % n) + 1
+
+
+def sentences(rng, count, min_words, max_words, max_length):
+    """`count` random sentences of WORDS, each at most `max_length` long."""
+
+    lengths = rng.integers(min_words, max_words + 1, count).tolist()
+    words = rng.integers(0, len(WORDS), (count, max_words)).tolist()
+
+    return [(' '.join([WORDS[word] for word in row[:length]]).capitalize()
+             + '.')[:max_length]
+            for row, length in zip(words, lengths)]
+
+
+def timestamps(seconds):
+    """Format epoch `seconds` like '2017-01-21 11:04:53.522807'."""
+
+    moments = (np.asarray(seconds) * 1e6).astype('datetime64[us]')
+    return np.char.replace(np.datetime_as_string(moments, unit='us'),
+                           'T', ' ').tolist()
@@ -0,0 +1,42 @@
+"""gunicorn settings, read from here when gunicorn starts in this directory."""
+
+import glob
+import os
+import tempfile
+
+# Workers keep their metrics in files here, so /metrics can add up all of
+# them (see metrics.py). Set before any worker imports prometheus_client.
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'warbler-metrics'))
+
+# Rendered pages' tag versions must be shared by the workers, or a write
+# in one never invalidates the others' copies (see cache.py). Used as the
+# RESPONSE_CACHE_STORE when there is more than one worker and none is set.
+cache_file = os.path.join(tempfile.gettempdir(), 'warbler-cache.db')
+
+# Threaded workers, so a request waiting on the bcrypt pool (passwords.py)
+# or the database leaves its worker free to serve others. Keep DB_POOL_SIZE
+# plus DB_MAX_OVERFLOW at or above the thread count.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+
+def on_starting(server):
+    # Files left by an earlier run would be counted again
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+        os.remove(path)
+
+    # Set before the workers fork and import the app (so not with --preload)
+    if server.cfg.workers > 1 and not os.environ.get('RESPONSE_CACHE_STORE'):
+        # Pages rendered by an earlier run may come from older code
+        for path in glob.glob(cache_file + '*'):
+            os.remove(path)
+        os.environ['RESPONSE_CACHE_STORE'] = f'sqlite:///{cache_file}'
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,159 @@
+"""The logged-in user for the current request.
+
+Rather than loading the user's row before every request, the (signed)
+session carries a small snapshot of the fields the page chrome needs,
+stamped with the row's `version`. `g.user` is then a CurrentUser that
+answers those fields from the snapshot and only loads the full row the
+first time anything else is asked of it.
+
+The version is bumped whenever the snapshotted fields change (see
+`User.version`). A stale snapshot is replaced as soon as the full row is
+loaded, and straight away in the worker that made the change. Requests
+that may write check the row's version and `deleted_at` first, since
+other workers don't know about changes made elsewhere.
+"""
+
+from flask import abort, current_app, flash, redirect, request, session
+
+from cache import LRU
+from models import db, User, Follows, LikedMessage
+from replicas import SAFE_METHODS
+
+SNAPSHOT_KEY = 'curr_user_snapshot'
+SNAPSHOT_FIELDS = ('id', 'username', 'image_url', 'header_image_url',
+                   'version')
+
+# Latest version of each user this worker has changed, for the most
+# recently changed ones (DELETED once deleted). An evicted user's stale
+# snapshot is still caught when the full row is next loaded.
+LATEST_VERSIONS_SIZE = 10000
+DELETED = object()
+_latest_versions = LRU(LATEST_VERSIONS_SIZE)
+
+
+def snapshot(user):
+    """The fields of `user` kept in the session."""
+
+    return {field: getattr(user, field) for field in SNAPSHOT_FIELDS}
+
+
+def remember(user):
+    """Store a fresh snapshot of `user` (after login or a profile change)."""
+
+    _latest_versions.set(user.id, user.version)
+
+    if current_app.config['USER_SNAPSHOT_IN_SESSION']:
+        session[SNAPSHOT_KEY] = snapshot(user)
+
+
+def forget():
+    """Drop the snapshot from the session (on logout)."""
+
+    session.pop(SNAPSHOT_KEY, None)
+
+
+def forget_deleted(user_id):
+    """Invalidate any snapshot of a user whose account has been deleted."""
+
+    forget()
+    _latest_versions.set(user_id, DELETED)
+
+
+def is_current(snap, user_id):
+    if snap is None or snap['id'] != user_id:
+        return False
+
+    latest = _latest_versions.get(user_id)
+    return latest is None or latest == snap['version']
+
+
+def is_confirmed(snap):
+    """Does the database agree that `snap` is current?
+
+    One lookup of two columns, made before trusting a snapshot with a
+    write: this worker may never have heard of a change or deletion.
+    """
+
+    row = (db.session
+           .query(User.version, User.deleted_at)
+           .filter(User.id == snap['id'])
+           .first())
+
+    return (row is not None and row.deleted_at is None
+            and row.version == snap['version'])
+
+
+def current_user(user_id):
+    """The user to put on `g` for a session logged in as `user_id`.
+
+    Returns a CurrentUser if the session has a usable snapshot (confirmed
+    against the database unless the request is read-only), otherwise
+    loads the row (and snapshots it for next time). Returns None if the
+    user no longer exists or has deleted their account.
+    """
+
+    snap = session.get(SNAPSHOT_KEY)
+
+    if (current_app.config['USER_SNAPSHOT_IN_SESSION']
+            and is_current(snap, user_id)
+            and (request.method in SAFE_METHODS or is_confirmed(snap))):
+        return CurrentUser(snap)
+
+    user = User.query.get(user_id)
+    if user is None or user.deleted_at:
+        forget_deleted(user_id)
+        return None
+
+    remember(user)
+
+    return user
+
+
+class CurrentUser:
+    """Stand-in for the logged-in User, backed by the session snapshot.
+
+    Snapshot fields are answered without touching the database; anything
+    else loads the User row (once per request) and is passed through to
+    it.
+    """
+
+    def __init__(self, snap):
+        self._snapshot = snap
+        self._row = None
+
+    def __repr__(self):
+        return f"<CurrentUser #{self._snapshot['id']}>"
+
+    def __getattr__(self, name):
+        if self._row is None and name in self._snapshot:
+            return self._snapshot[name]
+
+        return getattr(self.row, name)
+
+    def followed_ids(self, user_ids):
+        """Which of `user_ids` is this user following? (No row needed.)"""
+
+        return Follows.followed_ids(self.id, user_ids)
+
+    def liked_message_ids(self, message_ids):
+        """Which of `message_ids` has this user liked? (No row needed.)"""
+
+        return LikedMessage.liked_ids(self.id, message_ids)
+
+    @property
+    def row(self):
+        """The full User row, loaded on first use."""
+
+        if self._row is None:
+            self._row = User.query.get(self._snapshot['id'])
+
+            if self._row is None or self._row.deleted_at:
+                # Deleted since the snapshot was taken (in another worker).
+                forget_deleted(self._snapshot['id'])
+                flash("Access unauthorized.", "danger")
+                abort(redirect("/login"))
+
+            if self._row.version != self._snapshot['version']:
+                remember(self._row)
+
+        return self._row
@@ -0,0 +1,107 @@
+"""Index report, from the database's own statistics (`flask index-report`).
+
+- Missing: indexes the models declare that the database doesn't have;
+  `flask db upgrade` adds them.
+- Unused: indexes never scanned, other than those backing a primary key
+  or unique constraint. Each one still slows every write to its table.
+- Scanned: big tables read by sequential scans more often than through an
+  index, where some query probably lacks one.
+
+Postgres counts scans per server since its statistics were last reset,
+and GET requests read from replicas when there are any (see
+replicas.py), so check a replica too before dropping an "unused" index.
+Other databases only get the missing check.
+"""
+
+import warnings
+
+from sqlalchemy import exc, inspect
+
+from models import db
+
+# Tables smaller than this are cheap to scan whole, index or not
+MIN_ROWS = 10000
+
+
+def missing_indexes(engine):
+    """(table, index) for each declared index the database lacks."""
+
+    inspector = inspect(engine)
+    missing = []
+
+    for table in db.metadata.sorted_tables:
+        with warnings.catch_warnings():
+            # search.py's expression indexes can't be reflected, and
+            # needn't be
+            warnings.simplefilter('ignore', exc.SAWarning)
+            present = {index['name']
+                       for index in inspector.get_indexes(table.name)}
+
+        missing.extend((table.name, index.name)
+                       for index in sorted(table.indexes,
+                                           key=lambda index: index.name)
+                       if index.name not in present)
+
+    return missing
+
+
+def unused_indexes(engine):
+    """(table, index, bytes) for each index never scanned, biggest first."""
+
+    return engine.execute(db.text("""
+        SELECT s.relname, s.indexrelname, pg_relation_size(s.indexrelid)
+        FROM pg_stat_user_indexes s
+        JOIN pg_index i ON i.indexrelid = s.indexrelid
+        WHERE s.schemaname = current_schema()
+          AND s.idx_scan = 0
+          AND NOT i.indisunique
+          AND NOT i.indisprimary
+        ORDER BY pg_relation_size(s.indexrelid) DESC, s.indexrelname
+    """)).fetchall()
+
+
+def scanned_tables(engine, min_rows=MIN_ROWS):
+    """(table, sequential scans, rows they read, index scans, rows) for
+    tables of `min_rows` or more mostly read by sequential scans."""
+
+    return engine.execute(db.text("""
+        SELECT relname, seq_scan, seq_tup_read, COALESCE(idx_scan, 0),
+               n_live_tup
+        FROM pg_stat_user_tables
+        WHERE schemaname = current_schema()
+          AND n_live_tup >= :min_rows
+          AND seq_scan > COALESCE(idx_scan, 0)
+        ORDER BY seq_tup_read DESC
+    """), min_rows=min_rows).fetchall()
+
+
+def report(engine, min_rows=MIN_ROWS):
+    """The report, as lines of text."""
+
+    lines = [f"Missing: {table}.{index} (run `flask db upgrade`)"
+             for table, index in missing_indexes(engine)]
+
+    if engine.dialect.name != 'postgresql':
+        lines.append("No usage statistics on this database.")
+        return lines
+
+    since = engine.execute(db.text("""
+        SELECT stats_reset FROM pg_stat_database
+        WHERE datname = current_database()
+    """)).scalar()
+    lines.insert(0, f"Statistics of {engine.url.database} since "
+                    f"{since or 'the database was created'}")
+
+    lines.extend(f"Unused: {table}.{index} ({size:,} bytes)"
+                 for table, index, size in unused_indexes(engine))
+
+    lines.extend(f"Scanned: {table} has {rows:,} rows; {seq_scans:,} "
+                 f"sequential scans read {read:,} rows, vs {idx_scans:,} "
+                 f"index scans"
+                 for table, seq_scans, read, idx_scans, rows
+                 in scanned_tables(engine, min_rows))
+
+    if len(lines) == 1:
+        lines.append("Nothing to report.")
+
+    return lines
@@ -0,0 +1,144 @@
+"""Writing likes.
+
+`write(action, user_id, message_id)` likes, unlikes or toggles a like,
+adjusts the liker's counters and commits. Each action is one or two
+conditional statements on liked_messages (see LikedMessage.like, unlike
+and toggle), so its cost doesn't depend on how many messages the user
+has liked.
+
+With LIKE_GROUP_COMMIT on, writes are handed to a background thread in
+each worker, which gathers whatever arrives within LIKE_GROUP_COMMIT_MS
+(up to LIKE_GROUP_COMMIT_MAX writes) and applies it all in one
+transaction. A burst of likes then costs one commit rather than one
+each. Each request still waits until its own write has been committed.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+
+from models import db, LikedMessage
+import counters
+
+ACTIONS = ('like', 'unlike', 'toggle')
+
+
+def apply(action, user_id, message_id):
+    """Apply one write in the current transaction.
+
+    Returns whether the message is now liked.
+    """
+
+    if action == 'like':
+        liked, changed = True, LikedMessage.like(user_id, message_id)
+    elif action == 'unlike':
+        liked, changed = False, LikedMessage.unlike(user_id, message_id)
+    elif action == 'toggle':
+        liked, changed = LikedMessage.toggle(user_id, message_id), True
+    else:
+        raise ValueError(f"Unknown like action: {action}")
+
+    if changed:
+        counters.adjust(user_id, likes=1 if liked else -1)
+
+    return liked
+
+
+def write(action, user_id, message_id):
+    """Apply and commit one write, grouped with others if configured.
+
+    Returns whether the message is now liked.
+    """
+
+    if current_app.config['LIKE_GROUP_COMMIT']:
+        app = current_app._get_current_object()
+        return group_committer.submit(app, action, user_id, message_id)
+
+    liked = apply(action, user_id, message_id)
+    db.session.commit()
+
+    return liked
+
+
+class GroupCommitter:
+    """Background thread committing like writes in small groups."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = None
+        self.thread = None
+        self.pid = None
+
+    def submit(self, app, action, user_id, message_id):
+        """Queue a write and wait for the group it joins to commit."""
+
+        future = Future()
+        self.running(app).put((future, action, user_id, message_id))
+
+        return future.result()
+
+    def running(self, app):
+        """The queue of a live committer thread (started after a fork too)."""
+
+        with self.lock:
+            if (self.thread is None or self.pid != os.getpid()
+                    or not self.thread.is_alive()):
+                self.queue = queue.Queue()
+                self.thread = threading.Thread(target=self.run,
+                                               args=(app, self.queue),
+                                               name='like-group-commit',
+                                               daemon=True)
+                self.pid = os.getpid()
+                self.thread.start()
+
+            return self.queue
+
+    def run(self, app, writes):
+        with app.app_context():
+            window = app.config['LIKE_GROUP_COMMIT_MS'] / 1000
+            limit = app.config['LIKE_GROUP_COMMIT_MAX']
+
+            while True:
+                group = [writes.get()]
+                deadline = time.monotonic() + window
+
+                while len(group) < limit:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        group.append(writes.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+
+                self.commit(group)
+
+    def commit(self, group):
+        try:
+            results = [apply(*write) for _, *write in group]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+        else:
+            for (future, *_), liked in zip(group, results):
+                future.set_result(liked)
+            return
+
+        # One bad write (say, for a message deleted meanwhile) shouldn't
+        # fail the rest of the group, so fall back to one at a time.
+        for future, *write in group:
+            try:
+                liked = apply(*write)
+                db.session.commit()
+            except Exception as exc:
+                db.session.rollback()
+                future.set_exception(exc)
+            else:
+                future.set_result(liked)
+
+
+group_committer = GroupCommitter()
@@ -0,0 +1,134 @@
+"""Prometheus metrics, served at /metrics.
+
+Exposes request latency per endpoint, response counts per status,
+template render time, bcrypt time and the database connection pool's
+checked-out and overflow connections.
+
+Under gunicorn each worker is its own process with its own counters.
+gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR at a directory where
+every worker keeps its values in mmap'd files, and /metrics (served by
+whichever worker gets the scrape) adds them all up. Without that
+variable, as under `flask run` or in tests, values live in memory.
+"""
+
+import os
+import time
+
+from flask import Response, g, request
+from flask import before_render_template, template_rendered
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram,
+                               CONTENT_TYPE_LATEST, REGISTRY, generate_latest)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+
+REQUEST_SECONDS = Histogram(
+    'warbler_request_duration_seconds',
+    "Time to handle a request, including streaming its body.",
+    ['method', 'endpoint'])
+
+RESPONSES = Counter(
+    'warbler_responses_total', "Responses sent.",
+    ['method', 'endpoint', 'status'])
+
+TEMPLATE_SECONDS = Histogram(
+    'warbler_template_render_seconds', "Time to render a whole template.",
+    ['template'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1))
+
+BCRYPT_SECONDS = Histogram(
+    'warbler_bcrypt_seconds',
+    "Time to hash or check a password, waiting for the pool included.",
+    ['operation'],
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+
+# Each worker sets its own pools' numbers; scrapes add up the live ones.
+# `database` is 'primary' or a replica's bind key.
+POOL_CHECKED_OUT = Gauge(
+    'warbler_db_pool_checked_out', "Database connections in use.",
+    ['database'], multiprocess_mode='livesum')
+
+POOL_OVERFLOW = Gauge(
+    'warbler_db_pool_overflow',
+    "Database connections open beyond the pool size.",
+    ['database'], multiprocess_mode='livesum')
+
+
+class Metrics:
+    """Flask extension collecting metrics and serving /metrics."""
+
+    def init_app(self, app, db):
+        app.config.setdefault('METRICS', True)
+        if not app.config['METRICS']:
+            return
+
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+        before_render_template.connect(self.start_render, app)
+        template_rendered.connect(self.finish_render, app)
+
+        with app.app_context():
+            self.watch_pool('primary', db.get_engine().pool)
+            for bind in app.config.get('SQLALCHEMY_REPLICAS', []):
+                self.watch_pool(bind, db.get_engine(bind=bind).pool)
+
+    def watch_pool(self, database, pool):
+        # NullPool (sqlite) doesn't keep count
+        if hasattr(pool, 'checkedout'):
+            update = lambda *args: self.update_pool(database, pool)
+            event.listen(pool, 'checkout', update)
+            event.listen(pool, 'checkin', update)
+
+    def start(self):
+        g.metrics_started = time.perf_counter()
+
+    def finish(self, response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+
+        method = request.method
+        # Unrouted paths all count as one, to keep the label set small
+        endpoint = request.endpoint or 'none'
+        RESPONSES.labels(method, endpoint, response.status_code).inc()
+
+        def observe():
+            REQUEST_SECONDS.labels(method, endpoint).observe(
+                time.perf_counter() - started)
+
+        # Streamed pages are done when their body is
+        if response.is_streamed:
+            response.call_on_close(observe)
+        else:
+            observe()
+
+        return response
+
+    def start_render(self, app, template, context):
+        g.setdefault('metrics_renders', []).append(time.perf_counter())
+
+    def finish_render(self, app, template, context):
+        renders = g.get('metrics_renders')
+        if renders:
+            TEMPLATE_SECONDS.labels(template.name).observe(
+                time.perf_counter() - renders.pop())
+
+    def update_pool(self, database, pool):
+        POOL_CHECKED_OUT.labels(database).set(pool.checkedout())
+        POOL_OVERFLOW.labels(database).set(max(pool.overflow(), 0))
+
+    def view(self):
+        """Every metric, in Prometheus' text format."""
+
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+
+        return Response(generate_latest(registry),
+                        content_type=CONTENT_TYPE_LATEST)
+
+
+metrics = Metrics()
@@ -0,0 +1,190 @@
+"""schema since baseline
+
+Brings a database made by db.create_all() from the original models up to
+date:
+
+- users gets its version, fan-out, counter, validator and deleted_at
+  columns, with server defaults so existing rows fill in. The counters
+  are then counted, and the fan-out flags set, from the existing rows.
+- timeline_entries is created and filled with each follower's share of
+  the newest TIMELINE_BACKFILL_LIMIT messages of everyone they follow.
+- message_terms is created. It is only read where the database has no
+  full-text index; there, run `flask reindex-messages` afterwards.
+- On Postgres, the full-text index on messages and (where pg_trgm is
+  available) the trigram index on usernames are built CONCURRENTLY.
+  search.py only makes them when it creates the tables itself.
+
+Anything already there (on a database made by create_all since) is left
+alone.
+
+Revision ID: 81f6b865549c
+Revises:
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '81f6b865549c'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+USER_COLUMNS = [
+    sa.Column('version', sa.Integer, nullable=False, server_default='1'),
+    sa.Column('fanout_on_read', sa.Boolean, nullable=False,
+              server_default=sa.false()),
+    sa.Column('messages_count', sa.Integer, nullable=False,
+              server_default='0'),
+    sa.Column('following_count', sa.Integer, nullable=False,
+              server_default='0'),
+    sa.Column('followers_count', sa.Integer, nullable=False,
+              server_default='0'),
+    sa.Column('likes_count', sa.Integer, nullable=False, server_default='0'),
+    sa.Column('follows_version', sa.Integer, nullable=False,
+              server_default='1'),
+    sa.Column('likes_version', sa.Integer, nullable=False,
+              server_default='1'),
+    sa.Column('updated_at', sa.DateTime, nullable=False,
+              server_default=sa.func.now()),
+    sa.Column('deleted_at', sa.DateTime, nullable=True),
+]
+
+RECOUNT = """
+    UPDATE users SET
+        messages_count = (SELECT count(*) FROM messages
+                          WHERE messages.user_id = users.id),
+        following_count = (SELECT count(*) FROM follows
+                           WHERE follows.user_following_id = users.id),
+        followers_count = (SELECT count(*) FROM follows
+                           WHERE follows.user_being_followed_id = users.id),
+        likes_count = (SELECT count(*) FROM liked_messages
+                       WHERE liked_messages.user_id_like = users.id)
+"""
+
+FANOUT_MODE = """
+    UPDATE users SET fanout_on_read = (followers_count >= :limit)
+"""
+
+FILL_TIMELINES = """
+    INSERT INTO timeline_entries (user_id, message_id, author_id, timestamp)
+    SELECT follows.user_following_id, ranked.id, ranked.user_id,
+           ranked.timestamp
+    FROM (
+        SELECT messages.id, messages.user_id, messages.timestamp,
+               row_number() OVER (PARTITION BY messages.user_id
+                                  ORDER BY messages.timestamp DESC,
+                                           messages.id DESC) AS rank
+        FROM messages JOIN users ON users.id = messages.user_id
+        WHERE NOT users.fanout_on_read
+    ) AS ranked
+    JOIN follows ON follows.user_being_followed_id = ranked.user_id
+    WHERE ranked.rank <= :limit
+"""
+
+TRIGRAM_INDEX = ('ix_users_username_trgm',
+                 "ON users USING gin (username gin_trgm_ops)")
+FULLTEXT_INDEX = ('ix_messages_text_fulltext',
+                  "ON messages USING gin (to_tsvector('english', text))")
+
+
+def inspector():
+    return sa.inspect(op.get_bind())
+
+
+def columns(table):
+    return {column['name'] for column in inspector().get_columns(table)}
+
+
+def create_indexes(postgres_indexes):
+    for name, definition in postgres_indexes:
+        op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                   f"{definition}")
+
+
+def upgrade():
+    config = current_app.config
+    bind = op.get_bind()
+    tables = set(inspector().get_table_names())
+    have = columns('users')
+
+    missing = [column for column in USER_COLUMNS if column.name not in have]
+    if missing:
+        # SQLite can't add a column defaulting to now() in place
+        recreate = 'always' if bind.dialect.name == 'sqlite' else 'auto'
+        with op.batch_alter_table('users', recreate=recreate) as batch:
+            for column in missing:
+                batch.add_column(column.copy())
+
+    if 'messages_count' not in have:
+        bind.execute(sa.text(RECOUNT))
+    if 'fanout_on_read' not in have:
+        bind.execute(sa.text(FANOUT_MODE),
+                     limit=config['TIMELINE_FANOUT_LIMIT'])
+
+    if 'timeline_entries' not in tables:
+        op.create_table(
+            'timeline_entries',
+            sa.Column('user_id', sa.Integer,
+                      sa.ForeignKey('users.id', ondelete='cascade'),
+                      primary_key=True),
+            sa.Column('message_id', sa.Integer,
+                      sa.ForeignKey('messages.id', ondelete='cascade'),
+                      primary_key=True),
+            sa.Column('author_id', sa.Integer,
+                      sa.ForeignKey('users.id', ondelete='cascade'),
+                      nullable=False),
+            sa.Column('timestamp', sa.DateTime, nullable=False),
+        )
+        bind.execute(sa.text(FILL_TIMELINES),
+                     limit=config['TIMELINE_BACKFILL_LIMIT'])
+        # After filling, so the rows don't go in one index entry at a time
+        op.create_index('ix_timeline_entries_user_timestamp',
+                        'timeline_entries',
+                        ['user_id', 'timestamp', 'message_id'])
+        op.create_index('ix_timeline_entries_user_author',
+                        'timeline_entries', ['user_id', 'author_id'])
+
+    if 'message_terms' not in tables:
+        op.create_table(
+            'message_terms',
+            sa.Column('term', sa.Text, primary_key=True),
+            sa.Column('message_id', sa.Integer,
+                      sa.ForeignKey('messages.id', ondelete='cascade'),
+                      primary_key=True),
+            sa.Column('count', sa.Integer, nullable=False),
+        )
+        op.create_index('ix_message_terms_message_id', 'message_terms',
+                        ['message_id'])
+
+    if bind.dialect.name != 'postgresql':
+        return
+
+    trigram = bind.execute(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    ).scalar()
+
+    # CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        postgres_indexes = [FULLTEXT_INDEX]
+        if trigram:
+            op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            postgres_indexes.append(TRIGRAM_INDEX)
+        create_indexes(postgres_indexes)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, _ in [TRIGRAM_INDEX, FULLTEXT_INDEX]:
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+    op.drop_table('message_terms')
+    op.drop_table('timeline_entries')
+
+    with op.batch_alter_table('users') as batch:
+        for column in reversed(USER_COLUMNS):
+            batch.drop_column(column.name)
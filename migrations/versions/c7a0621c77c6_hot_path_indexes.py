@@ -0,0 +1,75 @@
+"""hot path indexes
+
+Adds the indexes the hot queries were missing:
+messages by author and time, follows by follower and likes by message.
+The follower index covers the old single-column one, which is dropped.
+
+On Postgres indexes are built CONCURRENTLY, so writes carry on while a
+big table is indexed. Indexes that already exist (on a database made by
+create_all since) are skipped.
+
+Revision ID: c7a0621c77c6
+Revises: 81f6b865549c
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+import warnings
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a0621c77c6'
+down_revision = '81f6b865549c'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_messages_user_timestamp', 'messages',
+     ['user_id', 'timestamp', 'id']),
+    ('ix_follows_following_followed', 'follows',
+     ['user_following_id', 'user_being_followed_id']),
+    ('ix_liked_messages_message_user', 'liked_messages',
+     ['message_id_liked', 'user_id_like']),
+]
+
+REPLACED = [
+    ('ix_follows_user_following_id', 'follows', ['user_following_id']),
+]
+
+
+def existing(table):
+    with warnings.catch_warnings():
+        # search.py's expression indexes can't be reflected, and needn't be
+        warnings.simplefilter('ignore', sa.exc.SAWarning)
+        indexes = sa.inspect(op.get_bind()).get_indexes(table)
+
+    return {index['name'] for index in indexes}
+
+
+def create(indexes):
+    for name, table, columns in indexes:
+        if name not in existing(table):
+            op.create_index(name, table, columns,
+                            postgresql_concurrently=True)
+
+
+def drop(indexes):
+    for name, table, columns in indexes:
+        if name in existing(table):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True)
+
+
+def upgrade():
+    # CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        create(INDEXES)
+        drop(REPLACED)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        create(REPLACED)
+        drop(INDEXES)
@@ -2,11 +2,12 @@
 
 from datetime import datetime
 
-from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql
 
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+from passwords import hasher
+from replicas import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
 
 
 class Follows(db.Model):
@@ -26,6 +27,100 @@ class Follows(db.Model):
         primary_key=True,
     )
 
+    # The key leads with the followed user; this serves "who does X follow"
+    # from the index alone
+    __table_args__ = (
+        db.Index('ix_follows_following_followed',
+                 'user_following_id', 'user_being_followed_id'),
+    )
+
+    @classmethod
+    def follow(cls, follower_id, user_ids):
+        """Have `follower_id` follow each existing user in `user_ids`.
+
+        One INSERT ... SELECT over the users table that skips follows
+        which already exist. Returns the set of ids newly followed.
+        """
+
+        if not user_ids:
+            return set()
+
+        targets = (db.select([User.id, db.literal(follower_id)])
+                   .where(User.id.in_(user_ids))
+                   .where(User.deleted_at.is_(None)))
+        columns = ['user_being_followed_id', 'user_following_id']
+
+        if db.engine.dialect.name == 'postgresql':
+            insert = (postgresql.insert(cls.__table__)
+                      .from_select(columns, targets)
+                      .on_conflict_do_nothing()
+                      .returning(cls.user_being_followed_id))
+
+            return {user_id for (user_id,) in db.session.execute(insert)}
+
+        # No RETURNING: find out what is new before inserting it.
+        already = (db.session
+                   .query(cls.user_being_followed_id)
+                   .filter(cls.user_following_id == follower_id))
+        new_ids = {user_id for (user_id,) in
+                   db.session.query(User.id)
+                             .filter(User.id.in_(user_ids),
+                                     User.deleted_at.is_(None),
+                                     ~User.id.in_(already))}
+
+        if new_ids:
+            db.session.execute(cls.__table__.insert(), [
+                dict(user_being_followed_id=user_id,
+                     user_following_id=follower_id)
+                for user_id in new_ids
+            ])
+
+        return new_ids
+
+    @classmethod
+    def followed_ids(cls, follower_id, user_ids):
+        """Return the set of `user_ids` that `follower_id` follows.
+
+        One query for a whole page of users, however many users
+        `follower_id` follows.
+        """
+
+        if not user_ids:
+            return set()
+
+        followed = (db.session
+                    .query(cls.user_being_followed_id)
+                    .filter(cls.user_following_id == follower_id,
+                            cls.user_being_followed_id.in_(user_ids)))
+
+        return {user_id for (user_id,) in followed}
+
+    @classmethod
+    def unfollow(cls, follower_id, user_ids):
+        """Have `follower_id` stop following each of `user_ids`.
+
+        Returns the set of ids that were actually being followed.
+        """
+
+        if not user_ids:
+            return set()
+
+        where = db.and_(cls.user_following_id == follower_id,
+                        cls.user_being_followed_id.in_(user_ids))
+
+        if db.engine.dialect.name == 'postgresql':
+            delete = (cls.__table__.delete()
+                      .where(where)
+                      .returning(cls.user_being_followed_id))
+
+            return {user_id for (user_id,) in db.session.execute(delete)}
+
+        old_ids = {user_id for (user_id,) in
+                   db.session.query(cls.user_being_followed_id).filter(where)}
+        db.session.execute(cls.__table__.delete().where(where))
+
+        return old_ids
+
 
 class User(db.Model):
     """User in the system."""
@@ -72,25 +167,114 @@ class User(db.Model):
         nullable=False,
     )
 
-    messages = db.relationship('Message', order_by='Message.timestamp.desc()')
+    # Bumped whenever the profile changes, so copies of the user kept
+    # elsewhere (like the session snapshot in identity.py) can tell they
+    # are stale.
+    version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+        server_default='1',
+    )
+
+    # Once an account has TIMELINE_FANOUT_LIMIT followers its messages are
+    # no longer copied into followers' timelines; they are merged in at
+    # read time instead. The flag is sticky so each message only ever
+    # lives in one of the two places.
+    fanout_on_read = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=False,
+    )
+
+    # Denormalized counts for profile pages, kept up to date by the routes
+    # that change them (see counters.py) so nothing has to load a whole
+    # relationship just to take its length.
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # Bumped along with the counts above whenever the user's follows or
+    # likes change, and `updated_at` whenever anything shown about the
+    # user changes; together with `version` they are the validators for
+    # conditional GETs (see conditional.py).
+    follows_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+        server_default='1',
+    )
+
+    likes_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+        server_default='1',
+    )
+
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    # Set when the account is deleted. The user can no longer log in or be
+    # seen, and a background worker purges their rows (see purge.py).
+    deleted_at = db.Column(
+        db.DateTime,
+        nullable=True,
+    )
+
+    # The messages FK cascades on delete, so let the database remove them
+    # rather than the ORM trying to null out their user_id.
+    messages = db.relationship('Message', order_by='Message.timestamp.desc()',
+                               passive_deletes=True)
    
+    # Likewise for follows and likes: their FKs cascade too.
     followers = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_being_followed_id == id),
-        secondaryjoin=(Follows.user_following_id == id)
+        secondaryjoin=(Follows.user_following_id == id),
+        passive_deletes=True,
     )
 
     following = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_following_id == id),
-        secondaryjoin=(Follows.user_being_followed_id == id)
+        secondaryjoin=(Follows.user_being_followed_id == id),
+        passive_deletes=True,
     )
 
     message_likes = db.relationship('Message',
                             secondary='liked_messages',
-                            backref='user_likes')
+                            backref='user_likes',
+                            passive_deletes=True)
 
     def __repr__(self):
         return f"<User #{self.id}: {self.username}, {self.email}>"
@@ -98,17 +282,43 @@ class User(db.Model):
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return Follows.query.get((self.id, other_user.id)) is not None
 
     def is_following(self, other_user):
-        """Is this user following `other_use`?"""
+        """Is this user following `other_user`?"""
+
+        return Follows.query.get((other_user.id, self.id)) is not None
 
-        found_user_list = [user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+    def followed_ids(self, user_ids):
+        """Which of `user_ids` is this user following?"""
+
+        return Follows.followed_ids(self.id, user_ids)
+
+    def liked_message_ids(self, message_ids):
+        """Which of `message_ids` has this user liked?"""
+
+        return LikedMessage.liked_ids(self.id, message_ids)
 
 
 
+    @classmethod
+    def active(cls):
+        """Query of users whose accounts haven't been deleted."""
+
+        return cls.query.filter(cls.deleted_at.is_(None))
+
+    @classmethod
+    def is_available(cls, username, email):
+        """Are `username` and `email` both unused? (one indexed lookup)"""
+
+        taken = (db.session
+                 .query(cls.id)
+                 .filter(db.or_(cls.username == username,
+                                cls.email == email))
+                 .first())
+
+        return taken is None
+
     @classmethod
     def signup(cls, username, email, password, image_url):
         """Sign up user.
@@ -116,7 +326,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = hasher.hash(password)
 
         user = User(
             username=username,
@@ -137,13 +347,18 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        A password hashed at an old cost is rehashed at the current one;
+        the caller commits the change.
         """
 
-        user = cls.query.filter_by(username=username).first()
+        user = cls.active().filter_by(username=username).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = hasher.check(user.password, password)
             if is_auth:
+                if hasher.needs_rehash(user.password):
+                    user.password = hasher.hash(password)
                 return user
 
         return False
@@ -167,7 +382,7 @@ class Message(db.Model):
     timestamp = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow(),
+        default=datetime.utcnow,
     )
 
     user_id = db.Column(
@@ -177,7 +392,14 @@ class Message(db.Model):
         nullable=False,
     )
 
-    user = db.relationship('User')
+    # Authors are always shown alongside messages, so load them for a whole
+    # list of messages in one batched query rather than one per message.
+    user = db.relationship('User', lazy='selectin')
+
+    # A user's messages, newest first (profiles, timeline backfill)
+    __table_args__ = (
+        db.Index('ix_messages_user_timestamp', 'user_id', 'timestamp', 'id'),
+    )
 
 
 
@@ -199,7 +421,139 @@ class LikedMessage(db.Model):
         primary_key=True,
     )
 
+    # The key leads with the user; this finds who liked a message
+    __table_args__ = (
+        db.Index('ix_liked_messages_message_user',
+                 'message_id_liked', 'user_id_like'),
+    )
+
+    @classmethod
+    def liked_ids(cls, user_id, message_ids):
+        """Return the set of `message_ids` that `user_id` has liked.
+
+        This is one primary key lookup per id in a single query, so it
+        costs the same however many messages the user has liked.
+        """
+
+        if not message_ids:
+            return set()
+
+        liked = (db.session
+                 .query(cls.message_id_liked)
+                 .filter(cls.user_id_like == user_id,
+                         cls.message_id_liked.in_(message_ids)))
+
+        return {message_id for (message_id,) in liked}
+
+    @classmethod
+    def like(cls, user_id, message_id):
+        """Record that `user_id` likes `message_id`, if not already.
+
+        One INSERT that skips an existing row (ON CONFLICT DO NOTHING on
+        Postgres, OR IGNORE on SQLite). Returns whether a row was added.
+        """
+
+        values = dict(user_id_like=user_id, message_id_liked=message_id)
+
+        if db.engine.dialect.name == 'postgresql':
+            insert = (postgresql.insert(cls.__table__)
+                      .values(**values)
+                      .on_conflict_do_nothing())
+        else:
+            insert = (cls.__table__.insert()
+                      .values(**values)
+                      .prefix_with('OR IGNORE', dialect='sqlite'))
+
+        return db.session.execute(insert).rowcount == 1
+
+    @classmethod
+    def unlike(cls, user_id, message_id):
+        """Remove a like, if there is one. Returns whether a row was removed."""
+
+        deleted = (cls.query
+                   .filter_by(user_id_like=user_id,
+                              message_id_liked=message_id)
+                   .delete(synchronize_session=False))
+
+        return deleted == 1
+
+    @classmethod
+    def toggle(cls, user_id, message_id):
+        """Unlike the message if it is liked, otherwise like it.
+
+        Returns whether the message is now liked.
+        """
+
+        if cls.unlike(user_id, message_id):
+            return False
+
+        cls.like(user_id, message_id)
+        return True
+
+
+class MessageTerm(db.Model):
+    """Posting of a search term in a message (see search.py).
+
+    Only used where the database has no full-text index of its own.
+    """
+
+    __tablename__ = 'message_terms'
+
+    term = db.Column(
+        db.Text,
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+        index=True,
+    )
+
+    # How many times the term appears in the message
+    count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+    )
+
+
+class TimelineEntry(db.Model):
+    """A message fanned out to one follower's home timeline."""
+
+    __tablename__ = 'timeline_entries'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    author_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        nullable=False,
+    )
+
+    # Copied from the message so the timeline can be read in order
+    # without touching the messages table.
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
 
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_timestamp',
+                 'user_id', 'timestamp', 'message_id'),
+        db.Index('ix_timeline_entries_user_author', 'user_id', 'author_id'),
+    )
 
 
 def connect_db(app):
@@ -0,0 +1,246 @@
+"""Keyset (cursor) pagination for list pages.
+
+Pages are found by comparing against the sort key of the last row shown,
+never with OFFSET, so a deep page costs the same as the first one.
+
+A cursor is the sort key of a row, JSON-encoded and base64'd for the URL.
+`?after=<cursor>` moves further down a list (older messages), and
+`?before=<cursor>` moves back up it (newer messages).
+
+`stream` returns a StreamedPage instead, which reads its rows from a
+server-side cursor while the template is being rendered, so long pages
+don't have to be held in memory.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from itertools import islice
+
+from flask import abort, current_app, request, url_for
+
+from models import db
+
+
+class Page:
+    """One page of rows, with cursors for the pages either side of it."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(values):
+    """Turn a row's sort key into a URL-safe cursor."""
+
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Turn a cursor back into a sort key for `columns`.
+
+    Aborts with a 400 if the cursor has been tampered with.
+    """
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if len(values) != len(columns):
+            raise ValueError(cursor)
+        return [datetime.fromisoformat(value)
+                if column.type.python_type is datetime else value
+                for column, value in zip(columns, values)]
+    except (ValueError, TypeError, binascii.Error):
+        abort(400)
+
+
+def page_args(per_page=None, max_size=None):
+    """Read (after, before, per_page) from the query string."""
+
+    max_size = max_size or current_app.config['MAX_PAGE_SIZE']
+    per_page = request.args.get(
+        'per_page', type=int,
+        default=per_page or current_app.config['PAGE_SIZE'])
+
+    return (request.args.get('after'),
+            request.args.get('before'),
+            max(1, min(per_page, max_size)))
+
+
+def keyset(query, columns, cursor, reverse):
+    """`query` ordered by `columns`, starting just past `cursor`."""
+
+    if cursor is not None:
+        values = decode_cursor(cursor, columns)
+        row = db.tuple_(*columns)
+        mark = db.tuple_(*[db.literal(value, column.type)
+                           for column, value in zip(columns, values)])
+        query = query.filter(row < mark if reverse else row > mark)
+
+    order = [col.desc() if reverse else col.asc() for col in columns]
+    return query.order_by(*order)
+
+
+def fetch(query, columns, after, before, per_page, descending=True):
+    """Fetch up to `per_page` rows of `query` next to a cursor.
+
+    Returns (rows, more), with rows in display order and `more` saying
+    whether there are further rows in the direction of travel.
+    """
+
+    backwards = before is not None and after is None
+    cursor = before if backwards else after
+
+    # Walking backwards is walking forwards in the opposite order.
+    reverse = descending != backwards
+
+    rows = (keyset(query, columns, cursor, reverse)
+            .limit(per_page + 1)
+            .all())
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    return rows, more
+
+
+def build_page(rows, more, key, after, before):
+    """Wrap fetched rows in a Page, working out which neighbours exist.
+
+    `key(row)` returns the row's sort key, in the same order as the
+    columns it was fetched by.
+    """
+
+    backwards = before is not None and after is None
+
+    if backwards:
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = after is not None, more
+
+    next_cursor = prev_cursor = None
+    if has_next:
+        next_cursor = encode_cursor(key(rows[-1])) if rows else before
+    if has_prev and rows:
+        prev_cursor = encode_cursor(key(rows[0]))
+
+    return Page(rows, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def paginate(query, columns, key, descending=True, per_page=None):
+    """Return the Page of `query` (ordered by `columns`) the request asks for."""
+
+    after, before, per_page = page_args(per_page)
+    rows, more = fetch(query, columns, after, before, per_page, descending)
+    return build_page(rows, more, key, after, before)
+
+
+class StreamedPage(Page):
+    """A forward page whose rows are read as it is iterated.
+
+    Rows come from a server-side cursor, `batch_size` at a time, and
+    `on_batch(rows)` is called before each batch is handed out (to look
+    up viewer-specific state for just those rows). The first batch is
+    read up front so the page can tell whether it is empty; the next
+    cursor is only known once iteration has finished, which suits pagers
+    rendered below the list.
+
+    Can only be iterated once.
+    """
+
+    def __init__(self, query, key, after, per_page, batch_size=100,
+                 on_batch=None):
+        super().__init__([])
+        self.key = key
+        self.after = after
+        self.per_page = per_page
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+
+        # One extra row says whether there is a next page.
+        self.rows = iter(query.limit(per_page + 1).yield_per(batch_size))
+        self.first_batch = list(islice(self.rows, batch_size))
+
+    def __len__(self):
+        raise TypeError("a StreamedPage's length isn't known in advance")
+
+    def __bool__(self):
+        return bool(self.first_batch)
+
+    def __iter__(self):
+        remaining = self.per_page
+        batch, self.first_batch = self.first_batch, []
+
+        while batch:
+            more = len(batch) > remaining
+            batch = batch[:remaining]
+
+            if batch:
+                if remaining == self.per_page and self.after is not None:
+                    self.prev_cursor = encode_cursor(self.key(batch[0]))
+
+                if self.on_batch:
+                    self.on_batch(batch)
+
+                yield from batch
+
+                remaining -= len(batch)
+                last = batch[-1]
+
+            if more:
+                self.next_cursor = encode_cursor(self.key(last))
+                break
+
+            batch = list(islice(self.rows, self.batch_size))
+
+
+def stream(query, columns, key, descending=True, per_page=None,
+           max_size=None, on_batch=None):
+    """Like `paginate`, but returns a StreamedPage when moving forwards.
+
+    Backward pages (`?before=`) are small and rare, so they are fetched
+    as usual.
+    """
+
+    after, before, per_page = page_args(per_page, max_size)
+
+    if before is not None and after is None:
+        rows, more = fetch(query, columns, after, before, per_page,
+                           descending)
+        if on_batch and rows:
+            on_batch(rows)
+        return build_page(rows, more, key, after, before)
+
+    return StreamedPage(keyset(query, columns, after, descending),
+                        key, after, per_page, on_batch=on_batch)
+
+
+def page_url(**cursor):
+    """URL for the current page with a different cursor (used by _pager.html)."""
+
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    args.update(cursor)
+
+    return url_for(request.endpoint, **request.view_args, **args)
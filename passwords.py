@@ -0,0 +1,93 @@
+"""Password hashing on a bounded worker pool.
+
+bcrypt is deliberately slow CPU work. Hashing and checking are handed to
+a pool of BCRYPT_POOL_SIZE workers (threads by default, or processes
+with BCRYPT_POOL_KIND = 'process'), so a burst of logins queues for the
+pool instead of pinning every web worker's CPU at once. gunicorn runs
+threaded workers (see gunicorn.conf.py), so other requests keep being
+served meanwhile.
+
+The cost is BCRYPT_LOG_ROUNDS. Hashes made at a different cost are
+reported by `needs_rehash`, so they can be upgraded the next time their
+owner logs in.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+
+from metrics import BCRYPT_SECONDS
+
+
+def _hash(password, log_rounds):
+    return bcrypt.hashpw(password.encode('utf-8'),
+                         bcrypt.gensalt(log_rounds)).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    return bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+
+
+class PasswordHasher:
+    """Hashes and checks passwords on a shared pool of workers."""
+
+    def __init__(self, app=None):
+        self.log_rounds = 12
+        self.pool_size = 2
+        self.pool_kind = 'thread'
+        self._pool = None
+        self._pool_pid = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.log_rounds = app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        self.pool_size = app.config.setdefault('BCRYPT_POOL_SIZE', 2)
+        self.pool_kind = app.config.setdefault('BCRYPT_POOL_KIND', 'thread')
+
+    @property
+    def pool(self):
+        """The worker pool, started lazily (and again after a fork)."""
+
+        if self._pool is None or self._pool_pid != os.getpid():
+            if self.pool_kind == 'process':
+                self._pool = ProcessPoolExecutor(self.pool_size)
+            else:
+                self._pool = ThreadPoolExecutor(self.pool_size,
+                                                thread_name_prefix='bcrypt')
+            self._pool_pid = os.getpid()
+
+        return self._pool
+
+    def hash(self, password):
+        """Hash `password` at the configured cost."""
+
+        if not password:
+            raise ValueError('Password must be non-empty.')
+
+        with BCRYPT_SECONDS.labels('hash').time():
+            return self.pool.submit(_hash, password,
+                                    self.log_rounds).result()
+
+    def check(self, pw_hash, password):
+        """Does `password` match `pw_hash`?"""
+
+        if not pw_hash or not password:
+            return False
+
+        with BCRYPT_SECONDS.labels('check').time():
+            return self.pool.submit(_check, pw_hash, password).result()
+
+    def needs_rehash(self, pw_hash):
+        """Was `pw_hash` made at a different cost than the configured one?"""
+
+        # bcrypt hashes look like $2b$<cost>$<salt and hash>
+        try:
+            return int(pw_hash.split('$')[2]) != self.log_rounds
+        except (IndexError, ValueError):
+            return True
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,230 @@
+"""Deleting accounts.
+
+Deleting a user through the ORM loads their messages, follows and likes
+into memory before deleting any of it, and deletes a prolific account in
+one long transaction. Instead, `disable(user_id)` just stamps the user's
+`deleted_at`, which logs them out everywhere and hides them, and the rows
+are purged afterwards by `purge(user_id)`: messages first (the database
+cascades each one to its likes, timeline entries and search postings),
+then the user's own likes, follows and timeline, and finally the user.
+Each step deletes at most ACCOUNT_PURGE_BATCH rows per transaction and
+keeps the other users' counters in step.
+
+With ACCOUNT_PURGE_IN_BACKGROUND on, purges run on a background thread
+in each worker (see Purger); accounts left disabled by a worker that
+died are purged by `flask purge-accounts`.
+"""
+
+import os
+import queue
+import threading
+from datetime import datetime
+
+from flask import current_app
+
+from models import db, User, Message, Follows, LikedMessage, TimelineEntry
+import cache
+import counters
+import identity
+import search
+
+
+def disable(user_id):
+    """Mark an account as deleted, in the current transaction."""
+
+    (User
+        .query
+        .filter(User.id == user_id)
+        .update({User.deleted_at: datetime.utcnow(),
+                 # Followers' home pages change too (see conditional.py)
+                 User.updated_at: datetime.utcnow(),
+                 User.version: User.version + 1},
+                synchronize_session=False))
+
+
+def delete(user_id):
+    """Disable an account now and purge it (in the background if configured).
+
+    Commits, and invalidates everything cached about the user.
+    """
+
+    disable(user_id)
+    db.session.commit()
+    identity.forget_deleted(user_id)
+    # Their messages, follows and likes showed up all over the place.
+    cache.invalidate(cache.GLOBAL_TAG)
+
+    if current_app.config['ACCOUNT_PURGE_IN_BACKGROUND']:
+        purger.schedule(current_app._get_current_object(), user_id)
+    else:
+        purge(user_id)
+
+
+def purge(user_id):
+    """Delete a disabled account's rows in batches, committing each batch."""
+
+    size = current_app.config['ACCOUNT_PURGE_BATCH']
+
+    for step in (purge_messages, purge_likes, purge_following,
+                 purge_followers, purge_timeline):
+        while step(user_id, size):
+            db.session.commit()
+
+    (User
+        .query
+        .filter(User.id == user_id, User.deleted_at.isnot(None))
+        .delete(synchronize_session=False))
+    db.session.commit()
+    cache.invalidate(cache.GLOBAL_TAG)
+
+
+def purge_pending():
+    """Purge every account still waiting to be. Returns how many."""
+
+    pending = [user_id for (user_id,) in
+               db.session
+                 .query(User.id)
+                 .filter(User.deleted_at.isnot(None))
+                 .order_by(User.deleted_at)]
+    db.session.commit()
+
+    for user_id in pending:
+        purge(user_id)
+
+    return len(pending)
+
+
+def take(column, where, size):
+    """Lock up to `size` rows matching `where`; returns their `column`."""
+
+    rows = (db.session
+            .query(column)
+            .filter(where)
+            .order_by(column)
+            .limit(size)
+            .with_for_update())
+
+    return [value for (value,) in rows]
+
+
+def purge_messages(user_id, size):
+    message_ids = take(Message.id, Message.user_id == user_id, size)
+
+    if message_ids:
+        counters.forget_messages(user_id, message_ids)
+        search.unindex_messages(message_ids)
+        (Message
+            .query
+            .filter(Message.id.in_(message_ids))
+            .delete(synchronize_session=False))
+
+    return len(message_ids)
+
+
+def purge_likes(user_id, size):
+    message_ids = take(LikedMessage.message_id_liked,
+                       LikedMessage.user_id_like == user_id, size)
+
+    if message_ids:
+        (LikedMessage
+            .query
+            .filter(LikedMessage.user_id_like == user_id,
+                    LikedMessage.message_id_liked.in_(message_ids))
+            .delete(synchronize_session=False))
+
+    return len(message_ids)
+
+
+def purge_following(user_id, size):
+    followed_ids = take(Follows.user_being_followed_id,
+                        Follows.user_following_id == user_id, size)
+
+    if followed_ids:
+        (Follows
+            .query
+            .filter(Follows.user_following_id == user_id,
+                    Follows.user_being_followed_id.in_(followed_ids))
+            .delete(synchronize_session=False))
+        counters.adjust(followed_ids, followers=-1)
+
+    return len(followed_ids)
+
+
+def purge_followers(user_id, size):
+    follower_ids = take(Follows.user_following_id,
+                        Follows.user_being_followed_id == user_id, size)
+
+    if follower_ids:
+        (Follows
+            .query
+            .filter(Follows.user_being_followed_id == user_id,
+                    Follows.user_following_id.in_(follower_ids))
+            .delete(synchronize_session=False))
+        counters.adjust(follower_ids, following=-1)
+
+    return len(follower_ids)
+
+
+def purge_timeline(user_id, size):
+    message_ids = take(TimelineEntry.message_id,
+                       TimelineEntry.user_id == user_id, size)
+
+    if message_ids:
+        (TimelineEntry
+            .query
+            .filter(TimelineEntry.user_id == user_id,
+                    TimelineEntry.message_id.in_(message_ids))
+            .delete(synchronize_session=False))
+
+    return len(message_ids)
+
+
+class Purger:
+    """Background thread purging disabled accounts one at a time."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = None
+        self.thread = None
+        self.pid = None
+
+    def schedule(self, app, user_id):
+        self.running(app).put(user_id)
+
+    def wait(self):
+        """Block until every scheduled purge has finished."""
+
+        if self.queue is not None and self.pid == os.getpid():
+            self.queue.join()
+
+    def running(self, app):
+        """The queue of a live purge thread (started after a fork too)."""
+
+        with self.lock:
+            if (self.thread is None or self.pid != os.getpid()
+                    or not self.thread.is_alive()):
+                self.queue = queue.Queue()
+                self.thread = threading.Thread(target=self.run,
+                                               args=(app, self.queue),
+                                               name='account-purge',
+                                               daemon=True)
+                self.pid = os.getpid()
+                self.thread.start()
+
+            return self.queue
+
+    def run(self, app, user_ids):
+        with app.app_context():
+            while True:
+                user_id = user_ids.get()
+                try:
+                    purge(user_id)
+                except Exception:
+                    # Left disabled; `flask purge-accounts` picks it up.
+                    db.session.rollback()
+                    app.logger.exception("Purging user %s failed", user_id)
+                finally:
+                    user_ids.task_done()
+
+
+purger = Purger()
@@ -0,0 +1,47 @@
+"""Count the SQL statements a block of code runs.
+
+Used by the tests to pin down how many queries each route makes, so
+that N+1 query patterns can't creep back in.
+"""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+class QueryCounter:
+    """Context manager recording every statement run on `engine`."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+class QueryCountAssertions:
+    """TestCase mixin for asserting on query counts."""
+
+    @contextmanager
+    def assertMaxQueries(self, limit, engine):
+        """Fail if the block runs more than `limit` statements."""
+
+        with QueryCounter(engine) as counter:
+            yield counter
+
+        if counter.count > limit:
+            self.fail(f"{counter.count} queries run, expected at most "
+                      f"{limit}:\n" + "\n\n".join(counter.statements))
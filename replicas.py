@@ -0,0 +1,96 @@
+"""Reading from replicas.
+
+SQLALCHEMY_REPLICAS names binds (in SQLALCHEMY_BINDS) holding read-only
+copies of the primary database. A safe request (GET, HEAD) reads from one
+of them, picked at random for the whole request; everything else, and
+all background work, uses the primary.
+
+Once a request writes (flushes, or runs an INSERT/UPDATE/DELETE or
+SELECT ... FOR UPDATE) the rest of it goes to the primary. Replicas lag
+behind, so a user who made a POST within the last REPLICA_STICKY_SECONDS
+reads from the primary too, and sees their own changes; the time of
+their last POST is kept in their session.
+"""
+
+import random
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql.expression import TextClause, UpdateBase
+
+SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+WROTE_AT_KEY = 'db_wrote_at'
+
+
+def is_write(clause):
+    """Might running `clause` change the database (or lock rows)?"""
+
+    if isinstance(clause, UpdateBase):
+        return True
+    if isinstance(clause, TextClause):
+        return not clause.text.lstrip().upper().startswith(('SELECT', 'WITH'))
+    return getattr(clause, '_for_update_arg', None) is not None
+
+
+class RoutingSession(SignallingSession):
+    """A session reading from the request's replica until it writes."""
+
+    wrote = False
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or is_write(clause):
+            self.wrote = True
+
+        replica = None if self.wrote else self.db.replica()
+        if replica is None:
+            return super().get_bind(mapper, clause)
+
+        return self.db.get_engine(self.app, bind=replica)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy, with reads sent to replicas."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICAS', [])
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+
+        super().init_app(app)
+
+        app.before_request(self.pick_replica)
+        app.after_request(self.note_write)
+
+    def pick_replica(self):
+        """Choose the replica this request reads from, if any."""
+
+        config = current_app.config
+        replicas = config['SQLALCHEMY_REPLICAS']
+        wrote_at = session.get(WROTE_AT_KEY, 0)
+
+        if (replicas and request.method in SAFE_METHODS
+                and time.time() - wrote_at > config['REPLICA_STICKY_SECONDS']):
+            g.db_replica = random.choice(replicas)
+
+    def note_write(self, response):
+        if (current_app.config['SQLALCHEMY_REPLICAS']
+                and request.method not in SAFE_METHODS):
+            session[WROTE_AT_KEY] = time.time()
+
+        return response
+
+    def replica(self):
+        """The bind key of the replica to read from, or None for primary."""
+
+        if has_request_context():
+            return g.get('db_replica')
+        return None
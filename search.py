@@ -0,0 +1,489 @@
+"""Username and message search.
+
+Usernames
+---------
+
+On Postgres with pg_trgm, usernames are matched with ILIKE and the query
+is served by a trigram GIN index (created along with the users table by
+`create_trigram_index`), which handles both substring and prefix
+patterns.
+
+Elsewhere (SQLite in development, or Postgres without pg_trgm) there is
+no index that can serve `LIKE '%term%'`, so matches come from an
+in-process trigram index over usernames instead, and the database is
+only asked for the handful of rows on the page being shown.
+
+Either way results are ranked exact match, then prefix, then substring,
+then by username, and paginated by that (rank, username) key.
+
+Messages
+--------
+
+On Postgres, message text is matched against a GIN index on
+`to_tsvector('english', text)` (created along with the messages table by
+`create_fulltext_index`), which the database keeps up to date itself.
+
+Elsewhere, `index_message` and `unindex_message` maintain a tokenized
+postings table (`message_terms`) as messages are added and deleted, and
+searches intersect the postings of each term.
+
+Results are ordered by recency or relevance, with keyset pagination.
+"""
+
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from flask import current_app
+
+from models import db, User, Message, MessageTerm
+import pagination
+
+EXACT, PREFIX, SUBSTRING = 0, 1, 2
+
+TRIGRAM_INDEX = 'ix_users_username_trgm'
+
+
+def escape_like(term):
+    """Escape LIKE wildcards in user input."""
+
+    return (term.replace('\\', '\\\\')
+                .replace('%', '\\%')
+                .replace('_', '\\_'))
+
+
+def rank_of(term, username):
+    """Rank of `username` for `term` (in Python; see `rank_expression`)."""
+
+    term, username = term.lower(), username.lower()
+
+    if username == term:
+        return EXACT
+    if username.startswith(term):
+        return PREFIX
+    return SUBSTRING
+
+
+def rank_expression(term):
+    """SQL expression ranking usernames for `term` (see `rank_of`)."""
+
+    term = term.lower()
+    username = db.func.lower(User.username)
+
+    return db.case([
+        (username == term, EXACT),
+        (username.like(escape_like(term) + '%', escape='\\'), PREFIX),
+    ], else_=SUBSTRING)
+
+
+def result_key(term):
+    return lambda user: (rank_of(term, user.username), user.username)
+
+
+def uses_database_index():
+    """Should username search go to the database (or the in-process index)?"""
+
+    backend = current_app.config.get('USERNAME_SEARCH_BACKEND')
+    if backend:
+        return backend == 'database'
+
+    return has_trigram_index(db.engine)
+
+
+_trigram_index_by_engine = {}
+
+
+def has_trigram_index(engine):
+    """Is the pg_trgm username index available on `engine`? (cached)"""
+
+    if engine not in _trigram_index_by_engine:
+        if engine.dialect.name != 'postgresql':
+            _trigram_index_by_engine[engine] = False
+        else:
+            found = engine.execute(
+                "SELECT 1 FROM pg_indexes WHERE indexname = %s",
+                (TRIGRAM_INDEX,)).scalar()
+            _trigram_index_by_engine[engine] = bool(found)
+
+    return _trigram_index_by_engine[engine]
+
+
+def create_trigram_index(target, connection, **kw):
+    """Add the pg_trgm index on usernames, where Postgres supports it.
+
+    Listens for the users table being created; does nothing on other
+    databases or when the pg_trgm extension isn't installed.
+    """
+
+    if connection.dialect.name != 'postgresql':
+        return
+
+    available = connection.execute(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    ).scalar()
+    if not available:
+        return
+
+    connection.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    connection.execute(
+        f"CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} "
+        f"ON users USING gin (username gin_trgm_ops)")
+
+
+db.event.listen(User.__table__, 'after_create', create_trigram_index)
+
+
+class UsernameIndex:
+    """In-process trigram index over usernames.
+
+    New users are picked up on each search with one range read on the
+    users primary key. Renames in this process are applied by
+    `reindex_user`; a rename in another worker is only seen here once
+    this worker restarts, which is acceptable for the development
+    databases this index is for.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.names = {}
+        self.grams = defaultdict(set)
+        self.max_id = 0
+
+    @staticmethod
+    def trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, user_id, username):
+        with self.lock:
+            self._remove(user_id)
+
+            self.names[user_id] = username
+            for gram in self.trigrams(username.lower()):
+                self.grams[gram].add(user_id)
+
+            self.max_id = max(self.max_id, user_id)
+
+    def remove(self, user_ids):
+        with self.lock:
+            for user_id in user_ids:
+                self._remove(user_id)
+
+    def _remove(self, user_id):
+        username = self.names.pop(user_id, None)
+        if username is None:
+            return
+
+        for gram in self.trigrams(username.lower()):
+            self.grams[gram].discard(user_id)
+
+    def refresh(self):
+        """Index any users created since the last refresh."""
+
+        new_users = (db.session
+                     .query(User.id, User.username)
+                     .filter(User.id > self.max_id)
+                     .order_by(User.id))
+
+        for user_id, username in new_users:
+            self.add(user_id, username)
+
+    def ranked(self, term):
+        """(rank, username, id) of every match for `term`, best first."""
+
+        self.refresh()
+        term = term.lower()
+
+        with self.lock:
+            grams = self.trigrams(term)
+            if grams:
+                postings = sorted((self.grams.get(gram, set())
+                                   for gram in grams), key=len)
+                candidates = set.intersection(*postings)
+            else:
+                # Too short for a trigram; the names are in memory anyway.
+                candidates = self.names.keys()
+
+            matches = [(rank_of(term, self.names[user_id]),
+                        self.names[user_id], user_id)
+                       for user_id in candidates
+                       if term in self.names[user_id].lower()]
+
+        return sorted(matches)
+
+
+username_index = UsernameIndex()
+
+
+def reindex_user(user):
+    """Tell the in-process index that a user's username has changed."""
+
+    username_index.add(user.id, user.username)
+
+
+def search_users(term, per_page=None):
+    """The page of users matching `term` that the request asks for."""
+
+    after, before, per_page = pagination.page_args(per_page)
+    key = result_key(term)
+
+    if uses_database_index():
+        rank = rank_expression(term)
+        query = User.active().filter(
+            User.username.ilike(f"%{escape_like(term)}%", escape='\\'))
+
+        users, more = pagination.fetch(query, [rank, User.username],
+                                       after, before, per_page,
+                                       descending=False)
+    else:
+        users, more = _search_in_memory(term, after, before, per_page)
+
+    return pagination.build_page(users, more, key, after, before)
+
+
+def _search_in_memory(term, after, before, per_page):
+    """Keyset-paginate the in-process index's ranked matches for `term`."""
+
+    while True:
+        ranked = username_index.ranked(term)
+        start, end, more = _slice(ranked, term, after, before, per_page)
+        ids = [user_id for _, _, user_id in ranked[start:end]]
+
+        by_id = {user.id: user
+                 for user in User.active().filter(User.id.in_(ids))}
+
+        # Deleted users stay in the index until a search trips over them.
+        missing = [user_id for user_id in ids if user_id not in by_id]
+        if not missing:
+            return [by_id[user_id] for user_id in ids], more
+
+        username_index.remove(missing)
+
+
+def _slice(ranked, term, after, before, per_page):
+    """(start, end, more) of the page of `ranked` next to the cursor."""
+
+    columns = [rank_expression(term), User.username]
+
+    backwards = before is not None and after is None
+    cursor = before if backwards else after
+
+    if cursor is None:
+        start, end = 0, per_page
+    else:
+        # Usernames are unique, so a (rank, username) cursor sorts just
+        # before its own (rank, username, id) entry.
+        mark = tuple(pagination.decode_cursor(cursor, columns))
+        position = bisect_left(ranked, mark)
+
+        if backwards:
+            start, end = max(0, position - per_page), position
+        else:
+            if position < len(ranked) and ranked[position][:2] == mark:
+                position += 1
+            start, end = position, position + per_page
+
+    more = start > 0 if backwards else end < len(ranked)
+
+    return start, end, more
+
+
+def autocomplete(term, limit=10):
+    """The best `limit` matches for `term`, as (id, username, image_url)."""
+
+    if uses_database_index():
+        return (db.session
+                .query(User.id, User.username, User.image_url)
+                .filter(User.username.ilike(f"%{escape_like(term)}%",
+                                            escape='\\'),
+                        User.deleted_at.is_(None))
+                .order_by(rank_expression(term), User.username)
+                .limit(limit)
+                .all())
+
+    while True:
+        ids = [user_id
+               for _, _, user_id in username_index.ranked(term)[:limit]]
+        rows = {row.id: row for row in
+                db.session
+                  .query(User.id, User.username, User.image_url)
+                  .filter(User.id.in_(ids), User.deleted_at.is_(None))}
+
+        # Users gone since they were indexed, or disabled and awaiting purge
+        missing = [user_id for user_id in ids if user_id not in rows]
+        if not missing:
+            return [rows[user_id] for user_id in ids]
+
+        username_index.remove(missing)
+
+
+##############################################################################
+# Messages
+
+FULLTEXT_INDEX = 'ix_messages_text_fulltext'
+
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its of on "
+    "or that the this to was were will with".split())
+
+
+def create_fulltext_index(target, connection, **kw):
+    """Add the full-text GIN index on message text, on Postgres.
+
+    Listens for the messages table being created; does nothing on other
+    databases.
+    """
+
+    if connection.dialect.name != 'postgresql':
+        return
+
+    connection.execute(
+        f"CREATE INDEX IF NOT EXISTS {FULLTEXT_INDEX} "
+        f"ON messages USING gin (to_tsvector('english', text))")
+
+
+db.event.listen(Message.__table__, 'after_create', create_fulltext_index)
+
+
+def uses_fulltext_index():
+    """Should message search use Postgres full-text search (or postings)?"""
+
+    backend = current_app.config.get('MESSAGE_SEARCH_BACKEND')
+    if backend:
+        return backend == 'database'
+
+    return db.engine.dialect.name == 'postgresql'
+
+
+def tokenize(text):
+    """Count the searchable terms in `text`."""
+
+    return Counter(word for word in re.findall(r"\w+", text.lower())
+                   if word not in STOP_WORDS)
+
+
+def index_message(message):
+    """Add a new message's terms to the postings table."""
+
+    if uses_fulltext_index():
+        return
+
+    postings = [dict(term=term, message_id=message.id, count=count)
+                for term, count in tokenize(message.text).items()]
+
+    if postings:
+        db.session.execute(MessageTerm.__table__.insert(), postings)
+
+
+def unindex_message(message):
+    """Remove a message's terms from the postings table.
+
+    Deleting the message would cascade to them too; doing it explicitly
+    keeps SQLite (without foreign key enforcement) tidy.
+    """
+
+    unindex_messages([message.id])
+
+
+def unindex_messages(message_ids):
+    """Remove the terms of several messages from the postings table."""
+
+    if uses_fulltext_index():
+        return
+
+    (MessageTerm
+        .query
+        .filter(MessageTerm.message_id.in_(message_ids))
+        .delete(synchronize_session=False))
+
+
+def reindex_messages():
+    """Rebuild the postings table from scratch (after bulk loads)."""
+
+    if uses_fulltext_index():
+        return
+
+    MessageTerm.query.delete(synchronize_session=False)
+    index_messages_after(0)
+
+
+def index_messages_after(message_id):
+    """Add the terms of the messages with ids above `message_id`.
+
+    Used after appending bulk loads (see seed.py), so only the new rows
+    are read.
+    """
+
+    if uses_fulltext_index():
+        return
+
+    messages = (db.session
+                .query(Message.id, Message.text)
+                .filter(Message.id > message_id)
+                .order_by(Message.id)
+                .yield_per(1000))
+
+    batch = []
+    for message_id, text in messages:
+        batch.extend(dict(term=term, message_id=message_id, count=count)
+                     for term, count in tokenize(text).items())
+
+        if len(batch) >= 1000:
+            db.session.execute(MessageTerm.__table__.insert(), batch)
+            batch = []
+
+    if batch:
+        db.session.execute(MessageTerm.__table__.insert(), batch)
+
+
+def search_messages(text, order='recent', per_page=None):
+    """The page of messages matching `text` that the request asks for.
+
+    `order` is 'recent' (newest first) or 'relevant' (best match first).
+    """
+
+    after, before, per_page = pagination.page_args(per_page)
+
+    if uses_fulltext_index():
+        vector = db.func.to_tsvector('english', Message.text)
+        query = db.func.plainto_tsquery('english', text)
+
+        matches = Message.query.filter(vector.op('@@')(query))
+        score = db.cast(db.func.ts_rank(vector, query), db.Float)
+    else:
+        terms = list(tokenize(text))
+        if not terms:
+            return pagination.Page([])
+
+        postings = (db.session
+                    .query(MessageTerm.message_id,
+                           db.func.sum(MessageTerm.count).label('score'))
+                    .filter(MessageTerm.term.in_(terms))
+                    .group_by(MessageTerm.message_id)
+                    .having(db.func.count() == len(terms))
+                    .subquery())
+
+        matches = Message.query.join(postings,
+                                     postings.c.message_id == Message.id)
+        score = postings.c.score
+
+    # Not messages of accounts that are disabled and awaiting purge
+    matches = (matches.join(User, User.id == Message.user_id)
+                      .filter(User.deleted_at.is_(None)))
+
+    if order == 'relevant':
+        rows, more = pagination.fetch(matches.add_columns(score),
+                                      [score, Message.id],
+                                      after, before, per_page)
+        page = pagination.build_page(rows, more,
+                                     lambda row: (row[1], row[0].id),
+                                     after, before)
+        page.items = [message for message, _ in rows]
+        return page
+
+    messages, more = pagination.fetch(matches,
+                                      [Message.timestamp, Message.id],
+                                      after, before, per_page)
+    return pagination.build_page(messages, more,
+                                 lambda msg: (msg.timestamp, msg.id),
+                                 after, before)
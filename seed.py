@@ -1,19 +1,301 @@
-"""Seed database with sample data from CSV Files."""
+"""Seed database with sample data from CSV Files.
 
-from csv import DictReader
-from app import db
-from models import User, Message, Follows, LikedMessage
+    python seed.py                      # recreate the tables, load generator/
+    python seed.py --data DIR           # ... load the CSVs in DIR instead
+    python seed.py --append --data DIR  # add DIR's rows to what's there
 
-db.drop_all()
-db.create_all()
+Loads users.csv, messages.csv, follows.csv and likes.csv (whichever are
+present), whose headers name the columns they fill. Each file is streamed
+in batches of --batch-size rows, each its own transaction, using COPY on
+Postgres and executemany on SQLite, so memory use doesn't grow with the
+file and tens of millions of rows load at a steady rate.
 
-with open('generator/users.csv') as users:
-    db.session.bulk_insert_mappings(User, DictReader(users))
+A full load creates the tables without their secondary indexes and adds
+them once the rows are in. --append keeps the existing rows and indexes
+and skips rows that would duplicate a unique key. Afterwards counters are
+recounted and primary key sequences moved past the loaded ids. A full
+load rebuilds timelines and search postings from scratch; --append only
+fans out and indexes the messages it added (those with ids above the
+previous highest), so follows it adds don't backfill older messages.
+"""
 
-with open('generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
+import argparse
+import csv
+import io
+import itertools
+import os
+import sys
+import time
 
-with open('generator/follows.csv') as follows:
-    db.session.bulk_insert_mappings(Follows, DictReader(follows))
+from app import app, db
+from models import (User, Message, Follows, LikedMessage, TimelineEntry,
+                    MessageTerm)
+import counters
+import search
+import timeline
 
-db.session.commit()
+SOURCES = [
+    ('users.csv', User),
+    ('messages.csv', Message),
+    ('follows.csv', Follows),
+    ('likes.csv', LikedMessage),
+]
+
+# Filled from the loaded tables rather than from CSVs
+DERIVED = [TimelineEntry, MessageTerm]
+
+BATCH_SIZE = 10000
+
+
+def batches(rows, size):
+    """Split an iterator of rows into lists of at most `size`."""
+
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def copy_batch(cursor, table, columns, batch, append):
+    """COPY a batch of rows into `table` (Postgres). Returns rows added.
+
+    With `append`, the rows are copied to a scratch table first and only
+    those not clashing with existing keys are inserted.
+    """
+
+    data = io.StringIO()
+    csv.writer(data).writerows(batch)
+    data.seek(0)
+
+    names = ', '.join(columns)
+    # Empty fields are empty strings, as csv.DictReader would read them
+    options = "(FORMAT csv, NULL '\\N')"
+
+    if not append:
+        cursor.copy_expert(f"COPY {table} ({names}) FROM STDIN {options}",
+                           data)
+        return cursor.rowcount
+
+    cursor.execute(f"CREATE TEMP TABLE staging ON COMMIT DROP AS "
+                   f"SELECT {names} FROM {table} WITH NO DATA")
+    cursor.copy_expert(f"COPY staging ({names}) FROM STDIN {options}", data)
+    cursor.execute(f"INSERT INTO {table} ({names}) "
+                   f"SELECT {names} FROM staging ON CONFLICT DO NOTHING")
+
+    return cursor.rowcount
+
+
+def insert_batch(cursor, table, columns, batch, append):
+    """Insert a batch of rows into `table` (SQLite). Returns rows added."""
+
+    ignore = 'OR IGNORE ' if append else ''
+    placeholders = ', '.join('?' for _ in columns)
+
+    cursor.executemany(f"INSERT {ignore}INTO {table} ({', '.join(columns)}) "
+                       f"VALUES ({placeholders})", batch)
+
+    return cursor.rowcount
+
+
+def python_defaults(table, columns):
+    """Columns missing from `columns` that only have a Python-side default.
+
+    COPY doesn't know about those, so the loader fills them in itself.
+    Returns the columns and a function giving a row of their values.
+    """
+
+    missing = [column for column in table.c
+               if column.name not in columns and column.default is not None
+               and column.server_default is None]
+
+    def values():
+        return [column.default.arg(None) if column.default.is_callable
+                else column.default.arg
+                for column in missing]
+
+    return [column.name for column in missing], values
+
+
+def load_csv(path, model, batch_size=BATCH_SIZE, append=False):
+    """Stream one CSV file into `model`'s table.
+
+    Returns how many rows were read and how many were added.
+    """
+
+    table = model.__table__
+    write = copy_batch if db.engine.dialect.name == 'postgresql' else insert_batch
+
+    with open(path, newline='') as source:
+        rows = csv.reader(source)
+        columns = next(rows)
+
+        unknown = [name for name in columns if name not in table.c]
+        if unknown:
+            raise SystemExit(f"{path}: {table.name} has no columns "
+                             f"{', '.join(unknown)}")
+
+        extra_columns, extra_values = python_defaults(table, columns)
+        raw = db.engine.raw_connection()
+        read = added = 0
+
+        try:
+            cursor = raw.cursor()
+            for batch in batches(rows, batch_size):
+                if extra_columns:
+                    extra = extra_values()
+                    batch = [row + extra for row in batch]
+
+                added += write(cursor, table.name, columns + extra_columns,
+                               batch, append)
+                read += len(batch)
+                raw.commit()
+        finally:
+            raw.close()
+
+    return read, added
+
+
+def drop_indexes(models):
+    """Drop the secondary indexes of `models`' tables.
+
+    Returns the statements that create them again. Indexes backing
+    primary keys and unique constraints are left alone.
+    """
+
+    names = [model.__table__.name for model in models]
+
+    if db.engine.dialect.name == 'postgresql':
+        indexes = db.engine.execute(
+            db.text("""
+                SELECT indexname, indexdef FROM pg_indexes
+                WHERE schemaname = current_schema()
+                  AND tablename IN :names
+                  AND indexname NOT IN (SELECT conname FROM pg_constraint)
+            """).bindparams(db.bindparam('names', expanding=True)),
+            names=names).fetchall()
+    else:
+        indexes = db.engine.execute(
+            db.text("""
+                SELECT name, sql FROM sqlite_master
+                WHERE type = 'index' AND sql IS NOT NULL
+                  AND tbl_name IN :names
+            """).bindparams(db.bindparam('names', expanding=True)),
+            names=names).fetchall()
+
+    for name, _ in indexes:
+        db.engine.execute(f"DROP INDEX {name}")
+
+    return [create for _, create in indexes]
+
+
+def create_indexes(statements):
+    for create in statements:
+        db.engine.execute(create)
+
+
+def fix_sequences(models):
+    """Move serial primary key sequences past the highest loaded id."""
+
+    if db.engine.dialect.name != 'postgresql':
+        return
+
+    for model in models:
+        table = model.__table__
+        keys = list(table.primary_key.columns)
+        if len(keys) != 1 or not isinstance(keys[0].type, db.Integer):
+            continue
+
+        key = keys[0]
+        db.engine.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence(:table, :column), "
+            f"COALESCE(MAX({key.name}), 0) + 1, false) FROM {table.name}"),
+            table=table.name, column=key.name)
+
+
+def timed(label, work):
+    start = time.perf_counter()
+    result = work()
+    print(f"{label} in {time.perf_counter() - start:.1f}s")
+    return result
+
+
+def load(data_dir='generator', batch_size=BATCH_SIZE, append=False):
+    """Load the CSVs in `data_dir` and rebuild everything derived from them."""
+
+    sources = [(os.path.join(data_dir, filename), model)
+               for filename, model in SOURCES
+               if os.path.exists(os.path.join(data_dir, filename))]
+    loaded = [model for _, model in sources]
+
+    if not append:
+        db.drop_all()
+        db.create_all()
+        loaded_indexes = drop_indexes(loaded)
+        derived_indexes = drop_indexes(DERIVED)
+        last_message_id = 0
+    else:
+        loaded_indexes = derived_indexes = []
+        # Only messages after this one are fanned out and indexed
+        last_message_id = db.session.query(
+            db.func.max(Message.id)).scalar() or 0
+
+    total = read_total = 0
+    start = time.perf_counter()
+
+    for path, model in sources:
+        began = time.perf_counter()
+        read, added = load_csv(path, model, batch_size, append)
+        elapsed = time.perf_counter() - began
+        total += added
+        read_total += read
+
+        skipped = f", {read - added} skipped" if read != added else ""
+        print(f"{path}: {added} rows{skipped} in {elapsed:.1f}s "
+              f"({read / max(elapsed, 1e-6):,.0f} rows/s)")
+
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {total} rows in {elapsed:.1f}s "
+          f"({read_total / max(elapsed, 1e-6):,.0f} rows/s)")
+
+    fix_sequences(loaded)
+    if loaded_indexes:
+        timed("Indexed loaded tables",
+              lambda: create_indexes(loaded_indexes))
+
+    # Bulk loads bypass the write path, so build counters, timelines and
+    # search postings in one go. An append leaves the existing timelines
+    # and postings alone and adds only the new messages' share, so its
+    # cost follows the size of the CSVs rather than of the database.
+    def rebuild():
+        counters.recount_all()
+        if append:
+            timeline.fan_out_messages_after(last_message_id)
+            search.index_messages_after(last_message_id)
+        else:
+            timeline.rebuild_all()
+            search.reindex_messages()
+        db.session.commit()
+
+    timed("Rebuilt counters, timelines and search postings", rebuild)
+    if derived_indexes:
+        timed("Indexed derived tables",
+              lambda: create_indexes(derived_indexes))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='generator',
+                        help="directory holding the CSV files")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="rows per transaction")
+    parser.add_argument('--append', action='store_true',
+                        help="add to the existing rows instead of replacing")
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        load(args.data, args.batch_size, args.append)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,210 @@
+"""Per-request SQL statistics.
+
+Every statement run while handling a request is counted, timed and
+grouped by its text, which (parameters being placeholders) is the
+statement's shape. One shape run many times in one request is usually an
+N+1: a lazy load inside a loop over rows.
+
+Responses get a header for the browser's network panel,
+
+    Server-Timing: db;dur=12.5;desc="7 queries", app;dur=40.1
+
+and each request is logged to the `warbler.sql` logger as one JSON line,
+at WARNING if it repeated a statement more than SQL_REPEAT_LIMIT times.
+
+With SQL_STRICT on (for development and tests), a request that runs more
+than SQL_QUERY_BUDGET statements, or repeats one more than
+SQL_REPEAT_LIMIT times, fails with QueryBudgetExceeded at the statement
+that went over. Routes can set their own limits with `@query_budget`.
+"""
+
+import json
+import logging
+import time
+from collections import Counter
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('warbler.sql')
+
+# Shapes longer than this are cut short in log lines and errors
+SHAPE_LENGTH = 300
+
+DEFAULT = object()
+
+
+class QueryBudgetExceeded(Exception):
+    """A request ran more (or more repeated) statements than allowed."""
+
+
+def query_budget(queries=DEFAULT, repeats=DEFAULT):
+    """Set a view's own query limits (None for no limit).
+
+    For example pages that read rows in batches repeat the batch query,
+    so take `@query_budget(repeats=None)`.
+    """
+
+    def decorator(view):
+        if queries is not DEFAULT:
+            view.query_budget = queries
+        if repeats is not DEFAULT:
+            view.repeat_limit = repeats
+        return view
+
+    return decorator
+
+
+class RequestStats:
+    """Statements run so far by one request."""
+
+    def __init__(self, budget, repeat_limit, strict):
+        self.budget = budget
+        self.repeat_limit = repeat_limit
+        self.strict = strict
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.started = time.perf_counter()
+
+    def record(self, statement):
+        self.count += 1
+        self.shapes[statement] += 1
+
+        if not self.strict:
+            return
+
+        if self.budget is not None and self.count > self.budget:
+            raise QueryBudgetExceeded(
+                f"{self.count} statements, over the budget of "
+                f"{self.budget}: {shorten(statement)}")
+
+        if (self.repeat_limit is not None
+                and self.shapes[statement] > self.repeat_limit):
+            raise QueryBudgetExceeded(
+                f"Statement run {self.shapes[statement]} times, over the "
+                f"limit of {self.repeat_limit}: {shorten(statement)}")
+
+    def repeated(self):
+        """(shape, times) for each statement run more than the limit."""
+
+        if self.repeat_limit is None:
+            return []
+
+        return [(shape, count) for shape, count in self.shapes.most_common()
+                if count > self.repeat_limit]
+
+    def server_timing(self):
+        elapsed = (time.perf_counter() - self.started) * 1000
+        return (f'db;dur={self.duration * 1000:.2f};desc="{self.count} '
+                f'queries", app;dur={elapsed:.2f}')
+
+
+def shorten(statement):
+    statement = ' '.join(statement.split())
+    if len(statement) > SHAPE_LENGTH:
+        return statement[:SHAPE_LENGTH] + '...'
+    return statement
+
+
+def current():
+    """The stats of the request being handled, if any."""
+
+    if has_app_context():
+        return g.get('sql_stats')
+    return None
+
+
+class SQLStats:
+    """Flask extension recording the SQL each request runs."""
+
+    listening = False
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_STATS', True)
+        app.config.setdefault('SQL_STRICT', False)
+        app.config.setdefault('SQL_QUERY_BUDGET', 30)
+        app.config.setdefault('SQL_REPEAT_LIMIT', 5)
+
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+        if not SQLStats.listening:
+            # Every engine, so it doesn't matter when the app creates its own
+            event.listen(Engine, 'before_cursor_execute', self.before_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_execute)
+            SQLStats.listening = True
+
+    def start(self):
+        config = current_app.config
+        if not config['SQL_STATS']:
+            return
+
+        view = current_app.view_functions.get(request.endpoint)
+        g.sql_stats = RequestStats(
+            getattr(view, 'query_budget', config['SQL_QUERY_BUDGET']),
+            getattr(view, 'repeat_limit', config['SQL_REPEAT_LIMIT']),
+            config['SQL_STRICT'])
+
+    def finish(self, response):
+        stats = current()
+        if stats is None:
+            return response
+
+        # Headers go out first, so for a streamed page this only counts the
+        # statements run before its body; the log line counts them all.
+        response.headers['Server-Timing'] = stats.server_timing()
+
+        if response.is_streamed:
+            log = log_line(stats, response.status_code)
+            response.call_on_close(log)
+        else:
+            log_line(stats, response.status_code)()
+
+        return response
+
+    def before_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        stats = current()
+        if stats is None:
+            return
+
+        # Kept on the statement's own context, so nothing is left behind
+        # when record() raises or the statement fails
+        if context is not None:
+            context.sql_stats_started = time.perf_counter()
+        stats.record(statement)
+
+    def after_execute(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        stats = current()
+        started = getattr(context, 'sql_stats_started', None)
+        if stats is not None and started is not None:
+            stats.duration += time.perf_counter() - started
+
+
+def log_line(stats, status):
+    """A function logging `stats` for the current request."""
+
+    method, path, endpoint = request.method, request.path, request.endpoint
+
+    def log():
+        repeated = stats.repeated()
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps({
+            'method': method,
+            'path': path,
+            'endpoint': endpoint,
+            'status': status,
+            'queries': stats.count,
+            'db_ms': round(stats.duration * 1000, 2),
+            'total_ms': round((time.perf_counter() - stats.started) * 1000,
+                              2),
+            'repeated': [{'statement': shorten(shape), 'times': count}
+                         for shape, count in repeated],
+        }))
+
+    return log
+
+
+sql_stats = SQLStats()
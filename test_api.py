@@ -0,0 +1,155 @@
+"""JSON API tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_api.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, LikedMessage
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import timeline
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+def ids(rows):
+    """The ids of the rows in a response's columns/rows table."""
+
+    column = rows['columns'].index('id')
+    return [row[column] for row in rows['rows']]
+
+
+class ApiTestCase(TestCase):
+    """Test the read-only JSON API."""
+
+    def setUp(self):
+        """Create a reader following an author with three messages."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        reader = User(email="reader@test.com", username="reader",
+                      password="HASHED_PASSWORD")
+        author = User(email="author@test.com", username="author",
+                      password="HASHED_PASSWORD")
+        db.session.add_all([reader, author])
+        db.session.flush()
+
+        messages = [Message(text=f"warble {i}", user_id=author.id)
+                    for i in range(3)]
+        db.session.add_all(messages)
+        db.session.flush()
+
+        db.session.add_all([
+            Follows(user_being_followed_id=author.id,
+                    user_following_id=reader.id),
+            LikedMessage(user_id_like=reader.id,
+                         message_id_liked=messages[0].id),
+        ])
+        db.session.flush()
+
+        self.reader_id = reader.id
+        self.author_id = author.id
+        self.message_ids = [msg.id for msg in messages]
+
+        with app.app_context():
+            timeline.rebuild_all()
+            db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+
+    def test_requires_login(self):
+        with app.test_client() as anon:
+            resp = anon.get("/api/v1/timeline")
+
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(resp.json, {'error': 'Unauthorized'})
+
+    def test_timeline_pages(self):
+        """Does the timeline page through messages with side-loaded authors?"""
+
+        resp = self.client.get("/api/v1/timeline?per_page=2")
+        body = resp.json
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(ids(body['data']),
+                         self.message_ids[:0:-1])
+        self.assertEqual(body['users'], {
+            'columns': ['id', 'username', 'image_url'],
+            'rows': [[self.author_id, 'author',
+                      '/static/images/default-pic.png']],
+        })
+
+        resp = self.client.get(f"/api/v1/timeline?per_page=2"
+                               f"&after={body['next']}")
+
+        self.assertEqual(ids(resp.json['data']),
+                         self.message_ids[:1])
+        self.assertIsNone(resp.json['next'])
+
+    def test_profile(self):
+        resp = self.client.get(f"/api/v1/users/{self.author_id}")
+
+        self.assertEqual(resp.json['data']['username'], "author")
+        self.assertEqual(resp.json['data']['messages_count'], 0)
+        self.assertNotIn('password', resp.json['data'])
+
+        resp = self.client.get("/api/v1/users/0")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_lists(self):
+        """Do the follow and like lists return the right rows?"""
+
+        resp = self.client.get(f"/api/v1/users/{self.reader_id}/following")
+        self.assertEqual(ids(resp.json['data']),
+                         [self.author_id])
+
+        resp = self.client.get(f"/api/v1/users/{self.author_id}/followers")
+        self.assertEqual(ids(resp.json['data']),
+                         [self.reader_id])
+
+        resp = self.client.get(f"/api/v1/users/{self.reader_id}/likes")
+        self.assertEqual(ids(resp.json['data']),
+                         self.message_ids[:1])
+
+        resp = self.client.get(f"/api/v1/users/{self.author_id}/messages")
+        self.assertEqual(len(resp.json['data']['rows']), 3)
+
+    def test_batches(self):
+        """Are batches returned in the order asked for, skipping unknowns?"""
+
+        resp = self.client.get(
+            f"/api/v1/users?ids={self.author_id},0,{self.reader_id}")
+        self.assertEqual(ids(resp.json['data']),
+                         [self.author_id, self.reader_id])
+
+        wanted = ','.join(str(i) for i in reversed(self.message_ids))
+        resp = self.client.get(f"/api/v1/messages?ids={wanted}")
+        self.assertEqual(ids(resp.json['data']),
+                         self.message_ids[::-1])
+
+        resp = self.client.get("/api/v1/messages?ids=one,two")
+        self.assertEqual(resp.status_code, 400)
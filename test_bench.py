@@ -0,0 +1,88 @@
+"""Benchmark harness tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_bench.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app
+import bench
+
+db.create_all()
+
+
+class BenchTestCase(TestCase):
+    """Test driving scenarios and comparing reports."""
+
+    def setUp(self):
+        """Create a user with a message."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.flush()
+
+        msg = Message(text="warble", user_id=user.id)
+        db.session.add(msg)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.message_id = msg.id
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+
+    def test_run_client(self):
+        """Does every scenario run cleanly and get measured?"""
+
+        options = bench.parse_args(['--requests', '3', '--warmup', '1'])
+        picker = bench.Picker(0, self.user_id, self.message_id)
+        # Only one user and message, so every pick is that one
+        picker.user = lambda: self.user_id
+        picker.message = lambda: self.message_id
+
+        results = bench.run_client(options, picker,
+                                   [bench.session_cookie(self.user_id)])
+
+        self.assertEqual(set(results), set(bench.SCENARIOS))
+        for name, stats in results.items():
+            self.assertEqual(stats['requests'], 3, name)
+            self.assertEqual(stats['errors'], 0, name)
+            self.assertGreater(stats['queries_per_request'], 0, name)
+
+    def test_compare(self):
+        """Are slowdowns past the tolerance and extra queries flagged?"""
+
+        def report(p50, p99, queries):
+            return {'results': {'client': {'homepage': {
+                'p50_ms': p50, 'p99_ms': p99, 'queries_per_request': queries,
+            }}}}
+
+        baseline = report(10, 20, 5)
+
+        self.assertEqual(bench.compare(report(12, 24, 5), baseline, 0.25),
+                         [])
+        self.assertEqual(
+            bench.compare(report(14, 20, 6), baseline, 0.25),
+            ["client homepage: p50_ms 10 -> 14",
+             "client homepage: queries_per_request 5 -> 6"])
@@ -0,0 +1,194 @@
+"""Response cache tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_cache.py
+
+
+import os
+import runpy
+import tempfile
+from types import SimpleNamespace
+from unittest import TestCase
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from cache import response_cache, SQLiteStore
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class ResponseCacheTestCase(TestCase):
+    """Test caching and invalidation of rendered pages."""
+
+    def setUp(self):
+        """Create a reader and an author with a message."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+        response_cache.clear()
+
+        reader = User(email="reader@test.com", username="reader",
+                      password="HASHED_PASSWORD")
+        author = User(email="author@test.com", username="author",
+                      password="HASHED_PASSWORD")
+        db.session.add_all([reader, author])
+        db.session.flush()
+
+        message = Message(text="cached warble", user_id=author.id)
+        db.session.add(message)
+        db.session.commit()
+
+        self.reader_id = reader.id
+        self.author_id = author.id
+        self.message_id = message.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+        # Settle the session (identity snapshot) before counting hits
+        self.client.get("/messages/new")
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+
+    def test_repeat_is_hit(self):
+        """Is the second view of a message served from the cache?"""
+
+        url = f"/messages/{self.message_id}"
+
+        first = self.client.get(url)
+        second = self.client.get(url)
+
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertIn('private', second.headers['Cache-Control'])
+
+    def test_follow_invalidates(self):
+        """Does following the author refresh their profile page?"""
+
+        url = f"/users/{self.author_id}"
+
+        self.client.get(url)
+        self.client.post(f"/users/follow/{self.author_id}")
+        resp = self.client.get(url)
+
+        self.assertEqual(resp.headers['X-Cache'], 'MISS')
+        self.assertIn("Unfollow", resp.get_data(as_text=True))
+
+    def test_new_message_invalidates(self):
+        """Does posting a message refresh the author's profile page?"""
+
+        url = f"/users/{self.reader_id}"
+
+        self.client.get(url)
+        self.client.post("/messages/new", data={"text": "fresh warble"})
+        resp = self.client.get(url)
+
+        self.assertEqual(resp.headers['X-Cache'], 'MISS')
+        self.assertIn("fresh warble", resp.get_data(as_text=True))
+
+    def test_viewers_cached_apart(self):
+        """Does another user get their own copy of the page?"""
+
+        url = f"/messages/{self.message_id}"
+        self.client.get(url)
+
+        with app.test_client() as other:
+            with other.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.author_id
+
+            resp = other.get(url)
+
+        self.assertEqual(resp.headers['X-Cache'], 'MISS')
+        self.assertIn("Delete", resp.get_data(as_text=True))
+
+    def test_pending_flash_bypasses_cache(self):
+        """Are pages with a pending flash message rendered afresh?"""
+
+        url = f"/messages/{self.message_id}"
+        self.client.get(url)
+
+        with self.client.session_transaction() as sess:
+            sess['_flashes'] = [('success', 'Hello!')]
+
+        resp = self.client.get(url)
+
+        self.assertNotIn('X-Cache', resp.headers)
+        self.assertIn("Hello!", resp.get_data(as_text=True))
+
+    def test_cache_headers(self):
+        """Do uncached routes still say no-store?"""
+
+        resp = self.client.get("/messages/new")
+        self.assertIn('no-store', resp.headers['Cache-Control'])
+
+        with app.test_client() as anon:
+            resp = anon.get("/")
+
+        self.assertIn('public', resp.headers['Cache-Control'])
+
+
+class SQLiteStoreTestCase(TestCase):
+    """Test the shared SQLite store."""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_entries_and_tags(self):
+        """Are entries and tag versions shared between store instances?"""
+
+        writer = SQLiteStore(self.path)
+        reader = SQLiteStore(self.path)
+
+        writer.set('key', {'body': b'page'}, expires=2 ** 40)
+        self.assertEqual(reader.get('key'), {'body': b'page'})
+        self.assertIsNone(reader.get('missing'))
+
+        writer.bump(['user:1'])
+        writer.bump(['user:1', 'likes:1'])
+        self.assertEqual(reader.versions(['user:1', 'likes:1', 'other']),
+                         {'user:1': 2, 'likes:1': 1, 'other': 0})
+
+    def test_gunicorn_workers_share_a_store(self):
+        """Does gunicorn with several workers default to a shared store?"""
+
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            os.environ['PROMETHEUS_MULTIPROC_DIR'] = metrics_dir
+            try:
+                settings = runpy.run_path(os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)),
+                    'gunicorn.conf.py'))
+
+                settings['on_starting'](
+                    SimpleNamespace(cfg=SimpleNamespace(workers=1)))
+                self.assertNotIn('RESPONSE_CACHE_STORE', os.environ)
+
+                settings['on_starting'](
+                    SimpleNamespace(cfg=SimpleNamespace(workers=3)))
+                self.assertEqual(os.environ['RESPONSE_CACHE_STORE'],
+                                 f"sqlite:///{settings['cache_file']}")
+            finally:
+                del os.environ['PROMETHEUS_MULTIPROC_DIR']
+                os.environ.pop('RESPONSE_CACHE_STORE', None)
@@ -0,0 +1,147 @@
+"""Conditional GET (ETag / Last-Modified) tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_conditional.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from cache import response_cache
+from query_counter import QueryCounter
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class ConditionalGetTestCase(TestCase):
+    """Test 304 responses for unchanged pages."""
+
+    def setUp(self):
+        """Create a reader and an author with a message."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+        response_cache.clear()
+
+        reader = User(email="reader@test.com", username="reader",
+                      password="HASHED_PASSWORD")
+        author = User(email="author@test.com", username="author",
+                      password="HASHED_PASSWORD")
+        db.session.add_all([reader, author])
+        db.session.flush()
+
+        message = Message(text="conditional warble", user_id=author.id)
+        db.session.add(message)
+        db.session.commit()
+
+        self.reader_id = reader.id
+        self.author_id = author.id
+        self.message_id = message.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+
+    def revalidate(self, url):
+        """GET `url`, then GET it again with the validators it sent."""
+
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIsNotNone(first.headers.get('ETag'))
+        self.assertIsNotNone(first.headers.get('Last-Modified'))
+
+        return first, self.client.get(url, headers={
+            'If-None-Match': first.headers['ETag'],
+        })
+
+    def test_unchanged_pages(self):
+        """Do unchanged pages answer 304 with no body?"""
+
+        for url in ["/", f"/users/{self.author_id}",
+                    f"/messages/{self.message_id}"]:
+            first, second = self.revalidate(url)
+
+            self.assertEqual(second.status_code, 304, url)
+            self.assertEqual(second.data, b'', url)
+            self.assertEqual(second.headers['ETag'], first.headers['ETag'])
+
+    def test_not_modified_skips_view(self):
+        """Does a 304 cost only the validator query?"""
+
+        url = f"/users/{self.author_id}"
+        first = self.client.get(url)
+
+        with QueryCounter(db.engine) as counter:
+            resp = self.client.get(url, headers={
+                'If-None-Match': first.headers['ETag'],
+            })
+
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(counter.count, 1)
+
+    def test_if_modified_since(self):
+        """Is If-Modified-Since honoured on its own?"""
+
+        url = f"/messages/{self.message_id}"
+        first = self.client.get(url)
+
+        resp = self.client.get(url, headers={
+            'If-Modified-Since': first.headers['Last-Modified'],
+        })
+
+        self.assertEqual(resp.status_code, 304)
+
+    def test_follow_changes_etag(self):
+        """Does following the author change their page's ETag?"""
+
+        url = f"/users/{self.author_id}"
+        first = self.client.get(url)
+
+        self.client.post(f"/users/follow/{self.author_id}")
+        resp = self.client.get(url, headers={
+            'If-None-Match': first.headers['ETag'],
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("Unfollow", resp.get_data(as_text=True))
+
+    def test_like_changes_home_etag(self):
+        """Does liking a message change the home page's ETag?"""
+
+        self.client.post(f"/users/follow/{self.author_id}")
+        first = self.client.get("/")
+
+        self.client.post(f"/users/{self.message_id}/like")
+        resp = self.client.get("/", headers={
+            'If-None-Match': first.headers['ETag'],
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], first.headers['ETag'])
+
+    def test_missing_message(self):
+        """Is a missing message still a 404?"""
+
+        resp = self.client.get("/messages/0")
+        self.assertEqual(resp.status_code, 404)
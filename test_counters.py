@@ -0,0 +1,127 @@
+"""User counter tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_counters.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, LikedMessage
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import counters
+import purge
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class CountersTestCase(TestCase):
+    """Test that routes keep the users' counters up to date."""
+
+    def setUp(self):
+        """Create two users."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        other = User(email="other@test.com", username="other",
+                     password="HASHED_PASSWORD")
+        db.session.add_all([user, other])
+        db.session.commit()
+
+        self.user_id = user.id
+        self.other_id = other.id
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+
+    def counts(self, user_id):
+        db.session.expire_all()
+        user = User.query.get(user_id)
+        return (user.messages_count, user.following_count,
+                user.followers_count, user.likes_count)
+
+    def login(self, client, user_id):
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def test_routes_update_counters(self):
+        """Do follows, messages, likes and deletes adjust the counts?"""
+
+        with app.test_client() as client:
+            self.login(client, self.user_id)
+            client.post("/messages/new", data={"text": "warble"})
+            client.post(f"/users/follow/{self.other_id}")
+            self.assertEqual(self.counts(self.user_id), (1, 1, 0, 0))
+            self.assertEqual(self.counts(self.other_id), (0, 0, 1, 0))
+
+            msg_id = Message.query.one().id
+
+            self.login(client, self.other_id)
+            client.post(f"/users/{msg_id}/like")
+            self.assertEqual(self.counts(self.other_id), (0, 0, 1, 1))
+
+            self.login(client, self.user_id)
+            client.post(f"/messages/{msg_id}/delete")
+            self.assertEqual(self.counts(self.user_id), (0, 1, 0, 0))
+            self.assertEqual(self.counts(self.other_id), (0, 0, 1, 0))
+
+            client.post(f"/users/stop-following/{self.other_id}")
+            self.assertEqual(self.counts(self.user_id), (0, 0, 0, 0))
+            self.assertEqual(self.counts(self.other_id), (0, 0, 0, 0))
+
+    def test_delete_user_updates_others(self):
+        """Does deleting an account fix up the counts of those it touched?"""
+
+        msg = Message(text="warble", user_id=self.user_id)
+        db.session.add(msg)
+        db.session.flush()
+        db.session.add_all([
+            Follows(user_being_followed_id=self.user_id,
+                    user_following_id=self.other_id),
+            LikedMessage(user_id_like=self.other_id, message_id_liked=msg.id),
+        ])
+        counters.recount_all()
+        db.session.commit()
+        self.assertEqual(self.counts(self.other_id), (0, 1, 0, 1))
+
+        with app.test_client() as client:
+            self.login(client, self.user_id)
+            client.post("/users/delete")
+
+        purge.purger.wait()
+        self.assertIsNone(User.query.get(self.user_id))
+        self.assertEqual(self.counts(self.other_id), (0, 0, 0, 0))
+
+    def test_recount_all(self):
+        """Does recount_all repair counters that have drifted?"""
+
+        db.session.add(Message(text="warble", user_id=self.user_id))
+        db.session.add(Follows(user_being_followed_id=self.other_id,
+                               user_following_id=self.user_id))
+        User.query.update({User.likes_count: 99})
+        db.session.commit()
+
+        counters.recount_all()
+        db.session.commit()
+
+        self.assertEqual(self.counts(self.user_id), (1, 1, 0, 0))
+        self.assertEqual(self.counts(self.other_id), (0, 0, 1, 0))
@@ -0,0 +1,151 @@
+"""Follow write path tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_follows.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, TimelineEntry
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class FollowsTestCase(TestCase):
+    """Test single and bulk follows."""
+
+    def setUp(self):
+        """Create a reader and five authors with a message each."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        reader = User(email="reader@test.com", username="reader",
+                      password="HASHED_PASSWORD")
+        authors = [User(email=f"author{i}@test.com", username=f"author{i}",
+                        password="HASHED_PASSWORD")
+                   for i in range(5)]
+        db.session.add_all([reader, *authors])
+        db.session.flush()
+
+        db.session.add_all([Message(text=f"warble {i}", user_id=author.id)
+                            for i, author in enumerate(authors)])
+        db.session.commit()
+
+        self.reader_id = reader.id
+        self.author_ids = [author.id for author in authors]
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+
+    def following(self):
+        db.session.expire_all()
+        reader = User.query.get(self.reader_id)
+        followed = {follow.user_being_followed_id for follow in
+                    Follows.query.filter_by(user_following_id=self.reader_id)}
+
+        return followed, reader.following_count
+
+    def test_follow_and_unfollow_are_idempotent(self):
+        """Does repeating a follow or unfollow leave the counts alone?"""
+
+        author_id = self.author_ids[0]
+
+        for _ in range(2):
+            resp = self.client.post(f"/users/follow/{author_id}")
+            self.assertEqual(resp.status_code, 302)
+
+        self.assertEqual(self.following(), ({author_id}, 1))
+        self.assertEqual(User.query.get(author_id).followers_count, 1)
+
+        for _ in range(2):
+            resp = self.client.post(f"/users/stop-following/{author_id}")
+            self.assertEqual(resp.status_code, 302)
+
+        self.assertEqual(self.following(), (set(), 0))
+        self.assertEqual(User.query.get(author_id).followers_count, 0)
+
+    def test_follow_missing_user(self):
+        resp = self.client.post("/users/follow/0")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_bulk_follow(self):
+        """Are only new, existing users followed, with timelines backfilled?"""
+
+        self.client.post(f"/users/follow/{self.author_ids[0]}")
+
+        ids = ", ".join(str(user_id) for user_id in self.author_ids + [0])
+        resp = self.client.post("/users/follow", data={"ids": ids},
+                                follow_redirects=True)
+
+        self.assertIn("Followed 4 users.", resp.get_data(as_text=True))
+        self.assertEqual(self.following(), (set(self.author_ids), 5))
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 5)
+
+        resp = self.client.post(
+            "/users/stop-following",
+            data={"ids": f"{self.author_ids[0]}\n{self.author_ids[1]}"},
+            follow_redirects=True)
+
+        self.assertIn("Stopped following 2 users.",
+                      resp.get_data(as_text=True))
+        self.assertEqual(self.following(), (set(self.author_ids[2:]), 3))
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 3)
+
+    def test_bulk_follow_backfill_is_capped(self):
+        """Does a bulk follow copy only the newest messages across them all?"""
+
+        app.config['TIMELINE_BACKFILL_LIMIT'] = 2
+        try:
+            ids = ",".join(str(user_id) for user_id in self.author_ids)
+            self.client.post("/users/follow", data={"ids": ids})
+        finally:
+            app.config['TIMELINE_BACKFILL_LIMIT'] = 800
+
+        entries = (TimelineEntry.query
+                   .filter_by(user_id=self.reader_id)
+                   .order_by(TimelineEntry.author_id))
+        self.assertEqual([entry.author_id for entry in entries],
+                         self.author_ids[3:])
+
+    def test_bulk_follow_rejects_bad_lists(self):
+        resp = self.client.post("/users/follow", data={"ids": "1, two"},
+                                follow_redirects=True)
+        self.assertIn("User ids must be numbers.",
+                      resp.get_data(as_text=True))
+
+        app.config['BULK_FOLLOW_MAX'] = 2
+        try:
+            ids = ",".join(str(user_id) for user_id in self.author_ids)
+            resp = self.client.post("/users/follow", data={"ids": ids},
+                                    follow_redirects=True)
+        finally:
+            app.config['BULK_FOLLOW_MAX'] = 5000
+
+        self.assertIn("At most 2 users at a time.",
+                      resp.get_data(as_text=True))
+        self.assertEqual(self.following(), (set(), 0))
@@ -0,0 +1,99 @@
+"""Template fragment cache tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_fragments.py
+
+
+import os
+from unittest import TestCase
+
+from flask import render_template_string
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from cache import response_cache
+from fragments import fragment_cache
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+CARD = """{% call cached_fragment('card', user.id, user.version) %}
+@{{ user.username }}
+{% endcall %}"""
+
+
+class FragmentCacheTestCase(TestCase):
+    """Test caching of rendered cards."""
+
+    def setUp(self):
+        """Create a user with a message."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+        response_cache.clear()
+        fragment_cache.clear()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.flush()
+
+        db.session.add(Message(text="fragment warble", user_id=user.id))
+        db.session.commit()
+
+        self.user_id = user.id
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+
+    def render_card(self, user):
+        with app.test_request_context():
+            return render_template_string(CARD, user=user).strip()
+
+    def test_cached_until_version_changes(self):
+        """Is a fragment reused until the user's version changes?"""
+
+        user = User.query.get(self.user_id)
+        self.assertEqual(self.render_card(user), "@testuser")
+
+        # Same version: the stale fragment is served
+        user.username = "renamed"
+        self.assertEqual(self.render_card(user), "@testuser")
+
+        user.version += 1
+        self.assertEqual(self.render_card(user), "@renamed")
+
+    def test_list_pages_share_cards(self):
+        """Do list pages fill and reuse the cache, with buttons per viewer?"""
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+        resp = client.get(f"/users/{self.user_id}")
+        self.assertIn("fragment warble", resp.get_data(as_text=True))
+        cached = len(fragment_cache.fragments)
+        self.assertGreater(cached, 0)
+
+        resp = client.get("/users")
+        html = resp.get_data(as_text=True)
+        self.assertIn("@testuser", html)
+        self.assertIn("Follow", html)
+
+        resp = client.get("/users")
+        self.assertEqual(len(fragment_cache.fragments), cached + 2)
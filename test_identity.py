@@ -0,0 +1,151 @@
+"""Session identity snapshot tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_identity.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from query_counter import QueryCounter
+import identity
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class IdentityTestCase(TestCase):
+    """Test the lightweight g.user built from the session."""
+
+    def setUp(self):
+        """Create and log in a user."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        user = User.signup(username="testuser", email="test@test.com",
+                           password="password", image_url=None)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.client = app.test_client()
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+
+    def test_snapshot_avoids_queries(self):
+        """Once snapshotted, do basic pages skip loading the user?"""
+
+        self.client.get("/messages/new")
+
+        with self.client.session_transaction() as sess:
+            self.assertEqual(sess[identity.SNAPSHOT_KEY]['username'],
+                             "testuser")
+
+        with QueryCounter(db.engine) as counter:
+            resp = self.client.get("/messages/new")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("testuser", resp.get_data(as_text=True))
+        self.assertEqual(counter.count, 0)
+
+    def test_lookups_skip_the_row(self):
+        """Do follow and like lookups work without loading the user?"""
+
+        user = User.query.get(self.user_id)
+        current = identity.CurrentUser(identity.snapshot(user))
+
+        with app.app_context():
+            self.assertEqual(current.followed_ids([self.user_id]), set())
+            self.assertEqual(current.liked_message_ids([1]), set())
+
+        self.assertIsNone(current._row)
+
+    def test_profile_change_refreshes_snapshot(self):
+        """Does editing the profile bump the version and the snapshot?"""
+
+        self.client.get("/messages/new")
+
+        resp = self.client.post("/users/profile", data={
+            "username": "renamed",
+            "email": "test@test.com",
+            "password": "password",
+        })
+        self.assertEqual(resp.status_code, 302)
+
+        with self.client.session_transaction() as sess:
+            self.assertEqual(sess[identity.SNAPSHOT_KEY]['username'],
+                             "renamed")
+            self.assertEqual(sess[identity.SNAPSHOT_KEY]['version'], 2)
+
+    def test_stale_snapshot_is_replaced(self):
+        """Is a snapshot older than the row replaced when the row loads?"""
+
+        self.client.get("/messages/new")
+
+        User.query.filter_by(id=self.user_id).update({
+            User.username: "elsewhere", User.version: User.version + 1})
+        db.session.commit()
+
+        # The homepage shows counts, so it loads the full row.
+        self.client.get("/")
+
+        with self.client.session_transaction() as sess:
+            self.assertEqual(sess[identity.SNAPSHOT_KEY]['username'],
+                             "elsewhere")
+
+    def test_deleted_user_is_logged_out(self):
+        """Is a snapshot of a since-deleted user rejected on row load?"""
+
+        self.client.get("/messages/new")
+
+        User.query.filter_by(id=self.user_id).delete()
+        db.session.commit()
+
+        resp = self.client.get("/")
+        self.assertEqual(resp.status_code, 302)
+
+        with self.client.session_transaction() as sess:
+            self.assertNotIn(identity.SNAPSHOT_KEY, sess)
+
+    def test_deleted_user_cannot_write_from_another_session(self):
+        """Is a write from another session of a deleted user refused, even
+        in a worker that never saw the deletion?"""
+
+        other = app.test_client()
+        with other.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+        self.client.get("/messages/new")
+        other.get("/messages/new")
+
+        self.client.post("/users/delete")
+        identity._latest_versions.clear()
+
+        resp = other.post("/messages/new", data={"text": "still here"})
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(Message.query.count(), 0)
+
+        with other.session_transaction() as sess:
+            self.assertNotIn(CURR_USER_KEY, sess)
+            self.assertNotIn(identity.SNAPSHOT_KEY, sess)
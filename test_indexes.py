@@ -0,0 +1,65 @@
+"""Index report tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_indexes.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app
+import indexes
+
+db.create_all()
+
+USER_TIMESTAMP = next(index for index in Message.__table__.indexes
+                      if index.name == 'ix_messages_user_timestamp')
+
+
+class IndexReportTestCase(TestCase):
+    """Test reporting missing and unused indexes."""
+
+    def setUp(self):
+        db.session.rollback()
+
+    def tearDown(self):
+        if ('messages', USER_TIMESTAMP.name) in indexes.missing_indexes(
+                db.engine):
+            USER_TIMESTAMP.create(db.engine)
+        db.engine.execute("DROP INDEX IF EXISTS ix_messages_unused")
+
+    def test_missing(self):
+        """Is a declared index the database lacks reported?"""
+
+        USER_TIMESTAMP.drop(db.engine)
+
+        self.assertIn(('messages', 'ix_messages_user_timestamp'),
+                      indexes.missing_indexes(db.engine))
+        self.assertIn("Missing: messages.ix_messages_user_timestamp "
+                      "(run `flask db upgrade`)", indexes.report(db.engine))
+
+        USER_TIMESTAMP.create(db.engine)
+        self.assertNotIn(('messages', 'ix_messages_user_timestamp'),
+                         indexes.missing_indexes(db.engine))
+
+    def test_unused(self):
+        """Is an index that was never scanned reported, but not a key?"""
+
+        db.engine.execute("CREATE INDEX ix_messages_unused ON messages (text)")
+
+        unused = [(table, index)
+                  for table, index, _ in indexes.unused_indexes(db.engine)]
+        self.assertIn(('messages', 'ix_messages_unused'), unused)
+        self.assertNotIn(('messages', 'messages_pkey'), unused)
@@ -0,0 +1,115 @@
+"""Like write path tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_likes.py
+
+
+import os
+import threading
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from models import db, User, Message, LikedMessage
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app
+import likes
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class GroupCommitTestCase(TestCase):
+    """Test likes committed in groups by the background thread."""
+
+    def setUp(self):
+        """Create a user and ten messages."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.flush()
+
+        messages = [Message(text=f"warble {i}", user_id=user.id)
+                    for i in range(10)]
+        db.session.add_all(messages)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.message_ids = [msg.id for msg in messages]
+
+        app.config['LIKE_GROUP_COMMIT'] = True
+        app.config['LIKE_GROUP_COMMIT_MS'] = 50
+
+    def tearDown(self):
+        """Turn group commit back off."""
+
+        app.config['LIKE_GROUP_COMMIT'] = False
+        app.config['LIKE_GROUP_COMMIT_MS'] = 5
+        db.session.rollback()
+
+    def like_all_at_once(self, message_ids):
+        results = {}
+
+        def like(message_id):
+            with app.app_context():
+                try:
+                    results[message_id] = likes.write('like', self.user_id,
+                                                      message_id)
+                except Exception as exc:
+                    results[message_id] = exc
+
+        threads = [threading.Thread(target=like, args=(message_id,))
+                   for message_id in message_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def test_burst_is_one_transaction(self):
+        """Are likes arriving together committed together, and counted?"""
+
+        commits = []
+
+        def count_commit(conn):
+            commits.append(conn)
+
+        event.listen(db.engine, 'commit', count_commit)
+        try:
+            results = self.like_all_at_once(self.message_ids)
+        finally:
+            event.remove(db.engine, 'commit', count_commit)
+
+        self.assertEqual(results, {message_id: True
+                                   for message_id in self.message_ids})
+        self.assertLess(len(commits), 5)
+
+        self.assertEqual(LikedMessage.query.count(), 10)
+        self.assertEqual(User.query.get(self.user_id).likes_count, 10)
+
+    def test_bad_write_fails_alone(self):
+        """Does a like of a missing message fail without sinking the rest?"""
+
+        results = self.like_all_at_once(self.message_ids[:3] + [0])
+
+        self.assertIsInstance(results.pop(0), Exception)
+        self.assertEqual(set(results.values()), {True})
+        self.assertEqual(LikedMessage.query.count(), 3)
+        self.assertEqual(User.query.get(self.user_id).likes_count, 3)
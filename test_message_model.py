@@ -8,7 +8,7 @@
 import os
 from unittest import TestCase
 
-from models import db, User, Message, Follows
+from models import db, User, Message, Follows, LikedMessage
 from flask_bcrypt import Bcrypt
 
 # BEFORE we import our app, let's set an environmental variable
@@ -106,3 +106,32 @@ class UserModelTestCase(TestCase):
         self.assertEqual(self.message.user_id, self.user.id)
         self.assertEqual(self.message.user, self.user)
 
+    def test_liked_ids(self):
+        '''Does LikedMessage.liked_ids return only the liked subset?'''
+
+        db.session.add(LikedMessage(user_id_like=self.user.id,
+                                    message_id_liked=self.message1.id))
+        db.session.commit()
+
+        self.assertEqual(
+            self.user.liked_message_ids([self.message.id, self.message1.id]),
+            {self.message1.id})
+        self.assertEqual(
+            self.user1.liked_message_ids([self.message.id, self.message1.id]),
+            set())
+        self.assertEqual(self.user.liked_message_ids([]), set())
+
+    def test_like_unlike_toggle(self):
+        '''Do the direct like writes report whether they changed anything?'''
+
+        self.assertTrue(LikedMessage.like(self.user.id, self.message.id))
+        self.assertFalse(LikedMessage.like(self.user.id, self.message.id))
+        self.assertEqual(LikedMessage.query.count(), 1)
+
+        self.assertTrue(LikedMessage.unlike(self.user.id, self.message.id))
+        self.assertFalse(LikedMessage.unlike(self.user.id, self.message.id))
+        self.assertEqual(LikedMessage.query.count(), 0)
+
+        self.assertTrue(LikedMessage.toggle(self.user.id, self.message.id))
+        self.assertFalse(LikedMessage.toggle(self.user.id, self.message.id))
+        self.assertEqual(LikedMessage.query.count(), 0)
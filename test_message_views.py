@@ -8,7 +8,7 @@
 import os
 from unittest import TestCase
 
-from models import db, connect_db, Message, User
+from models import db, connect_db, Message, User, LikedMessage
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -70,3 +70,53 @@ class MessageViewTestCase(TestCase):
 
             msg = Message.query.one()
             self.assertEqual(msg.text, "Hello")
+
+    def test_like_toggle(self):
+        """Does liking twice like then unlike, and show the star?"""
+
+        msg = Message(text="Likeable", user_id=self.testuser.id)
+        db.session.add(msg)
+        db.session.commit()
+        msg_id = msg.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            resp = c.post(f"/users/{msg_id}/like")
+            self.assertEqual(resp.status_code, 302)
+            self.assertEqual(LikedMessage.query.count(), 1)
+
+            html = c.get(f"/users/{self.testuser.id}/likes").get_data(
+                as_text=True)
+            self.assertIn("Likeable", html)
+            self.assertIn("fas fa-star", html)
+
+            c.post(f"/users/{msg_id}/like")
+            self.assertEqual(LikedMessage.query.count(), 0)
+
+    def test_like_unlike_idempotent(self):
+        """Do repeated likes and unlikes leave one like (or none)?"""
+
+        msg = Message(text="Likeable", user_id=self.testuser.id)
+        db.session.add(msg)
+        db.session.commit()
+        msg_id = msg.id
+        user_id = self.testuser.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = user_id
+
+            c.post(f"/messages/{msg_id}/like")
+            c.post(f"/messages/{msg_id}/like")
+            self.assertEqual(LikedMessage.query.count(), 1)
+            self.assertEqual(User.query.get(user_id).likes_count, 1)
+
+            c.post(f"/messages/{msg_id}/unlike")
+            c.post(f"/messages/{msg_id}/unlike")
+            self.assertEqual(LikedMessage.query.count(), 0)
+            self.assertEqual(User.query.get(user_id).likes_count, 0)
+
+            resp = c.post("/messages/0/like")
+            self.assertEqual(resp.status_code, 404)
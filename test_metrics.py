@@ -0,0 +1,112 @@
+"""Metrics endpoint tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_metrics.py
+
+
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from passwords import hasher
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+# Counts one response from a separate process, as a gunicorn worker would
+WORKER = """
+from metrics import RESPONSES
+RESPONSES.labels('GET', 'homepage', 200).inc()
+"""
+
+
+class MetricsTestCase(TestCase):
+    """Test what /metrics reports."""
+
+    def setUp(self):
+        """Create a user."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_metrics(self):
+        """Are requests, templates, bcrypt and the pool all reported?"""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+        self.client.get(f"/users/{self.user_id}")
+        hasher.check(hasher.hash("password"), "password")
+
+        resp = self.client.get("/metrics")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+
+        text = resp.get_data(as_text=True)
+        self.assertIn('warbler_responses_total{endpoint="users_show",'
+                      'method="GET",status="200"}', text)
+        self.assertIn('warbler_request_duration_seconds_count{'
+                      'endpoint="users_show",method="GET"}', text)
+        self.assertIn('warbler_template_render_seconds_count{'
+                      'template="users/show.html"}', text)
+        self.assertIn('warbler_bcrypt_seconds_count{operation="check"}',
+                      text)
+        self.assertIn('warbler_db_pool_checked_out{database="primary"}', text)
+
+    def test_streamed_template(self):
+        """Is a streamed list page's render timed?"""
+
+        app.config['STREAM_LIST_PAGES'] = True
+        resp = self.client.get("/users")
+        resp.get_data()
+        resp.close()
+
+        text = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn('warbler_template_render_seconds_count{'
+                      'template="users/index.html"}', text)
+
+    def test_multiprocess(self):
+        """Are counts from several worker processes added up?"""
+
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=metrics_dir)
+            for _ in range(2):
+                subprocess.run([sys.executable, '-c', WORKER], env=env,
+                               check=True)
+
+            os.environ['PROMETHEUS_MULTIPROC_DIR'] = metrics_dir
+            try:
+                text = self.client.get("/metrics").get_data(as_text=True)
+            finally:
+                del os.environ['PROMETHEUS_MULTIPROC_DIR']
+
+        self.assertIn('warbler_responses_total{endpoint="homepage",'
+                      'method="GET",status="200"} 2.0', text)
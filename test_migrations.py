@@ -0,0 +1,180 @@
+"""Schema migration tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_migrations.py
+
+
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+import sqlalchemy as sa
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy.engine.url import make_url
+
+from models import db
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app
+
+# Upgraded from scratch each run, apart from the test database
+MIGRATIONS_URL = "postgresql:///warbler-test-migrations"
+
+# The tables as the original models made them, before any migration
+baseline = sa.MetaData()
+
+sa.Table(
+    'users', baseline,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('email', sa.Text, nullable=False, unique=True),
+    sa.Column('username', sa.Text, nullable=False, unique=True),
+    sa.Column('image_url', sa.Text),
+    sa.Column('header_image_url', sa.Text),
+    sa.Column('bio', sa.Text),
+    sa.Column('location', sa.Text),
+    sa.Column('password', sa.Text, nullable=False),
+)
+
+sa.Table(
+    'follows', baseline,
+    sa.Column('user_being_followed_id', sa.Integer,
+              sa.ForeignKey('users.id', ondelete="cascade"),
+              primary_key=True),
+    sa.Column('user_following_id', sa.Integer,
+              sa.ForeignKey('users.id', ondelete="cascade"),
+              primary_key=True),
+)
+
+sa.Table(
+    'messages', baseline,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('text', sa.String(140), nullable=False),
+    sa.Column('timestamp', sa.DateTime, nullable=False),
+    sa.Column('user_id', sa.Integer,
+              sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+)
+
+sa.Table(
+    'liked_messages', baseline,
+    sa.Column('user_id_like', sa.Integer,
+              sa.ForeignKey('users.id', ondelete="cascade"),
+              primary_key=True),
+    sa.Column('message_id_liked', sa.Integer,
+              sa.ForeignKey('messages.id', ondelete="cascade"),
+              primary_key=True),
+)
+
+
+def create_database(url):
+    url = make_url(url)
+    admin_url = make_url(str(url))
+    admin_url.database = 'postgres'
+
+    admin = sa.create_engine(admin_url, isolation_level='AUTOCOMMIT')
+    exists = admin.execute("SELECT 1 FROM pg_database WHERE datname = %s",
+                           (url.database,)).scalar()
+    if not exists:
+        admin.execute(f'CREATE DATABASE "{url.database}"')
+    admin.dispose()
+
+
+def upgrade():
+    subprocess.run(
+        [sys.executable, '-m', 'flask', 'db', 'upgrade'],
+        env=dict(os.environ, FLASK_APP='app', DATABASE_URL=MIGRATIONS_URL),
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True, capture_output=True)
+
+
+class MigrationTestCase(TestCase):
+    """Test upgrading a database made from the original models."""
+
+    def setUp(self):
+        create_database(MIGRATIONS_URL)
+        self.engine = sa.create_engine(MIGRATIONS_URL)
+        self.engine.execute("DROP SCHEMA public CASCADE")
+        self.engine.execute("CREATE SCHEMA public")
+        baseline.create_all(self.engine)
+
+        users, follows, messages, likes = (
+            baseline.tables[name] for name in
+            ['users', 'follows', 'messages', 'liked_messages'])
+
+        self.engine.execute(users.insert(), [
+            dict(id=1, email="a@test.com", username="alice", password="pw"),
+            dict(id=2, email="b@test.com", username="bob", password="pw"),
+        ])
+        self.engine.execute(messages.insert(), [
+            dict(id=i, text=f"warble {i}", timestamp=f"2020-01-0{i}",
+                 user_id=1)
+            for i in range(1, 4)
+        ])
+        self.engine.execute(follows.insert(), user_being_followed_id=1,
+                            user_following_id=2)
+        self.engine.execute(likes.insert(), user_id_like=2,
+                            message_id_liked=1)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_upgrade_from_baseline(self):
+        """Does upgrading give the models' schema, with data filled in?"""
+
+        upgrade()
+
+        with self.engine.connect() as conn:
+            context = MigrationContext.configure(conn)
+            diffs = [diff for diff in compare_metadata(context, db.metadata)
+                     # search.py's expression indexes aren't modeled
+                     if not (diff[0] == 'remove_index'
+                             and diff[1].name in ('ix_users_username_trgm',
+                                                  'ix_messages_text_fulltext'))]
+        self.assertEqual(diffs, [])
+
+        alice = self.engine.execute(
+            "SELECT messages_count, followers_count, version, deleted_at "
+            "FROM users WHERE id = 1").first()
+        self.assertEqual(tuple(alice), (3, 1, 1, None))
+
+        bob = self.engine.execute(
+            "SELECT following_count, likes_count FROM users WHERE id = 2"
+        ).first()
+        self.assertEqual(tuple(bob), (1, 1))
+
+        timeline = self.engine.execute(
+            "SELECT message_id FROM timeline_entries WHERE user_id = 2 "
+            "ORDER BY message_id").fetchall()
+        self.assertEqual([row[0] for row in timeline], [1, 2, 3])
+
+        indexes = {row[0] for row in self.engine.execute(
+            "SELECT indexname FROM pg_indexes")}
+        self.assertIn('ix_messages_text_fulltext', indexes)
+        self.assertIn('ix_messages_user_timestamp', indexes)
+        self.assertNotIn('ix_follows_user_following_id', indexes)
+
+        # Upgrading again changes nothing
+        upgrade()
+
+    def test_upgrade_after_create_all(self):
+        """Is upgrading a database made by create_all safe?"""
+
+        self.engine.execute("DROP SCHEMA public CASCADE")
+        self.engine.execute("CREATE SCHEMA public")
+        db.metadata.create_all(self.engine)
+
+        upgrade()
+
+        version = self.engine.execute(
+            "SELECT version_num FROM alembic_version").scalar()
+        self.assertEqual(version, 'c7a0621c77c6')
@@ -0,0 +1,184 @@
+"""Keyset pagination tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_pagination.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from pagination import (paginate, stream, keyset, StreamedPage,
+                        encode_cursor, decode_cursor)
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class PaginationTestCase(TestCase):
+    """Test cursor pagination over a user's messages."""
+
+    def setUp(self):
+        """Create a user with five messages, a minute apart."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+
+        start = datetime(2020, 1, 1)
+        db.session.add_all([
+            Message(text=f"warble {i}", user_id=user.id,
+                    timestamp=start + timedelta(minutes=i))
+            for i in range(5)
+        ])
+        db.session.commit()
+
+        self.user_id = user.id
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+
+    def page(self, **args):
+        with app.test_request_context(query_string=args):
+            return paginate(Message.query.filter_by(user_id=self.user_id),
+                            [Message.timestamp, Message.id],
+                            key=lambda msg: (msg.timestamp, msg.id),
+                            per_page=2)
+
+    def test_cursor_round_trip(self):
+        """Does a cursor decode back to the key it was made from?"""
+
+        key = [datetime(2020, 1, 1, 12, 30), 42]
+        cursor = encode_cursor(key)
+
+        with app.test_request_context():
+            self.assertEqual(
+                decode_cursor(cursor, [Message.timestamp, Message.id]), key)
+
+    def test_walk_older_and_newer(self):
+        """Can we walk down the list and back up it again?"""
+
+        first = self.page()
+        self.assertEqual([m.text for m in first], ["warble 4", "warble 3"])
+        self.assertFalse(first.has_prev)
+        self.assertTrue(first.has_next)
+
+        second = self.page(after=first.next_cursor)
+        self.assertEqual([m.text for m in second], ["warble 2", "warble 1"])
+        self.assertTrue(second.has_prev)
+
+        last = self.page(after=second.next_cursor)
+        self.assertEqual([m.text for m in last], ["warble 0"])
+        self.assertFalse(last.has_next)
+
+        back = self.page(before=last.prev_cursor)
+        self.assertEqual([m.text for m in back], ["warble 2", "warble 1"])
+
+        top = self.page(before=back.prev_cursor)
+        self.assertEqual([m.text for m in top], ["warble 4", "warble 3"])
+        self.assertFalse(top.has_prev)
+
+    def test_bad_cursor(self):
+        """Does a mangled cursor get a 400 rather than a 500?"""
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            resp = client.get(f"/users/{self.user_id}?after=not-a-cursor")
+            self.assertEqual(resp.status_code, 400)
+
+    def test_profile_links_to_older_messages(self):
+        """Does the profile page show one page and link to the next?"""
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            resp = client.get(f"/users/{self.user_id}?per_page=2")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("warble 4", html)
+            self.assertNotIn("warble 2", html)
+            self.assertIn("after=", html)
+
+    def streamed(self, batch_size, per_page, after=None):
+        """A StreamedPage of the messages, read `batch_size` at a time."""
+
+        columns = [Message.timestamp, Message.id]
+        query = keyset(Message.query.filter_by(user_id=self.user_id),
+                       columns, after, reverse=True)
+
+        return StreamedPage(query, lambda msg: (msg.timestamp, msg.id),
+                            after, per_page, batch_size=batch_size)
+
+    def test_streamed_walk(self):
+        """Do streamed pages match paginated ones across batch sizes?"""
+
+        with app.test_request_context():
+            for batch_size in (1, 2, 3, 10):
+                first = self.streamed(batch_size, per_page=3)
+                self.assertTrue(first)
+                self.assertEqual([m.text for m in first],
+                                 ["warble 4", "warble 3", "warble 2"])
+                self.assertFalse(first.has_prev)
+                self.assertTrue(first.has_next)
+
+                rest = self.streamed(batch_size, per_page=3,
+                                     after=first.next_cursor)
+                self.assertEqual([m.text for m in rest],
+                                 ["warble 1", "warble 0"])
+                self.assertTrue(rest.has_prev)
+                self.assertFalse(rest.has_next)
+
+    def test_streamed_batches(self):
+        """Is viewer state looked up once per batch, before it is shown?"""
+
+        batches = []
+
+        with app.test_request_context(query_string={'per_page': 4}):
+            page = stream(Message.query.filter_by(user_id=self.user_id),
+                          [Message.timestamp, Message.id],
+                          key=lambda msg: (msg.timestamp, msg.id),
+                          on_batch=batches.append)
+            texts = [m.text for m in page]
+
+        self.assertEqual(texts, [f"warble {i}" for i in (4, 3, 2, 1)])
+        self.assertEqual(len(batches), 1)
+        self.assertEqual([m.text for m in batches[0]], texts)
+
+    def test_streamed_list_page_consumes_flash(self):
+        """Is a flash shown on a streamed page cleared from the session?"""
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+                sess['_flashes'] = [('success', 'Hello!')]
+
+            resp = client.get("/users")
+            self.assertIn("Hello!", resp.get_data(as_text=True))
+
+            resp = client.get("/users")
+            self.assertNotIn("Hello!", resp.get_data(as_text=True))
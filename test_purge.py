@@ -0,0 +1,186 @@
+"""Account deletion tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_purge.py
+
+
+import os
+from unittest import TestCase
+
+from models import (db, User, Message, Follows, LikedMessage,
+                    TimelineEntry)
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import counters
+import purge
+import timeline
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class PurgeTestCase(TestCase):
+    """Test disabling and purging accounts."""
+
+    def setUp(self):
+        """Create a user and a friend who follow and like each other."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        user = User.signup(username="testuser", email="test@test.com",
+                           password="password", image_url=None)
+        friend = User(email="friend@test.com", username="friend",
+                      password="HASHED_PASSWORD")
+        db.session.add(friend)
+        db.session.flush()
+
+        messages = [Message(text=f"warble {i}", user_id=user.id)
+                    for i in range(5)]
+        friend_message = Message(text="hello", user_id=friend.id)
+        db.session.add_all([*messages, friend_message])
+        db.session.flush()
+
+        db.session.add_all([
+            Follows(user_being_followed_id=user.id,
+                    user_following_id=friend.id),
+            Follows(user_being_followed_id=friend.id,
+                    user_following_id=user.id),
+            LikedMessage(user_id_like=user.id,
+                         message_id_liked=friend_message.id),
+            *(LikedMessage(user_id_like=friend.id, message_id_liked=msg.id)
+              for msg in messages),
+        ])
+        db.session.flush()
+
+        self.user_id = user.id
+        self.friend_id = friend.id
+        self.message_ids = [msg.id for msg in messages]
+
+        with app.app_context():
+            counters.recount_all()
+            timeline.rebuild_all()
+            db.session.commit()
+
+        # Small batches, so every step takes several
+        app.config['ACCOUNT_PURGE_BATCH'] = 2
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        app.config['ACCOUNT_PURGE_BATCH'] = 1000
+        db.session.rollback()
+
+    def friend_counts(self):
+        db.session.expire_all()
+        friend = User.query.get(self.friend_id)
+        return (friend.messages_count, friend.following_count,
+                friend.followers_count, friend.likes_count)
+
+    def test_disabled_account_is_hidden(self):
+        """Is a disabled account locked out and hidden before it's purged?"""
+
+        with app.app_context():
+            purge.disable(self.user_id)
+            db.session.commit()
+
+        self.assertFalse(User.authenticate("testuser", "password"))
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+        resp = client.get("/messages/new")
+        self.assertEqual(resp.status_code, 302)
+
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.friend_id
+
+        self.assertEqual(client.get(f"/users/{self.user_id}").status_code,
+                         404)
+        self.assertEqual(
+            client.get(f"/messages/{self.message_ids[0]}").status_code, 404)
+
+        client.post(f"/users/stop-following/{self.user_id}")
+        client.post(f"/users/follow/{self.user_id}")
+        self.assertFalse(Follows.query.filter_by(
+            user_being_followed_id=self.user_id).count())
+
+    def test_disabled_account_is_not_listed(self):
+        """Are a disabled account and its messages left out of lists?"""
+
+        with app.app_context():
+            purge.disable(self.user_id)
+            db.session.commit()
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.friend_id
+
+        for path in ["/users/autocomplete?q=testuser",
+                     f"/users/{self.friend_id}/following",
+                     f"/users/{self.friend_id}/followers",
+                     "/messages/search?q=warble",
+                     f"/api/v1/users?ids={self.user_id}",
+                     f"/api/v1/users/{self.friend_id}/following",
+                     f"/api/v1/users/{self.friend_id}/followers"]:
+            resp = client.get(path)
+            self.assertEqual(resp.status_code, 200, path)
+            self.assertNotIn("testuser", resp.get_data(as_text=True), path)
+
+        for path in ["/", f"/users/{self.friend_id}/likes",
+                     "/api/v1/timeline",
+                     f"/api/v1/users/{self.friend_id}/likes",
+                     f"/api/v1/messages?ids={self.message_ids[0]}"]:
+            resp = client.get(path)
+            self.assertEqual(resp.status_code, 200, path)
+            self.assertNotRegex(resp.get_data(as_text=True), r"warble \d",
+                                path)
+
+        resp = client.get(f"/api/v1/messages/{self.message_ids[0]}")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_purge(self):
+        """Are all the account's rows removed, and others' counts fixed?"""
+
+        self.assertEqual(self.friend_counts(), (1, 1, 1, 5))
+
+        with app.app_context():
+            purge.disable(self.user_id)
+            db.session.commit()
+            self.assertEqual(purge.purge_pending(), 1)
+
+        self.assertIsNone(User.query.get(self.user_id))
+        self.assertEqual(Message.query.filter_by(user_id=self.user_id)
+                         .count(), 0)
+        self.assertEqual(LikedMessage.query.count(), 0)
+        self.assertEqual(Follows.query.count(), 0)
+        self.assertEqual(TimelineEntry.query.count(), 0)
+        self.assertEqual(self.friend_counts(), (1, 0, 0, 0))
+
+    def test_delete_route(self):
+        """Does deleting an account log out and purge in the background?"""
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            resp = client.post("/users/delete")
+            self.assertEqual(resp.location, "http://localhost/signup")
+
+        purge.purger.wait()
+
+        self.assertIsNone(User.query.get(self.user_id))
+        self.assertEqual(self.friend_counts(), (1, 0, 0, 0))
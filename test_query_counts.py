@@ -0,0 +1,117 @@
+"""Query count tests for list routes."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_query_counts.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, LikedMessage
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from query_counter import QueryCounter, QueryCountAssertions
+import timeline
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+# Most queries any list route should need, however long the list is
+MAX_QUERIES = 12
+
+
+class QueryCountTestCase(QueryCountAssertions, TestCase):
+    """Test that list routes don't run a query per row."""
+
+    def setUp(self):
+        """Create a reader who follows and likes nobody yet."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        reader = User(email="reader@test.com", username="reader",
+                      password="HASHED_PASSWORD")
+        db.session.add(reader)
+        db.session.commit()
+
+        self.reader_id = reader.id
+        self.num_authors = 0
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+
+    def add_authors(self, count):
+        """Add `count` authors the reader follows, each with a liked message."""
+
+        for _ in range(count):
+            self.num_authors += 1
+            author = User(email=f"author{self.num_authors}@test.com",
+                          username=f"author{self.num_authors}",
+                          password="HASHED_PASSWORD")
+            db.session.add(author)
+            db.session.flush()
+
+            message = Message(text="warble", user_id=author.id)
+            db.session.add(message)
+            db.session.flush()
+
+            db.session.add_all([
+                Follows(user_being_followed_id=author.id,
+                        user_following_id=self.reader_id),
+                LikedMessage(user_id_like=self.reader_id,
+                             message_id_liked=message.id),
+            ])
+
+        db.session.flush()
+        with app.app_context():
+            timeline.rebuild_all()
+            db.session.commit()
+
+    def count_queries(self, url):
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.reader_id
+
+            with QueryCounter(db.engine) as counter:
+                resp = client.get(url)
+
+        self.assertEqual(resp.status_code, 200)
+        return counter.count
+
+    def assertFlatQueryCount(self, url):
+        """Does `url` run the same, small number of queries for 2 or 10 rows?"""
+
+        self.add_authors(2)
+        few = self.count_queries(url.format(reader=self.reader_id))
+
+        self.add_authors(8)
+        with self.assertMaxQueries(MAX_QUERIES, db.engine):
+            many = self.count_queries(url.format(reader=self.reader_id))
+
+        self.assertEqual(few, many)
+
+    def test_homepage(self):
+        self.assertFlatQueryCount("/")
+
+    def test_likes(self):
+        self.assertFlatQueryCount("/users/{reader}/likes")
+
+    def test_following(self):
+        self.assertFlatQueryCount("/users/{reader}/following")
+
+    def test_users(self):
+        self.assertFlatQueryCount("/users")
@@ -0,0 +1,119 @@
+"""Read replica routing tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_replicas.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+# A second database standing in for a replica; it isn't kept in sync, so
+# which one a request read from shows in what it sees
+REPLICA_URL = "postgresql:///warbler-test-replica"
+
+
+def create_database(url):
+    url = make_url(url)
+    admin_url = make_url(str(url))
+    admin_url.database = 'postgres'
+
+    admin = create_engine(admin_url, isolation_level='AUTOCOMMIT')
+    exists = admin.execute("SELECT 1 FROM pg_database WHERE datname = %s",
+                           (url.database,)).scalar()
+    if not exists:
+        admin.execute(f'CREATE DATABASE "{url.database}"')
+    admin.dispose()
+
+
+class ReplicaTestCase(TestCase):
+    """Test which database requests read from."""
+
+    @classmethod
+    def setUpClass(cls):
+        create_database(REPLICA_URL)
+
+        app.config['SQLALCHEMY_BINDS'] = {'replica_test': REPLICA_URL}
+        app.config['SQLALCHEMY_REPLICAS'] = ['replica_test']
+        db.Model.metadata.create_all(db.get_engine(app, 'replica_test'))
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config['SQLALCHEMY_REPLICAS'] = []
+        app.config['SQLALCHEMY_BINDS'] = {}
+
+    def setUp(self):
+        """Create the same user in both, with a different bio in each."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD", bio="primary")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        replica = db.get_engine(app, 'replica_test')
+        replica.execute(Message.__table__.delete())
+        replica.execute(User.__table__.delete())
+        replica.execute(User.__table__.insert(), id=user.id,
+                        email="test@test.com", username="testuser",
+                        password="HASHED_PASSWORD", bio="replica",
+                        image_url="", header_image_url="")
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+        self.sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+
+    def tearDown(self):
+        app.config['REPLICA_STICKY_SECONDS'] = self.sticky_seconds
+        db.session.rollback()
+
+    def bio(self):
+        resp = self.client.get(f"/api/v1/users/{self.user_id}")
+        return resp.get_json()['data']['bio']
+
+    def test_reads_go_to_replica(self):
+        """Do GET requests read from the replica, and writes go to primary?"""
+
+        self.assertEqual(self.bio(), "replica")
+
+        with app.app_context():
+            self.assertEqual(User.query.get(self.user_id).bio, "primary")
+
+    def test_read_your_writes(self):
+        """Does a user read from the primary just after writing?"""
+
+        resp = self.client.post("/messages/new", data={"text": "Hello"})
+        self.assertEqual(resp.status_code, 302)
+
+        self.assertEqual(Message.query.filter_by(user_id=self.user_id)
+                         .one().text, "Hello")
+        self.assertEqual(self.bio(), "primary")
+
+        app.config['REPLICA_STICKY_SECONDS'] = 0
+        self.assertEqual(self.bio(), "replica")
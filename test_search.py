@@ -0,0 +1,221 @@
+"""Username search tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_search.py
+
+
+import os
+from unittest import TestCase
+
+from datetime import datetime, timedelta
+
+from models import db, User, Message, MessageTerm
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import search
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+USERNAMES = ["bob", "bobby", "bobcat", "jimbob", "alice", "Bobbette"]
+
+
+class UserSearchTestCase(TestCase):
+    """Test ranked username search on both backends."""
+
+    def setUp(self):
+        """Create some users with overlapping names."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        db.session.add_all([
+            User(email=f"{name}@test.com", username=name,
+                 password="HASHED_PASSWORD")
+            for name in USERNAMES
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+        app.config.pop('USERNAME_SEARCH_BACKEND', None)
+
+    def search(self, term, backend, **args):
+        app.config['USERNAME_SEARCH_BACKEND'] = backend
+        with app.test_request_context(query_string=args):
+            return search.search_users(term, per_page=args.get('per_page'))
+
+    def check_backend(self, backend):
+        page = self.search("bob", backend)
+        self.assertEqual([user.username for user in page],
+                         ["bob", "Bobbette", "bobby", "bobcat", "jimbob"])
+
+        first = self.search("bob", backend, per_page=2)
+        self.assertEqual([user.username for user in first],
+                         ["bob", "Bobbette"])
+
+        second = self.search("bob", backend, per_page=2,
+                             after=first.next_cursor)
+        self.assertEqual([user.username for user in second],
+                         ["bobby", "bobcat"])
+
+        back = self.search("bob", backend, per_page=2,
+                           before=second.prev_cursor)
+        self.assertEqual([user.username for user in back],
+                         ["bob", "Bobbette"])
+
+        self.assertEqual(len(self.search("bo%", backend)), 0)
+
+    def test_database_backend(self):
+        """Does the SQL search rank exact, prefix, then substring matches?"""
+
+        self.check_backend('database')
+
+    def test_memory_backend(self):
+        """Does the in-process index give the same results?"""
+
+        self.check_backend('memory')
+
+    def test_memory_backend_sees_renames(self):
+        """Does a reindexed rename show up in in-process results?"""
+
+        user = User.query.filter_by(username="alice").one()
+        user.username = "alicebob"
+        db.session.commit()
+        search.reindex_user(user)
+
+        page = self.search("bob", 'memory')
+        self.assertIn("alicebob", [u.username for u in page])
+        self.assertEqual(len(self.search("alice", 'memory')), 1)
+
+    def test_autocomplete(self):
+        """Does the autocomplete endpoint return the best matches as JSON?"""
+
+        with app.test_client() as client:
+            resp = client.get("/users/autocomplete?q=bob&limit=2")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([user['username'] for user in resp.json['users']],
+                         ["bob", "Bobbette"])
+
+
+class MessageSearchTestCase(TestCase):
+    """Test full-text message search on both backends."""
+
+    def setUp(self):
+        """Create a user to post messages."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+
+        self.user_id = user.id
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+        app.config.pop('MESSAGE_SEARCH_BACKEND', None)
+
+    def post(self, backend, *texts):
+        """Post `texts` through the route, oldest first."""
+
+        app.config['MESSAGE_SEARCH_BACKEND'] = backend
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            for text in texts:
+                client.post("/messages/new", data={"text": text})
+
+        # Space them out so "recent" order is well defined.
+        start = datetime(2020, 1, 1)
+        for i, msg in enumerate(Message.query.order_by(Message.id)):
+            msg.timestamp = start + timedelta(minutes=i)
+        db.session.commit()
+
+    def search(self, text, order='recent', **args):
+        with app.test_request_context(query_string=args):
+            return search.search_messages(text, order)
+
+    def check_backend(self, backend):
+        self.post(backend,
+                  "Warbling about birds",
+                  "Birds birds birds all day",
+                  "Nothing to see here",
+                  "More BIRDS and a warble")
+
+        recent = self.search("birds")
+        self.assertEqual([m.text for m in recent], [
+            "More BIRDS and a warble",
+            "Birds birds birds all day",
+            "Warbling about birds",
+        ])
+
+        relevant = self.search("birds", order='relevant')
+        self.assertEqual(relevant.items[0].text, "Birds birds birds all day")
+
+        both = self.search("day birds")
+        self.assertEqual([m.text for m in both],
+                         ["Birds birds birds all day"])
+
+        first = self.search("birds", per_page=2)
+        second = self.search("birds", per_page=2, after=first.next_cursor)
+        self.assertEqual([m.text for m in second], ["Warbling about birds"])
+
+    def test_fulltext_backend(self):
+        """Does Postgres full-text search find and order matches?"""
+
+        self.check_backend('database')
+        self.assertEqual(MessageTerm.query.count(), 0)
+
+    def test_postings_backend(self):
+        """Does the postings table give the same results?"""
+
+        self.check_backend('postings')
+
+    def test_postings_follow_deletes(self):
+        """Are a deleted message's postings removed with it?"""
+
+        self.post('postings', "Birds of a feather")
+        msg = Message.query.one()
+        self.assertEqual(MessageTerm.query.count(), 2)
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+            client.post(f"/messages/{msg.id}/delete")
+
+        self.assertEqual(MessageTerm.query.count(), 0)
+        self.assertEqual(len(self.search("birds")), 0)
+
+    def test_search_page(self):
+        """Does the search page render results?"""
+
+        self.post('postings', "Birds of a feather")
+
+        with app.test_client() as client:
+            resp = client.get("/messages/search?q=feather&order=relevant")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("Birds of a feather", resp.get_data(as_text=True))
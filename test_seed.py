@@ -0,0 +1,116 @@
+"""CSV loader tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_seed.py
+
+
+import os
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import TestCase
+
+from models import db, User, Message, Follows, TimelineEntry, MessageTerm
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app
+import seed
+
+db.create_all()
+
+USERS = """email,username,image_url,password,bio,header_image_url,location
+a@test.com,alice,,HASHED_PASSWORD,,,
+b@test.com,bob,,HASHED_PASSWORD,Hi,,Here
+c@test.com,carol,,HASHED_PASSWORD,,,
+"""
+
+MESSAGES = """text,timestamp,user_id
+"warble, warble",2017-01-21 11:04:53.522807,1
+hello,2017-01-22 11:04:53.522807,2
+"""
+
+FOLLOWS = """user_being_followed_id,user_following_id
+1,2
+1,3
+"""
+
+
+class SeedTestCase(TestCase):
+    """Test loading CSVs in batches."""
+
+    def setUp(self):
+        db.session.rollback()
+
+        self.data = tempfile.TemporaryDirectory()
+        for name, rows in [('users.csv', USERS), ('messages.csv', MESSAGES),
+                           ('follows.csv', FOLLOWS)]:
+            with open(os.path.join(self.data.name, name), 'w') as csv_file:
+                csv_file.write(rows)
+
+    def tearDown(self):
+        self.data.cleanup()
+        db.session.rollback()
+
+    def load(self, **options):
+        with app.app_context(), redirect_stdout(StringIO()) as output:
+            seed.load(self.data.name, batch_size=2, **options)
+            db.session.commit()
+
+        return output.getvalue()
+
+    def test_load_and_append(self):
+        """Are rows loaded in batches, and duplicates skipped on append?"""
+
+        output = self.load()
+        self.assertIn("users.csv: 3 rows", output)
+
+        alice = User.query.filter_by(username="alice").one()
+        self.assertEqual(alice.followers_count, 2)
+        self.assertEqual(alice.bio, "")
+        self.assertEqual(Message.query.filter_by(user_id=alice.id).one().text,
+                         "warble, warble")
+
+        output = self.load(append=True)
+        self.assertIn("users.csv: 0 rows, 3 skipped", output)
+        self.assertEqual(User.query.count(), 3)
+        self.assertEqual(Message.query.count(), 4)
+        self.assertEqual(Follows.query.count(), 2)
+
+        # The id sequence has moved past the loaded ids
+        db.session.add(User(email="d@test.com", username="dave",
+                            password="HASHED_PASSWORD"))
+        db.session.commit()
+
+    def test_append_only_adds_new_messages(self):
+        """Does an append fan out and index just the messages it adds?"""
+
+        app.config['MESSAGE_SEARCH_BACKEND'] = 'postings'
+        try:
+            self.load()
+            first_id = Message.query.order_by(Message.id).first().id
+
+            # Left alone by an append, as a rebuild would restore it
+            TimelineEntry.query.filter_by(message_id=first_id).delete()
+            db.session.commit()
+
+            self.load(append=True)
+        finally:
+            app.config.pop('MESSAGE_SEARCH_BACKEND', None)
+
+        self.assertEqual(
+            TimelineEntry.query.filter_by(message_id=first_id).count(), 0)
+        self.assertEqual(
+            TimelineEntry.query.filter(TimelineEntry.message_id > first_id,
+                                       TimelineEntry.author_id == 1).count(),
+            2)
+        self.assertEqual(
+            MessageTerm.query.filter_by(term="warble").count(), 2)
@@ -0,0 +1,128 @@
+"""Per-request SQL statistics tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_sqlstats.py
+
+
+import json
+import os
+import re
+from unittest import TestCase
+
+from models import db, User, Message
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from sqlstats import QueryBudgetExceeded, RequestStats
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class SQLStatsTestCase(TestCase):
+    """Test counting, reporting and limiting a request's SQL."""
+
+    def setUp(self):
+        """Create a user with a message."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.flush()
+
+        db.session.add(Message(text="warble", user_id=user.id))
+        db.session.commit()
+
+        self.user_id = user.id
+        self.client = app.test_client()
+        self.config = {key: app.config[key] for key in
+                       ['SQL_STRICT', 'SQL_QUERY_BUDGET', 'SQL_REPEAT_LIMIT',
+                        'PROPAGATE_EXCEPTIONS']}
+
+    def tearDown(self):
+        """Put the limits back."""
+
+        app.config.update(self.config)
+        db.session.rollback()
+
+    def login(self):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+    def test_server_timing(self):
+        """Does the response say how many queries it ran, and log them?"""
+
+        self.login()
+
+        with self.assertLogs('warbler.sql', 'INFO') as logs:
+            resp = self.client.get(f"/users/{self.user_id}")
+
+        self.assertEqual(resp.status_code, 200)
+        timing = resp.headers['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", '
+                                 r'app;dur=[\d.]+$')
+        db_ms = float(re.match(r'db;dur=([\d.]+)', timing).group(1))
+        self.assertGreater(db_ms, 0)
+
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['endpoint'], 'users_show')
+        self.assertEqual(line['status'], 200)
+        self.assertIn(f'"{line["queries"]} queries"', timing)
+        self.assertGreater(line['queries'], 0)
+
+    def test_repeats_logged(self):
+        """Is a request repeating a statement logged as a warning?"""
+
+        self.login()
+        app.config['SQL_REPEAT_LIMIT'] = 0
+
+        with self.assertLogs('warbler.sql', 'WARNING') as logs:
+            self.client.get(f"/users/{self.user_id}")
+
+        self.assertTrue(json.loads(logs.records[-1].getMessage())['repeated'])
+
+    def test_strict_budget(self):
+        """Does strict mode stop a request going over its query budget?"""
+
+        self.login()
+        app.config['SQL_STRICT'] = True
+        app.config['SQL_QUERY_BUDGET'] = 1
+        app.config['PROPAGATE_EXCEPTIONS'] = True
+
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(f"/users/{self.user_id}")
+
+        app.config['SQL_QUERY_BUDGET'] = 100
+        resp = self.client.get(f"/users/{self.user_id}")
+        self.assertEqual(resp.status_code, 200)
+
+    def test_strict_repeats(self):
+        """Does strict mode stop the same statement running too often?"""
+
+        stats = RequestStats(budget=None, repeat_limit=2, strict=True)
+        stats.record("SELECT 1")
+        stats.record("SELECT 2")
+        stats.record("SELECT 1")
+
+        with self.assertRaisesRegex(QueryBudgetExceeded, "3 times"):
+            stats.record("SELECT 1")
+
+        # Views can lift the limit
+        stats = RequestStats(budget=None, repeat_limit=None, strict=True)
+        for _ in range(10):
+            stats.record("SELECT 1")
+        self.assertEqual(stats.repeated(), [])
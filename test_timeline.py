@@ -0,0 +1,140 @@
+"""Home timeline tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_timeline.py
+
+
+import os
+from datetime import datetime
+from unittest import TestCase
+
+from models import db, User, Message, Follows, TimelineEntry
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import timeline
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class TimelineTestCase(TestCase):
+    """Test fan-out of messages into home timelines."""
+
+    def setUp(self):
+        """Create a reader who follows an author."""
+
+        db.session.rollback()
+        User.query.delete()
+        Message.query.delete()
+
+        self.client = app.test_client()
+
+        reader = User(email="reader@test.com", username="reader",
+                      password="HASHED_PASSWORD")
+        author = User(email="author@test.com", username="author",
+                      password="HASHED_PASSWORD")
+        db.session.add_all([reader, author])
+        db.session.commit()
+
+        self.reader_id = reader.id
+        self.author_id = author.id
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        db.session.rollback()
+        app.config['TIMELINE_FANOUT_LIMIT'] = 10000
+
+    def login(self, client, user_id):
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def test_new_message_fans_out(self):
+        """Does a follower's timeline get the author's new message?"""
+
+        with app.test_client() as client:
+            self.login(client, self.reader_id)
+            client.post(f"/users/follow/{self.author_id}")
+
+            self.login(client, self.author_id)
+            client.post("/messages/new", data={"text": "Fresh warble"})
+
+            entry = TimelineEntry.query.one()
+            self.assertEqual(entry.user_id, self.reader_id)
+            self.assertEqual(entry.author_id, self.author_id)
+
+            self.login(client, self.reader_id)
+            html = client.get("/").get_data(as_text=True)
+            self.assertIn("Fresh warble", html)
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Do follows copy old messages in, and unfollows take them out?"""
+
+        db.session.add(Message(text="Old warble", user_id=self.author_id))
+        db.session.commit()
+
+        with app.test_client() as client:
+            self.login(client, self.reader_id)
+
+            client.post(f"/users/follow/{self.author_id}")
+            self.assertEqual(
+                TimelineEntry.query.filter_by(user_id=self.reader_id).count(),
+                1)
+            self.assertIn("Old warble", client.get("/").get_data(as_text=True))
+
+            client.post(f"/users/stop-following/{self.author_id}")
+            self.assertEqual(TimelineEntry.query.count(), 0)
+            self.assertNotIn("Old warble",
+                             client.get("/").get_data(as_text=True))
+
+    def test_popular_author_is_read_merged(self):
+        """Are messages by fan-out-on-read authors merged in at read time?"""
+
+        app.config['TIMELINE_FANOUT_LIMIT'] = 1
+
+        with app.test_client() as client:
+            self.login(client, self.reader_id)
+            client.post(f"/users/follow/{self.author_id}")
+            self.assertTrue(User.query.get(self.author_id).fanout_on_read)
+
+            self.login(client, self.author_id)
+            client.post("/messages/new", data={"text": "Famous warble"})
+            self.assertEqual(TimelineEntry.query.count(), 0)
+
+            with app.test_request_context():
+                page = timeline.home_page(self.reader_id)
+            self.assertEqual([m.text for m in page], ["Famous warble"])
+
+    def test_rebuild_keeps_newest_per_author(self):
+        """Does a rebuild copy only each author's newest messages?"""
+
+        db.session.add(Follows(user_being_followed_id=self.author_id,
+                               user_following_id=self.reader_id))
+        db.session.add_all([Message(text=f"warble {i}", user_id=self.author_id,
+                                    timestamp=datetime(2020, 1, i + 1))
+                            for i in range(5)])
+        db.session.commit()
+
+        app.config['TIMELINE_BACKFILL_LIMIT'] = 3
+        try:
+            with app.app_context():
+                timeline.rebuild_all()
+                db.session.commit()
+        finally:
+            app.config['TIMELINE_BACKFILL_LIMIT'] = 800
+
+        with app.test_request_context():
+            page = timeline.home_page(self.reader_id)
+        self.assertEqual([m.text for m in page],
+                         ["warble 4", "warble 3", "warble 2"])
@@ -21,6 +21,7 @@ os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
 # Now we can import app
 
 from app import app
+from passwords import hasher
 
 # Create our tables (we do this here, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
@@ -120,6 +121,15 @@ class UserModelTestCase(TestCase):
         self.assertFalse(User.is_followed_by(self.user, self.user1))
         self.assertFalse(User.is_followed_by(self.user, self.user2))
 
+    def test_followed_ids(self):
+        """Does followed_ids return only the followed subset?"""
+
+        ids = [self.user1.id, self.user2.id]
+
+        self.assertEqual(self.user.followed_ids(ids), {self.user1.id})
+        self.assertEqual(self.user1.followed_ids(ids), set())
+        self.assertEqual(self.user.followed_ids([]), set())
+
     def test_signup(self):
         """Does test_signup method work?"""
 
@@ -155,4 +165,30 @@ class UserModelTestCase(TestCase):
 
         # Invalid username
         self.assertFalse(User.authenticate(username='frank123', 
-                                    password='HASHED_PASSWORD'))
\ No newline at end of file
+                                    password='HASHED_PASSWORD'))
+
+    def test_authenticate_rehashes_old_cost(self):
+        '''Is a password hashed at an old cost rehashed on login?'''
+
+        log_rounds = hasher.log_rounds
+        hasher.log_rounds = 4
+
+        try:
+            user = User.authenticate(username='testuser',
+                                     password='HASHED_PASSWORD')
+            self.assertTrue(user.password.startswith('$2b$04$'))
+            self.assertFalse(hasher.needs_rehash(user.password))
+
+            # Still logs in with the upgraded hash
+            self.assertEqual(User.authenticate(username='testuser',
+                                               password='HASHED_PASSWORD'),
+                             self.user)
+        finally:
+            hasher.log_rounds = log_rounds
+
+    def test_is_available(self):
+        '''Does User.is_available spot a taken username or email?'''
+
+        self.assertTrue(User.is_available('newuser', 'new@test.com'))
+        self.assertFalse(User.is_available('testuser', 'new@test.com'))
+        self.assertFalse(User.is_available('newuser', 'test@test.com'))
@@ -133,6 +133,21 @@ class UserViewTestCase(TestCase):
 
 
 
+    def test_signup_taken_username(self):
+        """Is a taken username turned away (without adding a user)?"""
+
+        with app.test_client() as client:
+            resp = client.post("/signup",
+                               data={"username": "testuser",
+                                     "email": "other@test.com",
+                                     "password": "password"},
+                               follow_redirects=True)
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("Username already taken", html)
+            self.assertEqual(User.query.count(), 2)
+
     # def test_add_message(self):
     #     """Can use add a message?"""
 
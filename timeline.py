@@ -0,0 +1,241 @@
+"""Precomputed home timelines (fan-out on write).
+
+Every new message is copied into a `timeline_entries` row for each
+follower of its author, so a user's homepage is a single indexed range
+read instead of an IN-query over everyone they follow.
+
+Accounts with at least TIMELINE_FANOUT_LIMIT followers are flagged
+`fanout_on_read`: their messages are not copied on write (one post would
+otherwise turn into millions of inserts) and are merged into the
+timeline when it is read.
+"""
+
+from flask import current_app
+
+from models import db, User, Message, Follows, TimelineEntry
+import pagination
+
+TIMELINE_COLUMNS = ['user_id', 'message_id', 'author_id', 'timestamp']
+
+
+def fan_out_message(message):
+    """Copy a new message into the timelines of its author's followers."""
+
+    author = User.query.get(message.user_id)
+    if author.fanout_on_read:
+        return
+
+    followers = (db.select([
+        Follows.user_following_id,
+        db.literal(message.id),
+        db.literal(message.user_id),
+        db.literal(message.timestamp, db.DateTime),
+    ]).where(Follows.user_being_followed_id == message.user_id))
+
+    db.session.execute(
+        TimelineEntry.__table__.insert().from_select(
+            TIMELINE_COLUMNS, followers))
+
+
+def backfill(follower_id, followed_ids):
+    """Add the recent messages of newly followed users to a timeline.
+
+    Copies the newest TIMELINE_BACKFILL_LIMIT messages across all of
+    `followed_ids`, in one INSERT ... SELECT. That bounds a bulk follow of
+    thousands of accounts to the same cost as following one busy account;
+    their older messages are left out of the timeline.
+    """
+
+    if isinstance(followed_ids, int):
+        followed_ids = [followed_ids]
+
+    if not followed_ids:
+        return
+
+    recent = (db.select([
+        db.literal(follower_id),
+        Message.id,
+        Message.user_id,
+        Message.timestamp,
+    ])
+        .select_from(Message.__table__
+                     .join(User.__table__, User.id == Message.user_id))
+        .where(Message.user_id.in_(followed_ids))
+        .where(User.fanout_on_read.is_(False))
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(current_app.config['TIMELINE_BACKFILL_LIMIT']))
+
+    db.session.execute(
+        TimelineEntry.__table__.insert().from_select(
+            TIMELINE_COLUMNS, recent))
+
+
+def prune(follower_id, followed_ids):
+    """Remove unfollowed users' messages from a timeline."""
+
+    if isinstance(followed_ids, int):
+        followed_ids = [followed_ids]
+
+    if not followed_ids:
+        return
+
+    (TimelineEntry
+        .query
+        .filter(TimelineEntry.user_id == follower_id,
+                TimelineEntry.author_id.in_(followed_ids))
+        .delete(synchronize_session=False))
+
+
+def update_fanout_mode(user_ids):
+    """Switch users to fan-out on read once they have enough followers."""
+
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+
+    if not user_ids:
+        return
+
+    limit = current_app.config['TIMELINE_FANOUT_LIMIT']
+
+    (User
+        .query
+        .filter(User.id.in_(user_ids),
+                User.fanout_on_read.is_(False),
+                User.followers_count >= limit)
+        .update({User.fanout_on_read: True}, synchronize_session=False))
+
+
+def home_page(user_id, columns=None):
+    """The page of `user_id`'s home timeline that the request asks for.
+
+    Holds Message objects, or just the given Message `columns` (which
+    must include `id` and `timestamp`).
+    """
+
+    after, before, per_page = pagination.page_args()
+    select = columns or [Message]
+
+    # Authors disabled and awaiting purge are left out of both queries
+    fanned_out = (db.session
+                  .query(*select)
+                  .join(TimelineEntry, TimelineEntry.message_id == Message.id)
+                  .join(User, User.id == TimelineEntry.author_id)
+                  .filter(TimelineEntry.user_id == user_id,
+                          User.deleted_at.is_(None)))
+
+    messages, more = pagination.fetch(
+        fanned_out,
+        [TimelineEntry.timestamp, TimelineEntry.message_id],
+        after, before, per_page)
+
+    popular_ids = (db.session
+                   .query(Follows.user_being_followed_id)
+                   .join(User, User.id == Follows.user_being_followed_id)
+                   .filter(Follows.user_following_id == user_id,
+                           User.fanout_on_read.is_(True),
+                           User.deleted_at.is_(None)))
+
+    popular_messages, more_popular = pagination.fetch(
+        db.session.query(*select).filter(Message.user_id.in_(popular_ids)),
+        [Message.timestamp, Message.id],
+        after, before, per_page)
+
+    if popular_messages:
+        # Messages posted before their author became popular were fanned
+        # out and are found by both queries.
+        merged = {msg.id: msg for msg in messages + popular_messages}
+        merged = sorted(merged.values(), key=message_key, reverse=True)
+
+        more = more or more_popular or len(merged) > per_page
+        backwards = before is not None and after is None
+        messages = merged[-per_page:] if backwards else merged[:per_page]
+
+    return pagination.build_page(messages, more, message_key, after, before)
+
+
+def message_key(msg):
+    """Sort key of a timeline message (newer messages sort higher)."""
+
+    return (msg.timestamp, msg.id)
+
+
+def rebuild_all():
+    """Recompute every fan-out flag and timeline from follows and messages.
+
+    Used after bulk loads (see seed.py), which bypass the write path.
+    Copies each author's newest TIMELINE_BACKFILL_LIMIT messages at most.
+    """
+
+    limit = current_app.config['TIMELINE_FANOUT_LIMIT']
+    follower_count = (db.select([db.func.count()])
+                      .where(Follows.user_being_followed_id == User.id)
+                      .as_scalar())
+
+    User.query.update({User.fanout_on_read: follower_count >= limit},
+                      synchronize_session=False)
+    TimelineEntry.query.delete(synchronize_session=False)
+
+    ranked = (db.select([
+        Message.id,
+        Message.user_id,
+        Message.timestamp,
+        db.func.row_number().over(
+            partition_by=Message.user_id,
+            order_by=(Message.timestamp.desc(), Message.id.desc()),
+        ).label('rank'),
+    ])
+        .select_from(Message.__table__
+                     .join(User.__table__, User.id == Message.user_id))
+        .where(User.fanout_on_read.is_(False))
+        .alias('ranked'))
+
+    entries = (db.select([
+        Follows.user_following_id,
+        ranked.c.id,
+        ranked.c.user_id,
+        ranked.c.timestamp,
+    ])
+        .select_from(ranked.join(
+            Follows.__table__,
+            Follows.user_being_followed_id == ranked.c.user_id))
+        .where(ranked.c.rank
+               <= current_app.config['TIMELINE_BACKFILL_LIMIT']))
+
+    db.session.execute(
+        TimelineEntry.__table__.insert().from_select(
+            TIMELINE_COLUMNS, entries))
+
+
+def fan_out_messages_after(message_id):
+    """Copy the messages with ids above `message_id` into timelines.
+
+    Used after appending bulk loads (see seed.py) instead of
+    `rebuild_all`, so only the new rows are fanned out. Authors whose
+    (recounted) followers now reach TIMELINE_FANOUT_LIMIT switch to
+    fan-out on read first, as `update_fanout_mode` does on the write path.
+    """
+
+    limit = current_app.config['TIMELINE_FANOUT_LIMIT']
+
+    (User
+        .query
+        .filter(User.fanout_on_read.is_(False),
+                User.followers_count >= limit)
+        .update({User.fanout_on_read: True}, synchronize_session=False))
+
+    entries = (db.select([
+        Follows.user_following_id,
+        Message.id,
+        Message.user_id,
+        Message.timestamp,
+    ])
+        .select_from(Message.__table__
+                     .join(User.__table__, User.id == Message.user_id)
+                     .join(Follows.__table__,
+                           Follows.user_being_followed_id == Message.user_id))
+        .where(Message.id > message_id)
+        .where(User.fanout_on_read.is_(False)))
+
+    db.session.execute(
+        TimelineEntry.__table__.insert().from_select(
+            TIMELINE_COLUMNS, entries))